@@ -0,0 +1,636 @@
+"""
+UQAM - Winter 2018 - INF5071 - Group 20 - mesh.py
+
+This module contains the tools used to validate and shrink triangle meshes,
+whether generated by spheroide.py or loaded from a wavefront (.obj) file.
+The meshes are handled as flat buffers : a list of vertex coordinates
+(x0, y0, z0, x1, y1, z1, ...) and a list of vertex indices, three per
+triangle, starting at 0.
+
+Used as a program, it displays a report on the topology of a wavefront
+file and, if an output file is given, writes the mesh obtained by welding
+the vertices closer than TOLERANCE (0.001 by default) along each axis. With
+the option "--normals", the output file also holds the vertex normals,
+computed from the welded triangles. With the option "--compact", the pairs
+of triangles forming quadrilaterals are written as single faces and the 
+coordinates are rounded to 6 significant digits. Files whose name ends with
+".gz" are read and written compressed with gzip.
+
+    $ python mesh.py [--tolerance=TOLERANCE] [--normals] [--compact] 
+                     INPUT_FILE [OUTPUT_FILE]
+
+    INPUT_FILE     The wavefront file to verify.
+    OUTPUT_FILE    The wavefront file to produce.
+
+author : Alexis Chretien (CHRA25049209)
+"""
+import gzip
+import io
+import sys
+from array import array
+from math import floor, sqrt
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+ERR_NB_PARAMS = "Error : invalid number of parameters."
+ERR_INVALID_FILENAME = "Error : invalid filename"
+ERR_INVALID_OPTION = "Error : \"{}\" is not a valid option."
+ERR_INVALID_TOLERANCE = "Error : the tolerance must be a number strictly " \
+                      + "greater than 0."
+MSG_WELD = "{} vertices welded into {}, {} degenerate triangles removed."
+MSG_TOPOLOGY = "{} edges : {} boundary, {} non-manifold, {} with inconsistent " \
+             + "orientation. The mesh is {}watertight."
+
+WELD_TOLERANCE = 0.001
+OBJ_PRECISION = 6
+
+class VertexWelder(object):
+    """ Class welding vertices closer than a tolerance, as they are added.
+
+    The vertices are stored in a hash grid of cells as large as the
+    tolerance, so that finding a close vertex only requires looking in the
+    27 cells surrounding the new vertex. Adding n vertices takes linear time.
+
+    Attributes:
+        tolerance (float): The maximal difference along each axis between two
+                           welded vertices.
+        positions (list of float): The coordinates of the welded vertices.
+        cells (dict): The indices of the welded vertices in each cell of the
+                      grid.
+    """
+    def __init__(self, tolerance=WELD_TOLERANCE):
+        """ Creates an instance of vertex welder.
+
+        >>> welder = VertexWelder(0.01)
+        """
+        self.tolerance = tolerance
+        self.positions = []
+        self.cells = {}
+
+    def add(self, x, y, z):
+        """ Adds a vertex and returns the index of the welded vertex.
+
+        Args:
+            x, y, z (float): The coordinates of the vertex.
+
+        Returns:
+            int: The index of the welded vertex, which is either the index of
+                 a vertex close to (x, y, z) or a new index.
+
+        >>> welder = VertexWelder(0.01)
+        >>> welder.add(0.0, 0.0, 1.0), welder.add(1.0, 0.0, 0.0)
+        (0, 1)
+        >>> welder.add(0.0, 0.001, 1.0)
+        0
+        """
+        t = self.tolerance
+        p = self.positions
+        cx = int(floor(x / t))
+        cy = int(floor(y / t))
+        cz = int(floor(z / t))
+
+        for i in (cx - 1, cx, cx + 1):
+            for j in (cy - 1, cy, cy + 1):
+                for k in (cz - 1, cz, cz + 1):
+                    for n in self.cells.get((i, j, k), ()):
+                        if (abs(p[3*n] - x) < t and abs(p[3*n+1] - y) < t and \
+                                abs(p[3*n+2] - z) < t):
+                            return n
+
+        n = len(p) // 3
+        p.extend((x, y, z))
+        self.cells.setdefault((cx, cy, cz), []).append(n)
+
+        return n
+
+class ManifoldChecker(object):
+    """ Class verifying the topology of a triangle mesh, as its faces are
+    added.
+
+    A mesh is watertight when each of its edges is shared by exactly two
+    triangles, going through the edge in opposite directions.
+
+    Attributes:
+        edges (dict): The number of triangles using each edge, indexed by its
+                      (smallest, largest) vertex indices.
+        directedEdges (set): The edges already used by a triangle, indexed by
+                             their (start, end) vertex indices.
+        nbInconsistent (int): The number of edges used twice in the same
+                              direction.
+    """
+    def __init__(self):
+        """ Creates an instance of manifold checker.
+        """
+        self.edges = {}
+        self.directedEdges = set()
+        self.nbInconsistent = 0
+
+    def addFace(self, a, b, c):
+        """ Adds a triangle to the verified mesh.
+
+        Args:
+            a, b, c (int): The indices of the triangle's vertices.
+        """
+        for e in ((a, b), (b, c), (c, a)):
+            key = (e[0], e[1]) if e[0] < e[1] else (e[1], e[0])
+            self.edges[key] = self.edges.get(key, 0) + 1
+
+            if (e in self.directedEdges):
+                self.nbInconsistent += 1
+            else:
+                self.directedEdges.add(e)
+
+    def report(self):
+        """ Returns the results of the verification.
+
+        Returns:
+            dict: The number of edges ("edges"), of edges used by a single
+                  triangle ("boundary"), of edges used by more than two
+                  triangles ("nonManifold"), of edges used twice in the same
+                  direction ("inconsistent") and whether the mesh is
+                  watertight ("watertight").
+
+        >>> checker = ManifoldChecker()
+        >>> for f in [(0, 1, 2), (0, 3, 1), (1, 3, 2), (2, 3, 0)]:
+        ...     checker.addFace(*f)
+        >>> checker.report()["watertight"]
+        True
+        >>> checker.addFace(0, 1, 4)
+        >>> r = checker.report()
+        >>> r["watertight"], r["boundary"], r["nonManifold"], r["inconsistent"]
+        (False, 2, 1, 1)
+        """
+        counts = list(self.edges.values())
+        nbBoundary = counts.count(1)
+        nbNonManifold = len(counts) - nbBoundary - counts.count(2)
+
+        return {"edges": len(counts),
+                "boundary": nbBoundary,
+                "nonManifold": nbNonManifold,
+                "inconsistent": self.nbInconsistent,
+                "watertight": nbBoundary == 0 and nbNonManifold == 0 and \
+                              self.nbInconsistent == 0}
+
+def weldVertices(positions, indices, tolerance=WELD_TOLERANCE):
+    """ Welds the vertices of a mesh closer than a tolerance.
+
+    The triangles collapsed by the welding are removed.
+
+    Args:
+        positions (list of float): The coordinates of the vertices.
+        indices (list of int): The vertex indices of the triangles.
+        tolerance (float): The maximal difference along each axis between two
+                           welded vertices.
+
+    Returns:
+        (list of float, list of int, list of int): The coordinates of the
+            welded vertices, the vertex indices of the remaining triangles
+            and the new index of each original vertex.
+
+    >>> p = [0, 0, 0, 1, 0, 0, 0, 1, 0, 1, 0, 0.0001, 1, 1, 0]
+    >>> welded, faces, remap = weldVertices(p, [0, 1, 2, 3, 4, 2])
+    >>> len(welded) // 3, faces, remap
+    (4, [0, 1, 2, 1, 3, 2], [0, 1, 2, 1, 3])
+    """
+    welder = VertexWelder(tolerance)
+    remap = [welder.add(positions[i], positions[i+1], positions[i+2]) \
+             for i in range(0, len(positions), 3)]
+    weldedIndices = []
+
+    for i in range(0, len(indices), 3):
+        a = remap[indices[i]]
+        b = remap[indices[i+1]]
+        c = remap[indices[i+2]]
+
+        if (a != b and b != c and c != a):
+            weldedIndices.extend((a, b, c))
+
+    return (welder.positions, weldedIndices, remap)
+
+def computeNormals(positions, indices):
+    """ Computes the normals of the vertices of a mesh, as the average of the
+    normals of the triangles using each vertex, weighted by their area.
+
+    The cross product of two edges of a triangle is its normal scaled by
+    twice its area, so that the weighted sum only requires adding the
+    cross products of the triangles to their vertices. The triangles are
+    expected to be oriented counter-clockwise when seen from the front.
+
+    If numpy is installed, the computation is done by computeNormalsNumpy,
+    a few million triangles taking well under a second.
+
+    Args:
+        positions (list of float): The coordinates of the vertices.
+        indices (list of int): The vertex indices of the triangles.
+
+    Returns:
+        list of float: The coordinates of the unit normals of the vertices.
+                       Vertices used by no triangle get a null normal.
+
+    >>> p = [0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1]
+    >>> computeNormals(p, [0, 1, 2])
+    [0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0]
+    >>> n = computeNormals(p, [0, 2, 1, 0, 1, 3, 0, 3, 2, 1, 2, 3])
+    >>> [round(c, 4) for c in n[0:3]]
+    [-0.5774, -0.5774, -0.5774]
+    """
+    if (numpy != None):
+        return computeNormalsNumpy(positions, indices)
+
+    xs = positions[0::3]
+    ys = positions[1::3]
+    zs = positions[2::3]
+    nx = [0.0] * len(xs)
+    ny = [0.0] * len(xs)
+    nz = [0.0] * len(xs)
+
+    for a, b, c in zip(indices[0::3], indices[1::3], indices[2::3]):
+        xa = xs[a]
+        ya = ys[a]
+        za = zs[a]
+        ux = xs[b] - xa
+        uy = ys[b] - ya
+        uz = zs[b] - za
+        vx = xs[c] - xa
+        vy = ys[c] - ya
+        vz = zs[c] - za
+        cx = uy*vz - uz*vy
+        cy = uz*vx - ux*vz
+        cz = ux*vy - uy*vx
+        nx[a] += cx
+        ny[a] += cy
+        nz[a] += cz
+        nx[b] += cx
+        ny[b] += cy
+        nz[b] += cz
+        nx[c] += cx
+        ny[c] += cy
+        nz[c] += cz
+
+    normals = [0.0] * len(positions)
+
+    for i, x, y, z in zip(range(0, len(positions), 3), nx, ny, nz):
+        length = sqrt(x*x + y*y + z*z)
+
+        if (length > 0):
+            normals[i:i+3] = (x / length, y / length, z / length)
+
+    return normals
+
+def computeNormalsNumpy(positions, indices):
+    """ Computes the normals of the vertices of a mesh like computeNormals,
+    with numpy arrays instead of a loop over the triangles. The cross 
+    products are added to the vertices by numpy.bincount, one axis at a 
+    time.
+
+    Args:
+        positions (list of float): The coordinates of the vertices.
+        indices (list of int): The vertex indices of the triangles.
+
+    Returns:
+        list of float: The coordinates of the unit normals of the vertices.
+    """
+    points = numpy.frombuffer(array('d', positions)).reshape(-1, 3)
+    corners = numpy.fromiter(indices, numpy.intp, len(indices))
+    triangles = corners.reshape(-1, 3)
+    a = points[triangles[:, 0]]
+    u = points[triangles[:, 1]] - a
+    v = points[triangles[:, 2]] - a
+    cross = [u[:, 1] * v[:, 2] - u[:, 2] * v[:, 1], \
+             u[:, 2] * v[:, 0] - u[:, 0] * v[:, 2], \
+             u[:, 0] * v[:, 1] - u[:, 1] * v[:, 0]]
+    normals = numpy.empty(points.shape)
+
+    for j in range(3):
+        normals[:, j] = numpy.bincount(corners, numpy.repeat(cross[j], 3), \
+                                       len(points))
+
+    lengths = numpy.sqrt((normals * normals).sum(axis=1))
+    lengths[lengths == 0] = 1.0
+    normals /= lengths[:, None]
+
+    return normals.ravel().tolist()
+
+def getOriginDistance(a, b, c):
+    """ Returns the distance from the origin to the closest point of a 
+    triangle.
+
+    The closest point is found by testing the regions of the vertices, then
+    of the edges, then of the face, as in Ericson's "Real-Time Collision
+    Detection".
+
+    Args:
+        a, b, c (float, float, float): The vertices of the triangle.
+
+    Returns:
+        float: The distance.
+
+    >>> round(getOriginDistance((1, 0, 0), (0, 1, 0), (0, 0, 1)), 4)
+    0.5774
+    >>> getOriginDistance((1, 1, 0), (2, 1, 0), (1, 2, 0))
+    1.4142135623730951
+    >>> getOriginDistance((-1, 1, 0), (1, 1, 0), (0, 3, 0))
+    1.0
+    """
+    ab = [b[k] - a[k] for k in range(0, 3)]
+    ac = [c[k] - a[k] for k in range(0, 3)]
+    d1 = -sum(ab[k] * a[k] for k in range(0, 3))
+    d2 = -sum(ac[k] * a[k] for k in range(0, 3))
+    d3 = -sum(ab[k] * b[k] for k in range(0, 3))
+    d4 = -sum(ac[k] * b[k] for k in range(0, 3))
+    d5 = -sum(ab[k] * c[k] for k in range(0, 3))
+    d6 = -sum(ac[k] * c[k] for k in range(0, 3))
+    va = d3*d6 - d5*d4
+    vb = d5*d2 - d1*d6
+    vc = d1*d4 - d3*d2
+
+    if (d1 <= 0 and d2 <= 0):
+        p = a
+    elif (d3 >= 0 and d4 <= d3):
+        p = b
+    elif (d6 >= 0 and d5 <= d6):
+        p = c
+    elif (vc <= 0 and d1 >= 0 and d3 <= 0):
+        v = d1 / float(d1 - d3)
+        p = [a[k] + v * ab[k] for k in range(0, 3)]
+    elif (vb <= 0 and d2 >= 0 and d6 <= 0):
+        w = d2 / float(d2 - d6)
+        p = [a[k] + w * ac[k] for k in range(0, 3)]
+    elif (va <= 0 and d4 - d3 >= 0 and d5 - d6 >= 0):
+        w = (d4 - d3) / float((d4 - d3) + (d5 - d6))
+        p = [b[k] + w * (c[k] - b[k]) for k in range(0, 3)]
+    else:
+        v = vb / float(va + vb + vc)
+        w = vc / float(va + vb + vc)
+        p = [a[k] + v * ab[k] + w * ac[k] for k in range(0, 3)]
+
+    return sqrt(p[0]*p[0] + p[1]*p[1] + p[2]*p[2])
+
+def getChordalError(positions, indices, radius):
+    """ Returns the maximal chordal error of a mesh approximating a sphere 
+    centered on the origin, which is how far inside the sphere its triangles 
+    go.
+
+    Args:
+        positions (list of float): The coordinates of the vertices.
+        indices (list of int): The vertex indices of the triangles.
+        radius (float): The radius of the sphere.
+
+    Returns:
+        float: The largest distance between a point of the mesh and the 
+               sphere.
+
+    >>> p = [1, 0, 0, -1, 0, 0, 0, 1, 0, 0, -1, 0, 0, 0, 1, 0, 0, -1]
+    >>> i = [0, 2, 4, 2, 1, 4, 1, 3, 4, 3, 0, 4, 2, 0, 5, 1, 2, 5, 3, 1, 5, 0, 3, 5]
+    >>> round(getChordalError(p, i, 1.0), 4)
+    0.4226
+    """
+    points = [tuple(positions[i:i+3]) for i in range(0, len(positions), 3)]
+
+    return radius - min(getOriginDistance(points[a], points[b], points[c]) \
+                        for a, b, c in zip(indices[0::3], indices[1::3], \
+                                           indices[2::3]))
+
+def checkManifold(indices):
+    """ Verifies the topology of a triangle mesh.
+
+    Args:
+        indices (list of int): The vertex indices of the triangles.
+
+    Returns:
+        dict: The report of ManifoldChecker.report.
+    """
+    checker = ManifoldChecker()
+
+    for i in range(0, len(indices), 3):
+        checker.addFace(indices[i], indices[i+1], indices[i+2])
+
+    return checker.report()
+
+def loadObj(stream):
+    """ Reads the vertices and faces of a wavefront file.
+
+    Faces with more than three vertices are split in triangles. Normals and
+    texture coordinates are ignored.
+
+    Args:
+        stream (file): The opened wavefront file.
+
+    Returns:
+        (list of float, list of int): The coordinates of the vertices and the
+                                      vertex indices of the triangles.
+    """
+    positions = []
+    indices = []
+
+    for line in stream:
+        tokens = line.split()
+
+        if (len(tokens) == 0):
+            continue
+        elif (tokens[0] == "v"):
+            positions.extend(float(t) for t in tokens[1:4])
+        elif (tokens[0] == "f"):
+            nbVertices = len(positions) // 3
+            face = []
+
+            for t in tokens[1:]:
+                i = int(t.split("/")[0])
+                face.append(i - 1 if i > 0 else nbVertices + i)
+
+            for i in range(1, len(face) - 1):
+                indices.extend((face[0], face[i], face[i+1]))
+
+    return (positions, indices)
+
+def writeObj(stream, positions, normals, indices, name=None, offset=0, \
+             quads=False, precision=None):
+    """ Writes a mesh to a stream, in the wavefront format.
+
+    With "quads", each pair of triangles (a, b, c), (c, d, a) following each
+    other in indices, as written by spheroide.py for its rectangular faces, 
+    or (a, b, c), (a, c, d), as read by loadObj, is written as the single
+    face (a, b, c, d).
+
+    Args:
+        stream (file): The opened stream to write to.
+        positions (list of float): The coordinates of the vertices.
+        normals (list of float, None): The coordinates of the vertices'
+                                       normals, if any.
+        indices (list of int): The vertex indices of the triangles.
+        name (string, None): The name of the object, if any.
+        offset (int): The number of vertices already written to the stream
+                      for the previous objects.
+        quads (bool): Whether to join pairs of triangles into quadrilaterals.
+        precision (int, None): The number of significant digits of the 
+                               coordinates, if they are to be rounded.
+
+    >>> writeObj(sys.stdout, [0, 0, 0, 1, 0, 0, 1, 1, 0, 0, 1, 0], None, 
+    ...          [0, 1, 2, 2, 3, 0], quads=True)
+    v 0 0 0
+    v 1 0 0
+    v 1 1 0
+    v 0 1 0
+    f 1 2 3 4
+    """
+    if (precision != None):
+        coordinates = "{{:.{0}g}} {{:.{0}g}} {{:.{0}g}}\n".format(precision)
+    else:
+        coordinates = "{} {} {}\n"
+
+    if (name != None):
+        stream.write("o {}\n".format(name))
+
+    for i in range(0, len(positions), 3):
+        stream.write("v " + coordinates.format(*positions[i:i+3]))
+
+    if (normals != None):
+        for i in range(0, len(normals), 3):
+            stream.write("vn " + coordinates.format(*normals[i:i+3]))
+        face = "f {0}//{0} {1}//{1} {2}//{2}\n"
+        quad = "f {0}//{0} {1}//{1} {2}//{2} {3}//{3}\n"
+    else:
+        face = "f {} {} {}\n"
+        quad = "f {} {} {} {}\n"
+
+    offset += 1
+    i = 0
+
+    while (i < len(indices)):
+        a = indices[i] + offset
+        b = indices[i+1] + offset
+        c = indices[i+2] + offset
+
+        if (quads and i + 6 <= len(indices) and indices[i+3] == indices[i+2] \
+                and indices[i+5] == indices[i]):
+            stream.write(quad.format(a, b, c, indices[i+4] + offset))
+            i += 6
+        elif (quads and i + 6 <= len(indices) and indices[i+3] == indices[i] \
+                and indices[i+4] == indices[i+2]):
+            stream.write(quad.format(a, b, c, indices[i+5] + offset))
+            i += 6
+        else:
+            stream.write(face.format(a, b, c))
+            i += 3
+
+def openObj(filename, mode="r"):
+    """ Opens a wavefront file as text, compressed with gzip if its name ends
+    with ".gz".
+
+    Args:
+        filename (string): The name of the file.
+        mode (string): "r" to read the file, "w" to write it.
+    """
+    if (filename.endswith(".gz")):
+        return gzip.open(filename, mode + ("t" if sys.version_info[0] >= 3 else "b"))
+
+    return open(filename, mode)
+
+def gzipStream(stream):
+    """ Returns a stream compressing with gzip the text written to it before
+    passing it on to another stream, such as the standard output. The 
+    returned stream needs to be closed to finish the compression.
+
+    Args:
+        stream (file): The opened stream to write the compressed text to.
+    """
+    compressed = gzip.GzipFile(fileobj=getattr(stream, "buffer", stream), \
+                               mode="wb")
+
+    if (sys.version_info[0] >= 3):
+        return io.TextIOWrapper(compressed)
+
+    return compressed
+
+def parseOptions(validOptions):
+    """ Removes the options (arguments starting with "--") from argv and
+    returns them.
+
+    An option may be given a value with the form "--name=value".
+
+    Args:
+        validOptions (list of string): The names of the accepted options.
+
+    Returns:
+        dict: The value of each specified option, indexed by name. Options
+              specified without a value are associated with None.
+    """
+    options = {}
+
+    for arg in sys.argv[1:]:
+        if (arg.startswith("--")):
+            name, _, value = arg[2:].partition("=")
+
+            if (name not in validOptions):
+                print(ERR_INVALID_OPTION.format(arg))
+                sys.exit(0)
+            options[name] = value if value != "" else None
+
+    sys.argv = [arg for arg in sys.argv if not arg.startswith("--")]
+
+    return options
+
+def printReport(positions, indices, tolerance, out):
+    """ Welds the vertices of a mesh and writes a report on the welding and
+    on the topology of the welded mesh.
+
+    Args:
+        positions (list of float): The coordinates of the vertices.
+        indices (list of int): The vertex indices of the triangles.
+        tolerance (float): The welding tolerance.
+        out (file): The opened stream to write the report to.
+
+    Returns:
+        (list of float, list of int, list of int): The results of
+                                                   weldVertices.
+    """
+    welded = weldVertices(positions, indices, tolerance)
+    r = checkManifold(welded[1])
+
+    out.write(MSG_WELD.format(len(positions) // 3, len(welded[0]) // 3, \
+                              (len(indices) - len(welded[1])) // 3) + "\n")
+    out.write(MSG_TOPOLOGY.format(r["edges"], r["boundary"], r["nonManifold"], \
+                                  r["inconsistent"], \
+                                  "" if r["watertight"] else "not ") + "\n")
+    return welded
+
+if __name__ == "__main__":
+    options = parseOptions(["tolerance", "normals", "compact"])
+    nbArgs = len(sys.argv)
+
+    if (nbArgs != 2 and nbArgs != 3):
+        print(ERR_NB_PARAMS)
+        sys.exit(0)
+
+    try:
+        tolerance = float(options.get("tolerance") or WELD_TOLERANCE)
+    except ValueError:
+        tolerance = 0
+
+    if (tolerance <= 0):
+        print(ERR_INVALID_TOLERANCE)
+        sys.exit(0)
+
+    try:
+        with openObj(sys.argv[1]) as stream:
+            positions, indices = loadObj(stream)
+    except IOError:
+        print(ERR_INVALID_FILENAME)
+        sys.exit(0)
+
+    welded = printReport(positions, indices, tolerance, sys.stdout)
+
+    if (nbArgs == 3):
+        if ("normals" in options):
+            normals = computeNormals(welded[0], welded[1])
+        else:
+            normals = None
+
+        with openObj(sys.argv[2], "w") as stream:
+            if ("compact" in options):
+                writeObj(stream, welded[0], normals, welded[1], quads=True, \
+                         precision=OBJ_PRECISION)
+            else:
+                writeObj(stream, welded[0], normals, welded[1])
@@ -0,0 +1,590 @@
+"""
+UQAM - Winter 2018 - INF5071 - Group 20 - nbody.py
+
+This module simulates the motion of a solar system under gravity, without
+Blender, rather than moving its bodies along the elliptical orbits of
+solarsystem.py. Besides its planets and moons, the solar system may then have
+belts of thousands of small bodies.
+
+Each body of the json file may be given a "mass" (0 by default) and a
+"velocity" relative to the body it orbits (by default, the velocity of its
+elliptical orbit at its periapsis, where it starts). The unit of time is the
+frame and the gravitational constant is 1 : the orbits of the planets are
+close to their elliptical orbits when the mass of the star is
+4 pi^2 a^3 / T^2, a being the semi-major axis and T the period of an orbit.
+The bodies of the belts have no mass and start on circular orbits.
+
+The bodies are integrated with the leapfrog (kick-drift-kick) scheme, which
+is symplectic : the energy of the orbits does not drift over time. Since the
+bodies without mass do not attract the others, the massive bodies are
+integrated first, then the others are integrated in parallel, in chunks,
+knowing the trajectories of the massive bodies. Above THRESHOLD massive
+bodies, their attraction is approximated with a Barnes-Hut quadtree.
+
+Used as a program, it writes the positions of every body, relative to the
+star, at every frame of the animation to an array file, in the .npy format
+of numpy. The file is then referenced as "positions" in the json file, to be
+rendered by sys.py or sys-preview.py.
+
+    $ python nbody.py [--substeps=SUBSTEPS] [--threshold=THRESHOLD]
+                      [--theta=THETA] [--workers=WORKERS] INPUT_FILE OUTPUT_FILE
+
+    SUBSTEPS    The number of steps of the integration per frame (4 by
+                default).
+    THRESHOLD   The number of massive bodies above which their attraction is
+                approximated (256 by default).
+    THETA       The opening angle of the approximation, larger being faster
+                and less accurate (0.5 by default).
+    WORKERS     The number of processes integrating the bodies without mass
+                (all the processors by default).
+
+The array's shape is (frames, bodies, 3), the bodies being ordered as in
+solarsystem.getBodies, followed by the bodies of the belts.
+
+author : Alexis Chretien (CHRA25049209)
+"""
+import ast
+import random
+import struct
+import sys
+from array import array
+from math import sin, cos, sqrt, pi
+from multiprocessing import Pool, cpu_count
+from mesh import parseOptions
+from solarsystem import FRAME_START, FRAME_END, loadSolarSystem, getBodies
+
+ERR_NB_PARAMS = "Error : 2 arguments required, {} provided."
+ERR_STAR_MASS = "Error : the star must have a mass strictly greater than 0."
+ERR_SUBSTEPS = "Error : the number of substeps must be an integer strictly " \
+             + "greater than 0."
+ERR_THRESHOLD = "Error : the threshold must be an integer greater than or " \
+              + "equal to 0."
+ERR_THETA = "Error : theta must be a number greater than or equal to 0."
+ERR_NB_WORKERS = "Error : the number of workers must be an integer strictly " \
+               + "greater than 0."
+ERR_POSITIONS_FILE = "Error : invalid positions file \"{}\"."
+ERR_POSITIONS_SHAPE = "Error : the positions file \"{}\" does not match the " \
+                    + "solar system, simulate it again."
+MSG_SIMULATION = "{} bodies, {} of them massive, over {} frames : {} steps."
+
+NB_SUBSTEPS = 4
+THRESHOLD = 256
+THETA = 0.5
+SOFTENING = 1e-3
+MAX_TREE_DEPTH = 32
+CHUNKS_PER_WORKER = 4
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+
+class QuadTree(object):
+    """ Class approximating the attraction of massive bodies with the
+    Barnes-Hut method : a group of bodies far enough from a point attracts
+    it like a single body at their center of mass.
+
+    The nodes are stored in parallel lists, the root being node 0.
+
+    Attributes:
+        xs, ys (list of float): The center of mass of each node.
+        masses (list of float): The mass of each node.
+        sizes (list of float): The width of each node's square.
+        children (list of (list of int, None)): The children of each node,
+                                                None for a leaf.
+    """
+    def __init__(self, xs, ys, masses):
+        """ Creates an instance of quadtree holding massive bodies.
+        """
+        self.xs = []
+        self.ys = []
+        self.masses = []
+        self.sizes = []
+        self.children = []
+        left = min(xs)
+        bottom = min(ys)
+        size = max(max(xs) - left, max(ys) - bottom, SOFTENING)
+        self.addNode(list(range(len(xs))), xs, ys, masses, left, bottom, size, 0)
+
+    def addNode(self, indices, xs, ys, masses, left, bottom, size, depth):
+        """ Adds the node holding some bodies, and its descendants, returning
+        its index.
+
+        Args:
+            indices (list of int): The indices of the bodies of the node.
+            xs, ys (list of float): The positions of all the bodies.
+            masses (list of float): The masses of all the bodies.
+            left, bottom (float): The lower corner of the node's square.
+            size (float): The width of the node's square.
+            depth (int): The depth of the node, the bodies of the nodes at
+                         MAX_TREE_DEPTH being kept together.
+        """
+        node = len(self.xs)
+        mass = sum(masses[i] for i in indices)
+        self.xs.append( sum(xs[i] * masses[i] for i in indices) / mass )
+        self.ys.append( sum(ys[i] * masses[i] for i in indices) / mass )
+        self.masses.append(mass)
+        self.sizes.append(size)
+        self.children.append(None)
+
+        if (len(indices) > 1 and depth < MAX_TREE_DEPTH):
+            half = size / 2.0
+            quadrants = [[], [], [], []]
+
+            for i in indices:
+                quadrants[(xs[i] >= left + half) + 2 * (ys[i] >= bottom + half)] \
+                    .append(i)
+
+            self.children[node] = [self.addNode(q, xs, ys, masses, \
+                                                left + half * (k % 2), \
+                                                bottom + half * (k // 2), \
+                                                half, depth + 1) \
+                                   for k, q in enumerate(quadrants) if q]
+
+        return node
+
+    def getAcceleration(self, x, y, theta):
+        """ Returns the acceleration of a point due to the bodies of the tree.
+
+        Args:
+            x, y (float): The position of the point.
+            theta (float): The opening angle : a node whose width is smaller
+                           than theta times its distance to the point is not
+                           opened. 0 for the exact attraction.
+
+        Returns:
+            (float, float): The xy acceleration.
+        """
+        theta2 = theta * theta
+        eps2 = SOFTENING * SOFTENING
+        ax = 0.0
+        ay = 0.0
+        stack = [0]
+
+        while (stack):
+            n = stack.pop()
+            dx = self.xs[n] - x
+            dy = self.ys[n] - y
+            d2 = dx*dx + dy*dy
+            children = self.children[n]
+
+            if (children == None or self.sizes[n]**2 < theta2 * d2):
+                d2 += eps2
+                k = self.masses[n] / (d2 * sqrt(d2))
+                ax += dx * k
+                ay += dy * k
+            else:
+                stack.extend(children)
+
+        return (ax, ay)
+
+class PositionsFile(object):
+    """ Class reading the positions of the bodies from an array file written
+    by simulate, one frame at a time.
+
+    Attributes:
+        filename (string): The path of the file.
+        nbFrames (int): The number of frames.
+        nbBodies (int): The number of bodies.
+        offset (int): The position of the array in the file, after its header.
+    """
+    def __init__(self, filename):
+        """ Creates an instance of positions file, exiting if the file is not
+        valid.
+        """
+        self.filename = filename
+
+        try:
+            with open(filename, "rb") as stream:
+                if (stream.read(len(NPY_MAGIC)) != NPY_MAGIC):
+                    raise ValueError
+                length = struct.unpack("<H", stream.read(2))[0]
+                header = ast.literal_eval(stream.read(length).decode("latin1"))
+                self.nbFrames, self.nbBodies, _ = header["shape"]
+
+                if (header["descr"] != "<f4" or header["fortran_order"]):
+                    raise ValueError
+                self.offset = stream.tell()
+        except (IOError, ValueError, SyntaxError, KeyError, struct.error):
+            print(ERR_POSITIONS_FILE.format(filename))
+            sys.exit(0)
+
+    def readFrame(self, frame, first=0, count=None):
+        """ Returns the xyz coordinates of bodies at a frame.
+
+        Args:
+            frame (int): The index of the frame in the file.
+            first (int): The index of the first body.
+            count (int, None): The number of bodies, all the following ones
+                               by default.
+
+        Returns:
+            array of float: The coordinates of the bodies, one after the
+                            other.
+        """
+        if (count == None):
+            count = self.nbBodies - first
+        coords = array("f")
+
+        with open(self.filename, "rb") as stream:
+            stream.seek(self.offset + 12 * (frame * self.nbBodies + first))
+            coords.fromfile(stream, 3 * count)
+
+        if (sys.byteorder == "big"):
+            coords.byteswap()
+
+        return coords
+
+def loadPositions(solarSystem):
+    """ Returns the positions file of a solar system, exiting if it does not
+    hold every frame of every body.
+
+    Args:
+        solarSystem (SolarSystem): The solar system, having "positions".
+    """
+    positions = PositionsFile(solarSystem.positions)
+    nbBodies = len(getBodies(solarSystem.planets)) \
+             + sum(b.count for b in solarSystem.belts)
+
+    if (positions.nbFrames != FRAME_END - FRAME_START + 1 or \
+            positions.nbBodies != nbBodies):
+        print(ERR_POSITIONS_SHAPE.format(solarSystem.positions))
+        sys.exit(0)
+
+    return positions
+
+def writeHeader(stream, nbFrames, nbBodies):
+    """ Writes the header of an array file of float32 coordinates, in the
+    .npy format, version 1.0.
+
+    Args:
+        stream (file): The opened binary stream.
+        nbFrames (int): The number of frames.
+        nbBodies (int): The number of bodies.
+    """
+    header = "{{'descr': '<f4', 'fortran_order': False, 'shape': ({}, {}, 3), }}" \
+             .format(nbFrames, nbBodies)
+    # The array starts at a multiple of 64 bytes, after a newline
+    length = len(NPY_MAGIC) + 2 + len(header) + 1
+    header += " " * (-length % 64) + "\n"
+    stream.write(NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1"))
+
+def getAccelerations(xs, ys, sourceXs, sourceYs, sourceMasses, threshold=THRESHOLD, \
+                     theta=THETA):
+    """ Returns the accelerations of points due to the attraction of massive
+    bodies, approximated with a quadtree if there are more bodies than
+    threshold.
+
+    Args:
+        xs, ys (list of float): The positions of the points.
+        sourceXs, sourceYs (list of float): The positions of the bodies.
+        sourceMasses (list of float): The masses of the bodies.
+        threshold (int): The number of bodies above which the attraction is
+                         approximated.
+        theta (float): The opening angle of the approximation.
+
+    Returns:
+        (list of float, list of float): The xy accelerations of the points.
+
+    >>> xs, ys = [0.0, 1.0, 3.0], [0.0, 2.0, -1.0]
+    >>> ms = [1.0, 2.0, 0.5]
+    >>> exact = getAccelerations(xs, ys, xs, ys, ms)
+    >>> [round(a, 6) for a in exact[0]]
+    [0.22632, -0.068108, -0.180207]
+    >>> tree = getAccelerations(xs, ys, xs, ys, ms, 0, 0.0)
+    >>> max(abs(a - b) for a, b in zip(exact[0] + exact[1], tree[0] + tree[1])) < 1e-9
+    True
+    """
+    if (len(sourceXs) > threshold):
+        tree = QuadTree(sourceXs, sourceYs, sourceMasses)
+        accelerations = [tree.getAcceleration(x, y, theta) for x, y in zip(xs, ys)]
+
+        return ([a[0] for a in accelerations], [a[1] for a in accelerations])
+
+    eps2 = SOFTENING * SOFTENING
+    axs = [0.0] * len(xs)
+    ays = [0.0] * len(xs)
+
+    # A body does not attract itself, its distance being 0
+    for sx, sy, m in zip(sourceXs, sourceYs, sourceMasses):
+        dxs = [sx - x for x in xs]
+        dys = [sy - y for y in ys]
+        ks = [m * (dx*dx + dy*dy + eps2) ** -1.5 for dx, dy in zip(dxs, dys)]
+        axs = [a + dx * k for a, dx, k in zip(axs, dxs, ks)]
+        ays = [a + dy * k for a, dy, k in zip(ays, dys, ks)]
+
+    return (axs, ays)
+
+def leapfrog(xs, ys, vxs, vys, accelerate, nbSteps, dt):
+    """ Integrates the motion of bodies with the leapfrog (kick-drift-kick)
+    scheme, yielding their positions after each step. The final half kick
+    of a step and the first one of the next step are merged, the velocities
+    being only needed in between.
+
+    Args:
+        xs, ys (list of float): The initial positions of the bodies.
+        vxs, vys (list of float): The initial velocities of the bodies.
+        accelerate (function): The function returning the accelerations of
+                               the bodies, given the step and their positions.
+        nbSteps (int): The number of steps.
+        dt (float): The duration of a step.
+
+    >>> sun = lambda step, xs, ys: getAccelerations(xs, ys, [0.0], [0.0], [1.0])
+    >>> for xs, ys in leapfrog([1.0], [0.0], [0.0], [1.0], sun, 1000, 2*pi / 1000):
+    ...     pass
+    >>> round(xs[0], 3), round(ys[0], 3)
+    (1.0, -0.0)
+    """
+    axs, ays = accelerate(0, xs, ys)
+    vxs = [v + a * dt / 2.0 for v, a in zip(vxs, axs)]
+    vys = [v + a * dt / 2.0 for v, a in zip(vys, ays)]
+
+    for step in range(1, nbSteps + 1):
+        xs = [x + v * dt for x, v in zip(xs, vxs)]
+        ys = [y + v * dt for y, v in zip(ys, vys)]
+
+        yield (xs, ys)
+
+        if (step < nbSteps):
+            axs, ays = accelerate(step, xs, ys)
+            vxs = [v + a * dt for v, a in zip(vxs, axs)]
+            vys = [v + a * dt for v, a in zip(vys, ays)]
+
+def getOrbitVelocity(body):
+    """ Returns the initial velocity of a body relative to the body it
+    orbits : the one given in the json file or, by default, the velocity of
+    its elliptical orbit at its periapsis.
+
+    Args:
+        body (Planet): The body.
+
+    >>> from solarsystem import Planet
+    >>> [round(v, 6) for v in getOrbitVelocity(Planet(1, None, 2.0, 4*pi))]
+    [0.0, 1.0]
+    """
+    if (body.velocity != None):
+        return (float(body.velocity[0]), float(body.velocity[1]))
+
+    e = body.eccentricity
+
+    return (0.0, 2*pi * body.distance / body.period * sqrt((1 + e) / (1 - e)))
+
+def getInitialState(solarSystem):
+    """ Returns the initial positions, velocities and masses of the star,
+    followed by the bodies in the order of the array file.
+
+    Args:
+        solarSystem (SolarSystem): The solar system.
+
+    Returns:
+        (list of float) * 5: The x and y coordinates, the x and y
+                             velocities and the masses of the bodies.
+    """
+    star = solarSystem.star
+    state = [[0.0], [0.0], [0.0], [0.0], [float(star.mass)]]
+
+    def addBody(x, y, vx, vy, mass):
+        for values, value in zip(state, (x, y, vx, vy, mass)):
+            values.append(value)
+
+    for p in solarSystem.planets:
+        x = p.distance * (1 - p.eccentricity)
+        vx, vy = getOrbitVelocity(p)
+        addBody(x, 0.0, vx, vy, float(p.mass))
+
+        for m in p.moons:
+            mvx, mvy = getOrbitVelocity(m)
+            addBody(x + m.distance * (1 - m.eccentricity), 0.0, vx + mvx, \
+                    vy + mvy, float(m.mass))
+
+    for b in solarSystem.belts:
+        generator = random.Random(b.seed)
+
+        for i in range(0, b.count):
+            r = sqrt(generator.uniform(b.inner**2, b.outer**2))
+            a = generator.uniform(0, 2*pi)
+            v = sqrt(star.mass / r)
+            addBody(r * cos(a), r * sin(a), -v * sin(a), v * cos(a), 0.0)
+
+    return state
+
+def writeBodies(stream, offset, nbBodies, frame, indices, xs, ys, starX, starY):
+    """ Writes the positions of bodies at a frame to an array file, relative
+    to the star.
+
+    Args:
+        stream (file): The array file, opened in binary mode.
+        offset (int): The position of the array in the file.
+        nbBodies (int): The number of bodies of the array.
+        frame (int): The index of the frame in the array.
+        indices (list of int): The indices of the bodies in the array, in
+                               increasing order.
+        xs, ys (list of float): The positions of the bodies.
+        starX, starY (float): The position of the star.
+    """
+    start = 0
+
+    # Writing each run of consecutive bodies at once
+    for end in range(1, len(indices) + 1):
+        if (end < len(indices) and indices[end] == indices[end - 1] + 1):
+            continue
+
+        coords = array("f")
+
+        for x, y in zip(xs[start:end], ys[start:end]):
+            coords.extend( (x - starX, y - starY, 0.0) )
+
+        if (sys.byteorder == "big"):
+            coords.byteswap()
+
+        stream.seek(offset + 12 * (frame * nbBodies + indices[start]))
+        coords.tofile(stream)
+        start = end
+
+def integrateChunk(args):
+    """ Integrates bodies without mass, knowing the trajectories of the
+    massive bodies, and writes their positions to the array file.
+
+    Args:
+        args (tuple): The array file, its offset and number of bodies, the
+            indices of the bodies, their initial xs, ys, vxs and vys, and
+            the trajectories of the massive bodies, their masses, the number
+            of substeps and of frames, the threshold and theta.
+    """
+    filename, offset, nbBodies, indices, xs, ys, vxs, vys, trajectories, \
+        masses, nbSubsteps, nbFrames, threshold, theta = args
+
+    def accelerate(step, xs, ys):
+        sourceXs, sourceYs = trajectories[step]
+        return getAccelerations(xs, ys, sourceXs, sourceYs, masses, threshold, \
+                                theta)
+
+    with open(filename, "r+b") as stream:
+        for step, (xs, ys) in enumerate(leapfrog(xs, ys, vxs, vys, accelerate, \
+                                                 nbSubsteps * nbFrames, \
+                                                 1.0 / nbSubsteps), 1):
+            if (step % nbSubsteps == 0 and step // nbSubsteps >= FRAME_START):
+                starX, starY = trajectories[step][0][0], trajectories[step][1][0]
+                writeBodies(stream, offset, nbBodies, step // nbSubsteps - FRAME_START, \
+                            indices, xs, ys, starX, starY)
+
+def simulate(solarSystem, filename, nbSubsteps=NB_SUBSTEPS, threshold=THRESHOLD, \
+             theta=THETA, nbWorkers=None):
+    """ Simulates the motion of the bodies of a solar system and writes
+    their positions at every frame of the animation to an array file.
+
+    Args:
+        solarSystem (SolarSystem): The solar system.
+        filename (string): The name of the array file.
+        nbSubsteps (int): The number of steps per frame.
+        threshold (int): The number of massive bodies above which their
+                         attraction is approximated.
+        theta (float): The opening angle of the approximation.
+        nbWorkers (int, None): The number of processes integrating the
+                               bodies without mass, all the processors' by
+                               default.
+    """
+    xs, ys, vxs, vys, masses = getInitialState(solarSystem)
+    nbBodies = len(xs) - 1
+    nbFrames = FRAME_END - FRAME_START + 1
+    nbSteps = nbSubsteps * FRAME_END
+    massive = [i for i, m in enumerate(masses) if m > 0]
+    massless = [i for i, m in enumerate(masses) if m == 0]
+
+    print(MSG_SIMULATION.format(nbBodies, len(massive) - 1, nbFrames, nbSteps))
+
+    with open(filename, "wb") as stream:
+        writeHeader(stream, nbFrames, nbBodies)
+        offset = stream.tell()
+        stream.truncate(offset + 12 * nbFrames * nbBodies)
+
+    # Integrating the massive bodies, which attract each other
+    sourceMasses = [masses[i] for i in massive]
+
+    def accelerate(step, xs, ys):
+        return getAccelerations(xs, ys, xs, ys, sourceMasses, threshold, theta)
+
+    trajectories = [([xs[i] for i in massive], [ys[i] for i in massive])]
+    trajectories.extend( leapfrog(trajectories[0][0], trajectories[0][1], \
+                                  [vxs[i] for i in massive], \
+                                  [vys[i] for i in massive], accelerate, \
+                                  nbSteps, 1.0 / nbSubsteps) )
+
+    with open(filename, "r+b") as stream:
+        for f in range(FRAME_START, FRAME_END + 1):
+            sourceXs, sourceYs = trajectories[f * nbSubsteps]
+            writeBodies(stream, offset, nbBodies, f - FRAME_START, \
+                        [i - 1 for i in massive[1:]], sourceXs[1:], sourceYs[1:], \
+                        sourceXs[0], sourceYs[0])
+
+    # Integrating the bodies without mass, by chunks
+    if (len(massless) == 0):
+        return
+
+    nbWorkers = nbWorkers or cpu_count()
+    size = -(-len(massless) // (nbWorkers * CHUNKS_PER_WORKER))
+    tasks = []
+
+    for start in range(0, len(massless), size):
+        chunk = massless[start:start + size]
+        tasks.append( (filename, offset, nbBodies, [i - 1 for i in chunk], \
+                       [xs[i] for i in chunk], [ys[i] for i in chunk], \
+                       [vxs[i] for i in chunk], [vys[i] for i in chunk], \
+                       trajectories, sourceMasses, nbSubsteps, FRAME_END, \
+                       threshold, theta) )
+
+    if (nbWorkers == 1):
+        for t in tasks:
+            integrateChunk(t)
+    else:
+        pool = Pool(nbWorkers)
+        pool.map(integrateChunk, tasks)
+        pool.close()
+        pool.join()
+
+if __name__ == "__main__":
+    options = parseOptions(["substeps", "threshold", "theta", "workers"])
+
+    if (len(sys.argv) != 3):
+        print(ERR_NB_PARAMS.format(len(sys.argv) - 1))
+        sys.exit(0)
+
+    try:
+        nbSubsteps = int(options.get("substeps") or NB_SUBSTEPS)
+    except ValueError:
+        nbSubsteps = 0
+
+    if (nbSubsteps <= 0):
+        print(ERR_SUBSTEPS)
+        sys.exit(0)
+
+    try:
+        threshold = int(options.get("threshold") or THRESHOLD)
+    except ValueError:
+        threshold = -1
+
+    if (threshold < 0):
+        print(ERR_THRESHOLD)
+        sys.exit(0)
+
+    try:
+        theta = float(options.get("theta") or THETA)
+    except ValueError:
+        theta = -1
+
+    if (theta < 0):
+        print(ERR_THETA)
+        sys.exit(0)
+
+    try:
+        nbWorkers = int(options.get("workers") or cpu_count())
+    except ValueError:
+        nbWorkers = 0
+
+    if (nbWorkers <= 0):
+        print(ERR_NB_WORKERS)
+        sys.exit(0)
+
+    solarSystem = loadSolarSystem(sys.argv[1])
+
+    if (solarSystem.star.mass <= 0):
+        print(ERR_STAR_MASS)
+        sys.exit(0)
+
+    simulate(solarSystem, sys.argv[2], nbSubsteps, threshold, theta, nbWorkers)
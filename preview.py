@@ -0,0 +1,251 @@
+"""
+UQAM - Winter 2018 - INF5071 - Group 20 - preview.py
+
+This module renders a preview of a triangle mesh to an image, without
+Blender. The mesh is projected orthographically, its hidden faces are
+removed using back-face culling and a z-buffer, and it is lit by a single
+directional light following the Lambert model.
+
+Used as a program, it renders a wavefront (.obj or .obj.gz) file to an image
+file, whose format is given by its extension.
+
+    $ python preview.py [--size=SIZE] [--yaw=YAW] [--pitch=PITCH]
+                        INPUT_FILE IMG_FILE
+
+    SIZE     The width and height of the image, in pixels (256 by default).
+    YAW      The angle of the camera around the z axis, in degrees (30 by
+             default).
+    PITCH    The angle of the camera above the xy plane, in degrees (20 by
+             default).
+
+The triangles are expected to be oriented counter-clockwise when seen from
+the front, like the ones of spheroide.py. The normals of a wavefront file are
+computed from its triangles.
+
+author : Alexis Chretien (CHRA25049209)
+"""
+import sys
+from math import sin, cos, sqrt, radians
+from PIL import Image
+from mesh import parseOptions, loadObj, openObj, computeNormals
+
+ERR_NB_PARAMS = "Error : invalid number of parameters."
+ERR_INVALID_FILENAME = "Error : invalid filename"
+ERR_PREVIEW_SIZE = "Error : the size must be an integer strictly greater than 0."
+ERR_PREVIEW_ANGLE = "Error : the angles of the camera must be numbers."
+
+PREVIEW_SIZE = 256
+PREVIEW_YAW = 30.0
+PREVIEW_PITCH = 20.0
+AMBIENT = 0.15
+FILL_RATIO = 0.9
+MESH_COLOR = (215, 190, 150)
+BACKGROUND_COLOR = (40, 40, 48)
+
+class Rasterizer(object):
+    """ Class drawing shaded triangles to a z-buffered image.
+
+    Attributes:
+        width (int): The width of the image, in pixels.
+        height (int): The height of the image, in pixels.
+        depths (list of float): The depth of the closest triangle drawn at
+                                each pixel, larger being closer.
+        shades (list of float): The shade, from 0 to 1, of the closest
+                                triangle drawn at each pixel, None for the
+                                background.
+    """
+    def __init__(self, width, height):
+        """ Creates an instance of rasterizer, with an empty image.
+        """
+        self.width = width
+        self.height = height
+        self.depths = [float("-inf")] * (width * height)
+        self.shades = [None] * (width * height)
+
+    def drawTriangles(self, xs, ys, zs, shades, indices):
+        """ Draws triangles, skipping the ones seen from the back.
+
+        Each pixel whose center is inside a triangle gets the depth and the
+        shade of the triangle at this point, interpolated from its vertices,
+        unless a closer triangle was already drawn there.
+
+        Args:
+            xs, ys (list of float): The coordinates of the vertices in the
+                                    image, in pixels, y going down.
+            zs (list of float): The depth of the vertices, larger being closer.
+            shades (list of float): The shade of the vertices, from 0 to 1.
+            indices (list of int): The vertex indices of the triangles.
+        """
+        width = self.width
+        depths = self.depths
+        pixels = self.shades
+        maxX = self.width - 1
+        maxY = self.height - 1
+
+        for a, b, c in zip(indices[0::3], indices[1::3], indices[2::3]):
+            x0 = xs[a]
+            y0 = ys[a]
+            x1 = xs[b]
+            y1 = ys[b]
+            x2 = xs[c]
+            y2 = ys[c]
+            area = (x1 - x0)*(y2 - y0) - (x2 - x0)*(y1 - y0)
+
+            # Counter-clockwise triangles have a negative area once y is
+            # flipped. The others are seen from the back, or edge-on.
+            if (area >= 0):
+                continue
+
+            left = max(int(min(x0, x1, x2)), 0)
+            right = min(int(max(x0, x1, x2)), maxX)
+            top = max(int(min(y0, y1, y2)), 0)
+            bottom = min(int(max(y0, y1, y2)), maxY)
+
+            if (left > right or top > bottom):
+                continue
+
+            inverse = 1.0 / area
+            z0 = zs[a]
+            z1 = zs[b]
+            z2 = zs[c]
+            s0 = shades[a]
+            s1 = shades[b]
+            s2 = shades[c]
+
+            for py in range(top, bottom + 1):
+                cy = py + 0.5
+                k = py * width
+
+                for px in range(left, right + 1):
+                    cx = px + 0.5
+                    w0 = ((x1 - cx)*(y2 - cy) - (x2 - cx)*(y1 - cy)) * inverse
+                    w1 = ((x2 - cx)*(y0 - cy) - (x0 - cx)*(y2 - cy)) * inverse
+                    w2 = 1.0 - w0 - w1
+
+                    if (w0 < 0 or w1 < 0 or w2 < 0):
+                        continue
+
+                    z = w0*z0 + w1*z1 + w2*z2
+
+                    if (z > depths[k + px]):
+                        depths[k + px] = z
+                        pixels[k + px] = w0*s0 + w1*s1 + w2*s2
+
+    def getImage(self):
+        """ Returns the drawn image, colored with MESH_COLOR over
+        BACKGROUND_COLOR.
+        """
+        image = Image.new("RGB", (self.width, self.height))
+        image.putdata([BACKGROUND_COLOR if s == None else \
+                       tuple(int(c * s) for c in MESH_COLOR) \
+                       for s in self.shades])
+        return image
+
+def getCameraBasis(yaw, pitch):
+    """ Returns the axes of an orthographic camera looking at the origin.
+
+    Args:
+        yaw (float): The angle of the camera around the z axis, in degrees.
+        pitch (float): The angle of the camera above the xy plane, in degrees.
+
+    Returns:
+        ((float, float, float) * 3): The right, up and back axes of the
+            camera, the back axis pointing from the origin to the camera.
+    """
+    a = radians(yaw)
+    e = radians(pitch)
+    right = (-sin(a), cos(a), 0.0)
+    up = (-sin(e) * cos(a), -sin(e) * sin(a), cos(e))
+    back = (cos(e) * cos(a), cos(e) * sin(a), sin(e))
+
+    return (right, up, back)
+
+def renderMesh(positions, normals, indices, size=PREVIEW_SIZE, \
+               yaw=PREVIEW_YAW, pitch=PREVIEW_PITCH):
+    """ Renders a preview of a mesh, filling most of a square image.
+
+    The light comes from the upper left of the camera.
+
+    Args:
+        positions (list of float): The coordinates of the vertices.
+        normals (list of float): The coordinates of the vertices' normals.
+        indices (list of int): The vertex indices of the triangles.
+        size (int): The width and height of the image, in pixels.
+        yaw (float): The angle of the camera around the z axis, in degrees.
+        pitch (float): The angle of the camera above the xy plane, in degrees.
+
+    Returns:
+        Image: The rendered image.
+    """
+    right, up, back = getCameraBasis(yaw, pitch)
+    light = [-0.4*r + 0.6*u + 0.7*b for r, u, b in zip(right, up, back)]
+    length = sqrt(sum(c*c for c in light))
+    lx, ly, lz = [c / length for c in light]
+
+    px = positions[0::3]
+    py = positions[1::3]
+    pz = positions[2::3]
+    rasterizer = Rasterizer(size, size)
+
+    if (len(px) == 0):
+        return rasterizer.getImage()
+
+    # Fitting the bounding sphere of the vertices in the image
+    mx = (min(px) + max(px)) / 2.0
+    my = (min(py) + max(py)) / 2.0
+    mz = (min(pz) + max(pz)) / 2.0
+    radius = sqrt(max((x-mx)**2 + (y-my)**2 + (z-mz)**2 \
+                      for x, y, z in zip(px, py, pz)))
+    scale = FILL_RATIO * size / 2.0 / (radius if radius > 0 else 1.0)
+    half = size / 2.0
+
+    xs = [half + scale * ((x-mx)*right[0] + (y-my)*right[1] + (z-mz)*right[2]) \
+          for x, y, z in zip(px, py, pz)]
+    ys = [half - scale * ((x-mx)*up[0] + (y-my)*up[1] + (z-mz)*up[2]) \
+          for x, y, z in zip(px, py, pz)]
+    zs = [(x-mx)*back[0] + (y-my)*back[1] + (z-mz)*back[2] \
+          for x, y, z in zip(px, py, pz)]
+
+    shades = []
+
+    for x, y, z in zip(normals[0::3], normals[1::3], normals[2::3]):
+        length = sqrt(x*x + y*y + z*z)
+        diffuse = (x*lx + y*ly + z*lz) / length if length > 0 else 0.0
+        shades.append(AMBIENT + (1.0 - AMBIENT) * max(diffuse, 0.0))
+
+    rasterizer.drawTriangles(xs, ys, zs, shades, indices)
+
+    return rasterizer.getImage()
+
+if __name__ == "__main__":
+    options = parseOptions(["size", "yaw", "pitch"])
+
+    if (len(sys.argv) != 3):
+        print(ERR_NB_PARAMS)
+        sys.exit(0)
+
+    try:
+        size = int(options.get("size") or PREVIEW_SIZE)
+    except ValueError:
+        size = 0
+
+    if (size <= 0):
+        print(ERR_PREVIEW_SIZE)
+        sys.exit(0)
+
+    try:
+        yaw = float(options.get("yaw") or PREVIEW_YAW)
+        pitch = float(options.get("pitch") or PREVIEW_PITCH)
+    except ValueError:
+        print(ERR_PREVIEW_ANGLE)
+        sys.exit(0)
+
+    try:
+        with openObj(sys.argv[1]) as stream:
+            positions, indices = loadObj(stream)
+    except IOError:
+        print(ERR_INVALID_FILENAME)
+        sys.exit(0)
+
+    normals = computeNormals(positions, indices)
+    renderMesh(positions, normals, indices, size, yaw, pitch).save(sys.argv[2])
@@ -16,14 +16,78 @@ traced on the image.
     DX       X coordiante of the light ray's direction vector.
     DY       Y coordinate of the light ray's direction vector.
     I        Intensity of the light ray (number of rebounces).
+
+The option "--trace" skips the image entirely. The rebounces of the light ray
+are then streamed, one JSON object per line, to TRACE_FILE ("-" for the 
+standard output).
+
+    $ python q2.py --trace SC_FILE TRACE_FILE OX,OY,DX,DY,I
+
+The option "--coverage" draws, instead of the light ray's trajectory, how much
+of an area light (the line segment from (X1,Y1) to (X2,Y2)) is visible from 
+each cell of STEP x STEP pixels, using SAMPLES light samples per cell drawn 
+from a random generator seeded with SEED. The rows are distributed among
+WORKERS processes; the result does not depend on their number.
+
+    $ python q2.py --coverage=X1,Y1,X2,Y2 [--samples=SAMPLES] [--step=STEP]
+                   [--seed=SEED] [--workers=WORKERS] SC_FILE IMG_FILE
+
+The option "--cache" keeps the rebounces traced for the image in DIR 
+(".tracecache" by default), in a file named after a hash of the scene and of
+the light ray's parameters. Drawing the same scene again reads them back 
+instead of tracing them; raising the light ray's intensity only traces the
+rebounces following the cached ones. The least recently used files are 
+deleted once the cache exceeds SIZE megabytes (64 by default).
+
+    $ python q2.py --cache[=DIR] [--cache-size=SIZE] SC_FILE IMG_FILE 
+                   [OX,OY,DX,DY,I]
+
+The option "--float-report" displays how far the rebounces traced with their
+points of rebounce and directions rounded to 32-bit floats are from the ones
+traced with 64-bit floats.
+
+    $ python q2.py --float-report SC_FILE [OX,OY,DX,DY,I]
+
+The option "--daemon" starts a server listening on the UNIX socket SOCKET. 
+It renders the requests of its clients with WORKERS processes (the number of
+processors by default), each one keeping the recently used scenes parsed and
+compiled in memory, up to about MEMORY megabytes in all (64 by default). The
+option "--cache" applies to its renders as well. SOCKET must not be another
+kind of file, nor the socket of a running daemon.
+
+    $ python q2.py --daemon=SOCKET [--workers=WORKERS] [--memory=MEMORY]
+                   [--cache[=DIR]] [--cache-size=SIZE]
+
+Each request is a JSON object on its own line, answered by a JSON object on
+its own line. "command" is "render" (as drawing an image), "trace" (as the
+option "--trace") or "stats" (the numbers of requests, of scenes found in 
+memory or parsed and the latencies, in seconds). "ray" is optional.
+
+    {"command": "render", "scene": SC_FILE, "output": IMG_FILE, 
+     "ray": "OX,OY,DX,DY,I"}
  
 author : Alexis Chretien (CHRA25049209)
 date : February 26th, 2018
 """
 
+import copy
+import hashlib
 import json
 import os
+import signal
+import socket
+import stat
 import sys
+from array import array
+from collections import deque, OrderedDict
+from multiprocessing import Pool, cpu_count
+from random import Random
+from threading import Lock
+from time import time
+try:
+    from SocketServer import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
+except ImportError:
+    from socketserver import ThreadingMixIn, UnixStreamServer, StreamRequestHandler
 from PIL import Image, ImageDraw, ImageColor
 from pointvec import Point3D, Vector3D
 from math import sqrt
@@ -33,16 +97,63 @@ ERR_LIGHT_RAY_PARAMS = "Error : invalid number of parameters for light ray objec
 ERR_INVALID_JSON = "Error : invalid object(s) in json file. The scene " \
                  + "only allows circles and boxes"
 ERR_NB_PARAMS = "Error : the program takes at least one argument"
+ERR_INVALID_OPTION = "Error : \"{}\" is not a valid option."
+ERR_TRACE_PARAMS = "Error : the trace mode requires a scene file, a trace " \
+                 + "file and the light ray's parameters"
+ERR_COVERAGE_PARAMS = "Error : the coverage mode requires a scene file and " \
+                    + "an image file"
+ERR_COVERAGE_OPTIONS = "Error : invalid coverage options"
+ERR_CACHE_OPTIONS = "Error : invalid cache options"
+ERR_DAEMON_OPTIONS = "Error : invalid daemon options"
+ERR_DAEMON_SOCKET = "Error : \"{}\" is not a socket"
+ERR_DAEMON_RUNNING = "Error : a daemon is already listening on \"{}\""
+ERR_INVALID_JSON_REQUEST = "Error : the request is not a valid json object"
+ERR_DAEMON_COMMAND = "Error : \"{}\" is not a valid command"
+MSG_DAEMON = "Listening on {} with {} workers."
+MSG_FLOAT_REBOUNCES = "Rebounces : {} in float64, {} in float32, {} without match."
+MSG_FLOAT_DIVERGENCE = "Bounce point divergence : max {:.3g}, mean {:.3g}, " \
+                     + "{} rebounces diverging by more than {} pixel."
+MSG_FLOAT_FIRST = "First divergence : light ray {}, rebounce {}."
+MSG_COVERAGE = "Mean coverage : {:.2f}%"
+MSG_CYCLE = "Light ray {} fell into a cycle of length {} after {} rebounces. " \
+          + "Skipping the {} remaining rebounces."
+NULL_VECTOR = Vector3D.zero()
+BOUNDS_MARGIN = 0.001
+MAX_RAYS = 10000
+MIN_WEIGHT = 0.01
+BATCH_SIZE = 64
+NB_COVERAGE_SAMPLES = 16
+CACHE_DIRECTORY = ".tracecache"
+CACHE_SIZE = 64
+CACHE_EXTENSION = ".json"
+CACHE_VERSION = 1
+MEMORY_SIZE = 64
+BOX_MEMORY_SIZE = 16384
+CIRCLE_MEMORY_SIZE = 2048
+RAY_MEMORY_SIZE = 1024
+DIVERGENCE_TOLERANCE = 0.5
 
 class Scene(object):
     """ Class containing the informations on a scene and the objects it contains.
+
+    A scene is never modified once created, so that it can be traced any 
+    number of times and shared between threads or processes.
     
     Attributes:
         width (float): The width of the scene.
         height (float): The height of the scene.
         center (Point3D): The center of the scene.
         objects (list of Box, Circle): The objects present in the scene.
-        lightRay (Ray, None): The light ray, if present in the scene. 
+        lightRays (list of Ray): The light rays emitted in the scene. 
+        lightRay (Ray, None): The additional light ray, whose intensity 
+                              is not part of the scene's cache key.
+        maxRays (int): The maximum number of light rays traced, including
+                       the rays spawned by partial reflections.
+        minWeight (float): The weight under which a light ray is no longer
+                           traced.
+        floatSize (int): The number of bits of the floats the points of 
+                         rebounce and the directions of the light rays are
+                         rounded to, 64 except for reportFloatPrecision.
     """
     def __init__(self, jsonData, lightRay):
         """ Creates an instance of scene.
@@ -50,33 +161,221 @@ class Scene(object):
         Attributes:
             jsonData (dict): The json data containing the information of the scene
                              to be instanciated.
-            lightRay (Ray, None): The initial light ray, if present in the scene.
+            lightRay (Ray, None): An additional light ray, emitted along the 
+                                  ones specified in the json data.
         """
         self.width = jsonData.get('width')
         self.height = jsonData.get('height')
         self.center = Point3D(self.width/2, self.height/2, 0)
         self.objects = [ Box(self.center, self.width, self.height) ]
+        self.lightRays = []
         self.lightRay = lightRay
+        self.maxRays = jsonData.get('max-rays', MAX_RAYS)
+        self.minWeight = jsonData.get('min-weight', MIN_WEIGHT)
+        self.floatSize = 64
 
         for o in jsonData.get('objects'):          
             type = o.get('type')  
             c = o.get('center')
             center = Point3D(c[0], c[1], 0) 
 
+            transmission = o.get('transmission', 0.0)
+
             if type == "circle":
                 radius = o.get('radius')
-                self.objects.append( Circle(center, radius) )
+                self.objects.append( Circle(center, radius, transmission) )
             elif type == "box":
                 width  = o.get('width')
                 height = o.get('height')
-                self.objects.append( Box(center, width, height) )
+                self.objects.append( Box(center, width, height, transmission) )
+
+        for l in jsonData.get('lights', []):
+            origin = Point3D(l.get('origin')[0], l.get('origin')[1], 0)
+            direction = Vector3D(l.get('direction')[0], l.get('direction')[1], 0)
+            self.lightRays.append( Ray(origin, direction, l.get('intensity')) )
+
+        if (lightRay != None):
+            self.lightRays.append(lightRay)
+
+        self.compile()
+
+    def compile(self):
+        """ Precomputes the constants used by the intersection routines of
+        each object of the scene.
+
+        Must be called again if an object of the scene is modified.
+        """
+        for o in self.objects:
+            o.compile()
+
+    def nextRebounce(self, lightRay):
+        """ Finds the first object a light ray rebounces on.
+
+        Args:
+            lightRay (Ray): The incident light ray.
+
+        Returns:
+            (Ray, int), (None, None): The reflected light ray and the index of
+                                      the object it rebounced on, if exists.
+        """
+        minDistance = float('inf')
+        nextLightRay = None
+        nextObject = None
+
+        for i, o in enumerate(self.objects):                    
+            reflectedRay = o.reflectedRay(lightRay)
+
+            if (reflectedRay != None):
+                distance = reflectedRay.origin.distance(lightRay.origin)
+                if (distance < minDistance): 
+                    minDistance = distance
+                    nextLightRay = reflectedRay                
+                    nextObject = i
+
+        return (nextLightRay, nextObject)
+
+    def withLightRay(self, lightRay):
+        """ Returns a copy of self with an additional light ray. 
+        
+        The copy shares the objects of self, which are already compiled.
+
+        Args:
+            lightRay (Ray): The additional light ray.
+
+        Returns:
+            Scene: The copy.
+        """
+        scene = copy.copy(self)
+        scene.lightRays = self.lightRays + [lightRay]
+        scene.lightRay = lightRay
 
-    def drawScene(self):
+        return scene
+
+    def getMemorySize(self):
+        """ Returns an estimate of the memory taken by self, in bytes.
+        """
+        return sum(BOX_MEMORY_SIZE if isinstance(o, Box) else CIRCLE_MEMORY_SIZE \
+                   for o in self.objects) + RAY_MEMORY_SIZE * len(self.lightRays)
+
+    def getCacheKey(self):
+        """ Returns the key of self in a trace cache.
+
+        The key is a hash of everything the light rays' trajectories depend
+        on, written in a canonical form : the numbers are all written as 
+        floats, so that "400" and "400.0" give the same key. The intensity 
+        of self.lightRay is left out, since TraceCache adapts the cached 
+        rebounces to it.
+
+        Returns:
+            str: The hexadecimal SHA-1 hash of self.
+        """
+        lights = [l for l in self.lightRays if l is not self.lightRay]
+        data = {"version": CACHE_VERSION,
+                "size": [float(self.width), float(self.height)],
+                "max-rays": int(self.maxRays),
+                "min-weight": float(self.minWeight),
+                "objects": [o.getKey() for o in self.objects[1:]],
+                "lights": [l.getKey() + [float(l.intensity)] for l in lights],
+                "ray": self.lightRay.getKey() if self.lightRay != None else None}
+        text = json.dumps(data, sort_keys=True, separators=(',', ':'))
+
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def startTrace(self):
+        """ Returns the state of a new trace of self.lightRays.
+
+        Returns:
+            TraceState: The state, with the light rays queued.
+        """
+        state = TraceState()
+
+        for lightRay in self.lightRays:
+            state.spawn(lightRay, lightRay is self.lightRay, self.maxRays)
+
+        return state
+
+    def traceLightRays(self, state=None):
+        """ Traces the trajectories of the light rays, one rebounce at a time.
+
+        The pending light ray segments are kept in a work queue and processed
+        in batches of BATCH_SIZE. When a light ray rebounces on an object 
+        letting part of the light through, a transmitted light ray is spawned
+        and queued, unless self.maxRays light rays have already been traced.
+        A light ray stops when its intensity runs out, when its weight falls 
+        under self.minWeight or when it falls into a cycle. 
+
+        The light rays coming from self.lightRay are said to be variable. 
+        The segments of variable light rays stopped by their intensity are
+        kept in the trace state, so that the trace can be resumed with a
+        greater intensity.
+
+        Args:
+            state (TraceState, None): The state of a trace to resume. A new
+                                      trace of self.lightRays is started if
+                                      None.
+
+        Yields:
+            Rebounce: The rebounces, in the order they are traced.
+        """
+        if (state == None):
+            state = self.startTrace()
+
+        pending = state.pending
+
+        while (len(pending) > 0):
+            batch = [pending.popleft() for i in range(min(BATCH_SIZE, len(pending)))]
+            results = [self.nextRebounce(b[2]) for b in batch]
+
+            if (self.floatSize == 32):
+                roundRays([r[0] for r in results if r[0] != None])
+
+            for (noRay, index, lightRay, detector, variable), \
+                    (nextLightRay, noObject) in zip(batch, results):
+                if (nextLightRay == None):
+                    continue
+
+                transmission = self.objects[noObject].transmission
+                if (transmission > 0):
+                    nextLightRay.weight *= 1 - transmission 
+
+                rebounce = Rebounce(noRay, index, lightRay, nextLightRay, \
+                                    noObject, variable)
+                
+                # Every segment of a cycle has been traced once the cycle is
+                # detected. The remaining rebounces would only trace them again.
+                if (detector.update(noObject, nextLightRay)):
+                    rebounce.cycleLength = detector.cycleLength
+                elif (nextLightRay.weight >= self.minWeight):
+                    segment = (noRay, index + 1, nextLightRay, detector, variable)
+
+                    if (nextLightRay.intensity >= 0):
+                        pending.append(segment)
+                    elif (variable):
+                        state.stopped.append(segment)
+
+                if (transmission > 0 and \
+                        lightRay.weight * transmission >= self.minWeight):
+                    transmittedRay = Ray(nextLightRay.origin, lightRay.direction, \
+                                         nextLightRay.intensity, nextLightRay.normal, \
+                                         lightRay.weight * transmission)
+                    state.spawn(transmittedRay, variable, self.maxRays)
+
+                yield rebounce
+
+    def drawScene(self, filename, cache=None):
         """ Draws the scene and saves the results to an image.
 
         Produces an image with the dimensions of the scene. The boxes and
-        circles are drawn in black. If present, the light ray's trajectory 
-        is drawn in orange.
+        circles are drawn in black. If present, the light rays' trajectories
+        are drawn in orange.
+
+        Args:
+            filename (str): The name of the image file.
+            cache (TraceCache, None): The cache of the traced rebounces, if
+                                      any.
+
+        Returns:
+            list of str: The messages of the light rays falling into cycles.
         """         
         image = Image.new('RGB', (self.width, self.height), (255,255,255))
         draw  = ImageDraw.Draw(image)
@@ -84,26 +383,167 @@ class Scene(object):
         for o in self.objects[1:]:
             o.drawObject(draw)
 
-        # If a light ray was specified
-        while(self.lightRay != None and self.lightRay.intensity >= 0):            
-            minDistance = float('inf')
-            nextLightRay = None
+        if (cache != None):
+            records = cache.getRecords(self)
+        else:
+            records = (r.getRecord() for r in self.traceLightRays())
 
-            for o in self.objects:                    
-                lightRay = o.reflectedRay(self.lightRay)
+        messages = []
 
-                if (lightRay != None):
-                    distance = lightRay.origin.distance(self.lightRay.origin)
-                    if (distance < minDistance): 
-                        minDistance = distance
-                        nextLightRay = lightRay                
-                
-            if (nextLightRay != None):        
-                draw.line( (self.lightRay.origin.x, self.lightRay.origin.y, \
-                            nextLightRay.origin.x, nextLightRay.origin.y), \
-                            fill= "orange" )
-            self.lightRay = nextLightRay
-        image.save(sys.argv[2])
+        for x1, y1, x2, y2, noRay, index, cycleLength, variable, intensity \
+                in records:
+            draw.line( (x1, y1, x2, y2), fill= "orange" )
+
+            if (cycleLength != None):
+                messages.append(MSG_CYCLE.format(noRay, cycleLength, index + 1, \
+                                                 int(intensity) + 1))
+        image.save(filename)
+
+        return messages
+
+    def reportFloatPrecision(self, out):
+        """ Traces the light rays with 64-bit and with 32-bit floats and 
+        writes a report comparing the two : the number of rebounces of each
+        one, the distances between the matching points of rebounce and the
+        first rebounce diverging by more than DIVERGENCE_TOLERANCE pixel.
+
+        Rebounces match when they have the same light ray number and index.
+
+        Args:
+            out (file): The opened stream to write the report to.
+        """
+        points = []
+
+        for floatSize in [64, 32]:
+            scene = copy.copy(self)
+            scene.floatSize = floatSize
+            points.append(dict(((r.noRay, r.index), r.nextLightRay.origin) \
+                               for r in scene.traceLightRays()))
+
+        keys = sorted(set(points[0]) & set(points[1]))
+        distances = [points[0][k].distance(points[1][k]) for k in keys]
+        diverging = [k for k, d in zip(keys, distances) if d > DIVERGENCE_TOLERANCE]
+
+        out.write(MSG_FLOAT_REBOUNCES.format(len(points[0]), len(points[1]), \
+                  len(points[0]) + len(points[1]) - 2 * len(keys)) + "\n")
+        out.write(MSG_FLOAT_DIVERGENCE.format(max(distances + [0.0]), \
+                  sum(distances) / max(len(distances), 1), len(diverging), \
+                  DIVERGENCE_TOLERANCE) + "\n")
+
+        if (len(diverging) > 0):
+            first = min(diverging, key=lambda k: (k[1], k[0]))
+            out.write(MSG_FLOAT_FIRST.format(first[0], first[1] + 1) + "\n")
+
+    def writeTrace(self, stream):
+        """ Writes the light rays' rebounces to a stream, as they are traced.
+
+        Each rebounce is written as a JSON object on its own line (NDJSON),
+        holding the light ray's number, the rebounce's index along that light
+        ray, its coordinates, the index of the object it rebounced on (0 being
+        the scene's borders) and the normal of the surface at the point of 
+        rebounce. When a light ray falls into a cycle, a line holding the 
+        cycle's length is written.
+
+        Args:
+            stream (file): The opened stream to write to.
+        """
+        for r in self.traceLightRays():
+            p = r.nextLightRay.origin
+            n = r.nextLightRay.normal
+            record = {"ray": r.noRay, "index": r.index, "x": p.x, "y": p.y, \
+                      "object": r.noObject, "normal": [n.x, n.y]}
+            stream.write(json.dumps(record, sort_keys=True, \
+                                    separators=(',', ':')) + "\n")
+
+            if (r.cycleLength != None):
+                record = {"ray": r.noRay, "cycle": r.cycleLength, \
+                          "rebounces": r.index + 1}
+                stream.write(json.dumps(record, sort_keys=True, \
+                                        separators=(',', ':')) + "\n")
+
+    def coverageRow(self, y, light, nbSamples, step, seed):
+        """ Estimates the coverage of a row of cells by an area light.
+
+        The light is sampled at "nbSamples" jittered points, one in each of 
+        "nbSamples" equal parts of the light. The random generator only 
+        depends on "seed" and "y", which makes the result independent of the
+        order in which the rows are computed.
+
+        Args:
+            y (int): The index of the row.
+            light (LineSegment): The area light.
+            nbSamples (int): The number of light samples per cell.
+            step (int): The size of a cell, in pixels.
+            seed (int): The seed of the random generator.
+
+        Returns:
+            list of float: The fraction of the light visible from the center
+                           of each cell of the row.
+        """
+        random = Random(seed * self.height + y)
+        occluders = self.objects[1:]
+        dx = light.p2.x - light.p1.x
+        dy = light.p2.y - light.p1.y
+        py = (y + 0.5) * step
+        row = []
+
+        for x in range(0, (self.width + step - 1) // step):
+            point = Point3D((x + 0.5) * step, py, 0)
+            nbVisible = 0
+
+            for k in range(0, nbSamples):
+                s = (k + random.random()) / nbSamples
+                sample = Point3D(light.p1.x + s*dx, light.p1.y + s*dy, 0)
+
+                if (not any(o.occludes(point, sample) for o in occluders)):
+                    nbVisible += 1
+
+            row.append(float(nbVisible) / nbSamples)
+
+        return row
+
+    def drawCoverage(self, filename, light, nbSamples, step, seed, nbWorkers):
+        """ Draws the coverage of the scene by an area light and saves the
+        results to an image.
+
+        Produces a grayscale image with the dimensions of the scene, where
+        each cell of "step" x "step" pixels is as bright as the fraction of
+        the light visible from its center. The rows of cells are distributed
+        among "nbWorkers" processes. The boxes and circles are drawn in black.
+
+        Args:
+            filename (str): The name of the image file.
+            light (LineSegment): The area light.
+            nbSamples (int): The number of light samples per cell.
+            step (int): The size of a cell, in pixels.
+            seed (int): The seed of the random generator.
+            nbWorkers (int): The number of processes.
+
+        Returns:
+            float: The mean coverage of the scene.
+        """
+        nbRows = (self.height + step - 1) // step
+        args = [(self, y, light, nbSamples, step, seed) for y in range(0, nbRows)]
+
+        if (nbWorkers > 1):
+            pool = Pool(nbWorkers)
+            rows = pool.map(coverageRow, args)
+            pool.close()
+            pool.join()
+        else:
+            rows = [coverageRow(a) for a in args]
+
+        image = Image.new('L', (len(rows[0]), nbRows))
+        image.putdata([int(round(255 * c)) for row in rows for c in row])
+        image = image.resize((len(rows[0]) * step, nbRows * step)) \
+                     .crop((0, 0, self.width, self.height)).convert('RGB')
+        draw = ImageDraw.Draw(image)
+
+        for o in self.objects[1:]:
+            o.drawObject(draw)
+        image.save(filename)
+
+        return sum(sum(row) for row in rows) / (nbRows * len(rows[0]))
 
     def __repr__(self):
         """ Returns a string representation of self.
@@ -116,18 +556,549 @@ class Scene(object):
             
         return s
         
+class Rebounce(object):
+    """ Class containing the informations on a light ray's rebounce.
+
+    Attributes:
+        noRay (int): The number of the light ray, in the order it was queued.
+        index (int): The index of the rebounce along the light ray's trajectory.
+        lightRay (Ray): The incident light ray.
+        nextLightRay (Ray): The reflected light ray.
+        noObject (int): The index of the object the light ray rebounced on.
+        cycleLength (int, None): The length of the cycle closed by the 
+                                 rebounce, if any.
+        variable (bool): True if the light ray comes from the scene's 
+                         additional light ray, False otherwise.
+    """
+    def __init__(self, noRay, index, lightRay, nextLightRay, noObject, \
+                 variable=False):
+        """ Creates an instance of rebounce.
+        """
+        self.noRay = noRay
+        self.index = index
+        self.lightRay = lightRay
+        self.nextLightRay = nextLightRay
+        self.noObject = noObject
+        self.cycleLength = None
+        self.variable = variable
+
+    def getRecord(self):
+        """ Returns what drawing self requires, as stored in a trace cache.
+
+        Returns:
+            list: The coordinates x1, y1, x2, y2 of the traced segment, the
+                  light ray's number, the rebounce's index, the cycle's
+                  length, whether the light ray is variable and the 
+                  intensity of the reflected light ray.
+        """
+        p1 = self.lightRay.origin
+        p2 = self.nextLightRay.origin
+
+        return [p1.x, p1.y, p2.x, p2.y, self.noRay, self.index, \
+                self.cycleLength, self.variable, self.nextLightRay.intensity]
+
+class CycleDetector(object):
+    """ Class detecting the periodic cycles of a light ray's rebounces.
+
+    Uses Brent's algorithm, which only keeps a single saved state in memory
+    no matter how long the trace is. A state is made of the object a light
+    ray rebounced on, the point of rebounce and the reflected direction. Two
+    states are the same when their points and directions are equal within
+    the tolerance of "is_close".
+
+    Attributes:
+        power (int): The number of rebounces before the saved state is replaced.
+        distance (int): The number of rebounces since the state was saved.
+        savedState (tuple, None): The saved (object, point, direction) state.
+        cycleLength (int, None): The length of the detected cycle, if any.
+    """
+    def __init__(self):
+        """ Creates an instance of cycle detector.
+        """
+        self.power = 1
+        self.distance = 0
+        self.savedState = None
+        self.cycleLength = None
+
+    def update(self, noObject, lightRay):
+        """ Registers a rebounce and verifies if it closes a cycle.
+
+        Args:
+            noObject (int): The index of the object the light ray rebounced on.
+            lightRay (Ray): The reflected light ray.
+
+        Returns:
+            bool: True if the rebounce closes a cycle, False otherwise.
+        """
+        state = (noObject, lightRay.origin, lightRay.direction)
+
+        if (self.savedState == None):
+            self.savedState = state
+            return False
+
+        self.distance += 1
+
+        if (state[0] == self.savedState[0] and \
+                state[1] == self.savedState[1] and \
+                state[2] == self.savedState[2]):
+            self.cycleLength = self.distance
+            return True
+
+        if (self.distance == self.power):
+            self.savedState = state
+            self.power *= 2
+            self.distance = 0
+
+        return False
+
+    def toJson(self):
+        """ Returns the json data representing self.
+        """
+        state = None
+
+        if (self.savedState != None):
+            noObject, p, d = self.savedState
+            state = [noObject, p.x, p.y, d.x, d.y]
+
+        return [self.power, self.distance, state]
+
+    @staticmethod
+    def fromJson(data):
+        """ Returns the cycle detector represented by json data returned by
+        toJson.
+        """
+        detector = CycleDetector()
+        detector.power, detector.distance, state = data
+
+        if (state != None):
+            detector.savedState = (state[0], Point3D(state[1], state[2], 0), \
+                                   Vector3D(state[3], state[4], 0))
+
+        return detector
+
+class TraceState(object):
+    """ Class containing the progress of a trace, so that it can be resumed.
+
+    A light ray segment is a tuple (noRay, index, lightRay, detector, 
+    variable), where the light ray's number is None for a light ray not
+    queued yet.
+
+    Attributes:
+        pending (deque of tuple): The light ray segments left to trace.
+        stopped (list of tuple): The segments of variable light rays 
+                                 stopped because their intensity ran out.
+        nbRays (int): The number of light rays queued.
+        capped (bool): True if a light ray was not queued because the 
+                       maximum number of light rays was reached.
+    """
+    def __init__(self):
+        """ Creates an instance of trace state.
+        """
+        self.pending = deque()
+        self.stopped = []
+        self.nbRays = 0
+        self.capped = False
+
+    def spawn(self, lightRay, variable, maxRays):
+        """ Queues a new light ray, if its intensity allows it.
+
+        Args:
+            lightRay (Ray): The light ray.
+            variable (bool): True if the light ray is variable.
+            maxRays (int): The maximum number of light rays queued.
+        """
+        segment = (None, 0, lightRay, CycleDetector(), variable)
+
+        if (lightRay.intensity < 0):
+            if (variable):
+                self.stopped.append(segment)
+        elif (self.nbRays < maxRays):
+            self.pending.append( (self.nbRays,) + segment[1:] )
+            self.nbRays += 1
+        else:
+            self.capped = True
+
+    def resume(self, shift, maxRays):
+        """ Raises the intensity of the stopped light rays and queues again 
+        the ones it allows.
+
+        Args:
+            shift (float): The increase of the intensity.
+            maxRays (int): The maximum number of light rays queued.
+        """
+        stopped = self.stopped
+        self.stopped = []
+
+        for segment in stopped:
+            noRay, index, lightRay, detector, variable = segment
+            lightRay.intensity += shift
+
+            if (noRay == None):
+                self.spawn(lightRay, variable, maxRays)
+            elif (lightRay.intensity >= 0):
+                self.pending.append(segment)
+            else:
+                self.stopped.append(segment)
+
+    def toJson(self):
+        """ Returns the json data representing the stopped light rays of 
+        self, which must have no pending segment left.
+        """
+        return {"stopped": [[noRay, index, lightRay.toJson(), detector.toJson()] \
+                            for noRay, index, lightRay, detector, variable \
+                            in self.stopped],
+                "nb-rays": self.nbRays,
+                "capped": self.capped}
+
+    @staticmethod
+    def fromJson(data):
+        """ Returns the trace state represented by json data returned by 
+        toJson.
+        """
+        state = TraceState()
+        state.stopped = [(noRay, index, Ray.fromJson(ray), \
+                          CycleDetector.fromJson(detector), True) \
+                         for noRay, index, ray, detector in data["stopped"]]
+        state.nbRays = data["nb-rays"]
+        state.capped = data["capped"]
+
+        return state
+
+class TraceCache(object):
+    """ Class storing the rebounces traced in scenes to the disk, one json 
+    file per scene, named after the scene's cache key.
+
+    A file holds the intensity of the scene's additional light ray, the 
+    records of the rebounces (see Rebounce.getRecord) and the trace state. 
+    The rebounces for a lower intensity are a subset of the cached ones. For
+    a greater intensity, the trace is resumed from the stopped light rays,
+    unless the maximum number of light rays was reached, since the light 
+    rays left out would then depend on the intensity.
+
+    The files are touched when read. Once the cache exceeds its maximum 
+    size, the least recently used files are deleted.
+
+    Attributes:
+        directory (str): The directory of the files.
+        maxSize (int): The maximum size of the files, in bytes.
+    """
+    def __init__(self, directory, maxSize):
+        """ Creates an instance of trace cache.
+        """
+        self.directory = directory
+        self.maxSize = maxSize
+
+    def getRecords(self, scene):
+        """ Returns the records of the rebounces traced in a scene, tracing
+        the ones not in the cache.
+
+        Args:
+            scene (Scene): The scene.
+
+        Returns:
+            list of list: The records, in the order the rebounces were 
+                          traced.
+        """
+        filename = os.path.join(self.directory, scene.getCacheKey() + CACHE_EXTENSION)
+        intensity = scene.lightRay.intensity if scene.lightRay != None else 0
+        entry = self.read(filename)
+
+        if (entry != None):
+            shift = intensity - entry["intensity"]
+            state = TraceState.fromJson(entry["state"])
+
+            if (shift == 0 or (shift < 0 and not state.capped)):
+                os.utime(filename, None)
+                return shiftRecords(entry["records"], shift)
+
+            if (not state.capped):
+                state.resume(shift, scene.maxRays)
+                records = shiftRecords(entry["records"], shift) \
+                        + [r.getRecord() for r in scene.traceLightRays(state)]
+
+                if (not state.capped):
+                    self.write(filename, intensity, records, state)
+                    return records
+
+        state = scene.startTrace()
+        records = [r.getRecord() for r in scene.traceLightRays(state)]
+        self.write(filename, intensity, records, state)
+
+        return records
+
+    def read(self, filename):
+        """ Returns the cached data of a file, None if it can't be read.
+        """
+        try:
+            with open(filename) as stream:
+                return json.load(stream)
+        except (IOError, ValueError):
+            return None
+
+    def write(self, filename, intensity, records, state):
+        """ Writes the cached data of a scene to a file, then evicts the 
+        least recently used files.
+
+        The data is written to a temporary file first, then renamed, so that
+        a file is never read half written.
+
+        Args:
+            filename (str): The name of the file.
+            intensity (float): The intensity of the scene's additional light
+                               ray.
+            records (list of list): The records of the rebounces.
+            state (TraceState): The state of the trace.
+        """
+        temporary = "{}.{}.tmp".format(filename, os.getpid())
+
+        with open(temporary, "w") as stream:
+            json.dump({"intensity": intensity, "records": records, \
+                       "state": state.toJson()}, stream, separators=(',', ':'))
+        os.rename(temporary, filename)
+        self.evict(filename)
+
+    def evict(self, keptFilename):
+        """ Deletes the least recently used files until the size of the 
+        cache is at most self.maxSize. 
+
+        Args:
+            keptFilename (str): The name of a file never deleted.
+        """
+        files = []
+
+        for name in os.listdir(self.directory):
+            filename = os.path.join(self.directory, name)
+
+            if (name.endswith(CACHE_EXTENSION)):
+                try:
+                    files.append( (os.path.getmtime(filename), \
+                                   os.path.getsize(filename), filename) )
+                except OSError:
+                    continue
+
+        size = sum(f[1] for f in files)
+
+        for mtime, fileSize, filename in sorted(files):
+            if (size <= self.maxSize):
+                break
+
+            if (filename != keptFilename):
+                try:
+                    os.remove(filename)
+                except OSError:
+                    pass
+                size -= fileSize
+
+class SceneCache(object):
+    """ Class keeping the recently used scenes in memory, parsed and 
+    compiled, without their additional light ray. 
+
+    A scene is found again as long as its file is not modified. Once the 
+    estimated memory taken by the scenes exceeds its maximum, the least 
+    recently used scenes are dropped. Each worker process of a render 
+    daemon has its own scene cache.
+
+    Attributes:
+        maxSize (int): The maximum memory taken by the scenes, in bytes.
+        scenes (OrderedDict): The scenes and their memory size, indexed by
+                              file name and modification time, from the 
+                              least to the most recently used.
+        size (int): The memory taken by the scenes, in bytes.
+        nbHits (int): The number of scenes found in memory.
+        nbMisses (int): The number of scenes read from their file.
+        lock (Lock): The lock protecting the attributes of self.
+    """
+    def __init__(self, maxSize):
+        """ Creates an instance of scene cache.
+        """
+        self.maxSize = maxSize
+        self.scenes = OrderedDict()
+        self.size = 0
+        self.nbHits = 0
+        self.nbMisses = 0
+        self.lock = Lock()
+
+    def getScene(self, filename):
+        """ Returns the scene described in a json file, without additional
+        light ray.
+
+        Args:
+            filename (str): The name of the file, relative to this program.
+
+        Returns:
+            Scene: The scene.
+        """
+        filename = getScenePath(filename)
+        key = (filename, os.path.getmtime(filename))
+
+        with self.lock:
+            if (key in self.scenes):
+                self.nbHits += 1
+                self.scenes[key] = self.scenes.pop(key)
+                return self.scenes[key][0]
+            self.nbMisses += 1
+
+        with open(filename) as stream:
+            try:
+                scene = Scene(json.load(stream), None)
+            except Exception:
+                raise ValueError(ERR_INVALID_JSON)
+        size = scene.getMemorySize()
+
+        with self.lock:
+            if (key not in self.scenes):
+                self.scenes[key] = (scene, size)
+                self.size += size
+
+            while (self.size > self.maxSize and len(self.scenes) > 1):
+                oldScene, oldSize = self.scenes.popitem(last=False)[1]
+                self.size -= oldSize
+
+        return scene
+
+class RenderDaemon(ThreadingMixIn, UnixStreamServer):
+    """ Class of the server rendering the requests received on a UNIX 
+    socket, each connection being served by its own thread. 
+
+    The rendering is done by a process pool. Only the name of the scene file
+    and the light ray's parameters are sent to the worker processes, which 
+    keep the parsed scenes in their own scene cache.
+
+    Attributes:
+        pool (Pool): The process pool.
+        cache (TraceCache, None): The cache of the traced rebounces, if any.
+        nbRequests (int): The number of requests served.
+        nbFailures (int): The number of failed requests.
+        nbHits (int): The number of scenes found in the memory of a worker.
+        nbMisses (int): The number of scenes read from their file.
+        workers (dict): The number of scenes and the memory they take in
+                        each worker process, indexed by process id, as of
+                        its last request.
+        latencies (dict): The number of requests, the total and the maximum
+                          latency of each command (None for the invalid 
+                          ones), in seconds.
+        lock (Lock): The lock protecting the counters of self.
+    """
+    daemon_threads = True
+
+    def __init__(self, address, pool, cache):
+        """ Creates an instance of render daemon listening on a socket.
+        """
+        UnixStreamServer.__init__(self, address, DaemonRequestHandler)
+        self.pool = pool
+        self.cache = cache
+        self.nbRequests = 0
+        self.nbFailures = 0
+        self.nbHits = 0
+        self.nbMisses = 0
+        self.workers = {}
+        self.latencies = {}
+        self.lock = Lock()
+
+    def serveRequest(self, request):
+        """ Serves a request and returns the response.
+
+        Args:
+            request (dict): The request, having a "command", and a "scene",
+                            an "output" and optionally a "ray" for the 
+                            "render" and "trace" commands.
+
+        Returns:
+            dict: The response, having a "status" which is "done" or 
+                  "failed", along with the "messages" of the render or the
+                  "error", or the counters for the "stats" command.
+        """
+        start = time()
+        command = request.get("command")
+
+        if (command == "stats"):
+            return self.getStats()
+
+        try:
+            if (command not in ["render", "trace"]):
+                command = None
+                raise ValueError(ERR_DAEMON_COMMAND.format(request.get("command")))
+
+            messages, hit, worker = self.pool.apply(renderRequest, \
+                ((command, request["scene"], request.get("ray"), \
+                  request["output"], self.cache),))
+            response = {"status": "done", "output": request["output"], \
+                        "messages": messages}
+        except Exception as e:
+            response = {"status": "failed", "error": str(e)}
+            hit = None
+
+        latency = time() - start
+
+        with self.lock:
+            if (hit != None):
+                self.nbHits += hit
+                self.nbMisses += not hit
+                self.workers[worker[0]] = worker[1:]
+
+            self.nbRequests += 1
+            self.nbFailures += response["status"] == "failed"
+            count, total, maximum = self.latencies.get(command, (0, 0.0, 0.0))
+            self.latencies[command] = (count + 1, total + latency, max(maximum, latency))
+
+        return response
+
+    def getStats(self):
+        """ Returns the counters of self and of the scene caches of its 
+        workers.
+
+        Returns:
+            dict: The counters, the latencies being in seconds.
+        """
+        with self.lock:
+            return {"status": "done", 
+                    "requests": self.nbRequests,
+                    "failures": self.nbFailures,
+                    "hits": self.nbHits,
+                    "misses": self.nbMisses,
+                    "scenes": sum(n for n, size in self.workers.values()),
+                    "memory": sum(size for n, size in self.workers.values()),
+                    "latencies": dict((c or "invalid", {"count": n, "mean": t / n, "max": m}) \
+                                      for c, (n, t, m) in self.latencies.items())}
+
+class DaemonRequestHandler(StreamRequestHandler):
+    """ Class serving a connection to a render daemon, one request per line,
+    until the client closes it.
+    """
+    def handle(self):
+        """ Answers the requests of the connection, in order.
+        """
+        for line in iter(self.rfile.readline, b""):
+            try:
+                request = json.loads(line.decode("utf-8"))
+                response = self.server.serveRequest(request)
+            except (ValueError, AttributeError):
+                response = {"status": "failed", "error": ERR_INVALID_JSON_REQUEST}
+
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
 class Circle(object):
     """ Class containing the informations of the a circle.
 
     Attributes:
         center (Point3D): The center of the circle.
         radius (float):   The radius of the circle.
+        transmission (float): The fraction of the light passing through the 
+                              circle instead of being reflected.
     """
-    def __init__(self, center, radius):
+    def __init__(self, center, radius, transmission=0.0):
         """ Creates an instance of circle.
         """
         self.center = center
         self.radius = radius
+        self.transmission = transmission
+
+    def compile(self):
+        """ Precomputes the squared and inverse radius of self.
+        """
+        self.squareRadius = self.radius ** 2
+        self.inverseRadius = 1.0 / self.radius
 
     def drawObject(self, draw):
         """ Draws self to an image using the draw attribute.
@@ -148,6 +1119,12 @@ class Circle(object):
         return "A circle of radius {}, centered in ({},{})" \
             .format(self.radius, self.center.x, self.center.y)
 
+    def getKey(self):
+        """ Returns the data identifying self in a scene's cache key.
+        """
+        return ["circle", float(self.center.x), float(self.center.y), \
+                float(self.radius), float(self.transmission)]
+
     def reflectedRay(self, lightRay):
         """ Returns the light ray reflected on self and originating
         from "lightRay", if exists. 
@@ -162,16 +1139,16 @@ class Circle(object):
 
         a = lightRay.direction.square_norm()
         b = 2 * lightRay.direction.dot_product(distance)
-        c = distance.square_norm() - self.radius ** 2
+        c = distance.square_norm() - self.squareRadius
         d = b**2 - 4*a*c
-        s = 1
 
         # no intersection
         if (d < 0):
             return None
         
-        t1 = (-b - sqrt(b**2 - 4*a*c))/(2*a)
-        t2 = (-b + sqrt(b**2 - 4*a*c))/(2*a)
+        sqrtD = sqrt(d)
+        t1 = (-b - sqrtD)/(2*a)
+        t2 = (-b + sqrtD)/(2*a)
 
         # no intersection
         if (t1 < 0.001 and t2 < 0.001):
@@ -186,10 +1163,42 @@ class Circle(object):
         origin = Point3D(lightRay.origin.x + lightRay.direction.x*t,
                          lightRay.origin.y + lightRay.direction.y*t,
                          lightRay.origin.z + lightRay.direction.z*t)
-        normal = origin - self.center
-        direction = lightRay.direction.reflect(normal)
+        normal = self.inverseRadius * (origin - self.center)
+
+        return reflectOn(lightRay, origin, normal)
 
-        return Ray(origin, direction, lightRay.intensity - 1)
+    def occludes(self, origin, target):
+        """ Verifies if self stands between two points.
+
+        Unlike reflectedRay, no point of intersection or reflection is 
+        computed.
+
+        Args:
+            origin (Point3D): The first point.
+            target (Point3D): The second point.
+
+        Returns:
+            bool: True if the line segment from "origin" to "target" goes 
+                  through self, False otherwise.
+        """
+        distance = origin - self.center
+        c = distance.square_norm() - self.squareRadius
+
+        # origin inside of the circle
+        if (c <= 0):
+            return True
+
+        direction = target - origin
+        a = direction.square_norm()
+        b = 2 * direction.dot_product(distance)
+        d = b**2 - 4*a*c
+
+        # the line misses the circle, or the circle is behind origin
+        if (d < 0 or b >= 0):
+            return False
+
+        # closest intersection, which must come before target
+        return (-b - sqrt(d)) / (2*a) <= 1.0
     
 class Box(object):
     """ Class containing the information on a box.
@@ -200,13 +1209,18 @@ class Box(object):
         height (float):   The height of the box.
         lineSegments (list of LineSegments): The list of the four line segments
                                              making up the box.
+        transmission (float): The fraction of the light passing through the 
+                              box instead of being reflected.
+        bounds (float, float, float, float): The box's min x, min y, max x and
+                                             max y, widened by BOUNDS_MARGIN.
     """    
-    def __init__(self, center, width, height):
+    def __init__(self, center, width, height, transmission=0.0):
         """ Creates a box
         """
         self.center = center
         self.width = width
         self.height = height
+        self.transmission = transmission
       
         p1 = Point3D(center.x - width/2, center.y - height/2, 0)
         p2 = Point3D(center.x + width/2, center.y - height/2, 0)
@@ -218,6 +1232,83 @@ class Box(object):
                              LineSegment(p3, p4), \
                              LineSegment(p4, p1)]
 
+    def compile(self):
+        """ Precomputes the bounds of self and the constants of its line 
+        segments.
+        """
+        p1 = self.lineSegments[0].p1
+        p3 = self.lineSegments[2].p1
+        self.bounds = (p1.x - BOUNDS_MARGIN, p1.y - BOUNDS_MARGIN, \
+                       p3.x + BOUNDS_MARGIN, p3.y + BOUNDS_MARGIN)
+
+        for seg in self.lineSegments:
+            seg.compile()
+
+    def isHitBy(self, lightRay):
+        """ Verifies if a light ray goes through the bounds of self.
+
+        Args:
+            lightRay (Ray): The light ray to verify.
+
+        Returns:
+            bool: False if the light ray can't intersect with self, True
+                  otherwise.
+        """
+        return self.crossesBounds(lightRay.origin, lightRay.direction, float('inf'))
+
+    def occludes(self, origin, target):
+        """ Verifies if self stands between two points.
+
+        Since the box is axis-aligned, testing its bounds is enough. Unlike 
+        reflectedRay, no point of intersection is computed.
+
+        Args:
+            origin (Point3D): The first point.
+            target (Point3D): The second point.
+
+        Returns:
+            bool: True if the line segment from "origin" to "target" goes 
+                  through self, False otherwise.
+        """
+        return self.crossesBounds(origin, target - origin, 1.0)
+
+    def crossesBounds(self, o, d, tMax):
+        """ Verifies if the points o + t*d, with t between 0 and tMax, go 
+        through the bounds of self.
+
+        Args:
+            o (Point3D): The origin of the points.
+            d (Vector3D): The direction of the points.
+            tMax (float): The upper bound of t.
+
+        Returns:
+            bool: True if any of the points is inside the bounds, False 
+                  otherwise.
+        """
+        minX, minY, maxX, maxY = self.bounds
+        tMin = 0.0
+
+        # Slab method : intersecting the ray's intervals along both axis
+        if (d.x == 0):
+            if (o.x < minX or o.x > maxX):
+                return False
+        else:
+            t1 = (minX - o.x) / d.x
+            t2 = (maxX - o.x) / d.x
+            tMin = max(tMin, min(t1, t2))
+            tMax = min(tMax, max(t1, t2))
+
+        if (d.y == 0):
+            if (o.y < minY or o.y > maxY):
+                return False
+        else:
+            t1 = (minY - o.y) / d.y
+            t2 = (maxY - o.y) / d.y
+            tMin = max(tMin, min(t1, t2))
+            tMax = min(tMax, max(t1, t2))
+
+        return tMin <= tMax
+
     def drawObject(self, draw):
         """ Draws self to an image using the draw attribute.
 
@@ -244,10 +1335,15 @@ class Box(object):
         minPoint = None
         minDistance = float('inf')
 
+        if (not self.isHitBy(lightRay)):
+            return None
+
+        rayLine = Line(lightRay.origin, lightRay.direction)
+
         # find the closest point of intersection between the ray and the box (if any).
         # Requires verifying each of the 4 segments.
         for seg in self.lineSegments:
-            point = seg.intersection(lightRay)
+            point = seg.intersection(lightRay, rayLine)
 
             if(isinstance(point, Point3D)):
                 distance = point.distance(lightRay.origin)
@@ -255,14 +1351,10 @@ class Box(object):
                 if (distance < minDistance and distance != 0):
                     minPoint = point
                     minDistance = distance
-                    dx = seg.p2.x - seg.p1.x
-                    dy = seg.p2.y - seg.p1.y
-                    normal = Vector3D(-dy, dx, 0)
+                    normal = seg.normal
   
         if (minPoint != None):
-            direction =  lightRay.direction.reflect(normal) 
-            reflectedRay = Ray(minPoint, direction, lightRay.intensity - 1)
-
+            reflectedRay = reflectOn(lightRay, minPoint, normal)
  
         return reflectedRay
             
@@ -273,12 +1365,22 @@ class Box(object):
         return "A box of width {} and height {}, centered in ({},{})" \
             .format(self.width, self.height, self.center.x, self.center.y)
 
+    def getKey(self):
+        """ Returns the data identifying self in a scene's cache key.
+        """
+        return ["box", float(self.center.x), float(self.center.y), \
+                float(self.width), float(self.height), float(self.transmission)]
+
 class LineSegment(object):
     """ Class containing the informations of a line segment.
 
     Attributes:
         p1 (Point3D): The point at the start of the line segment.
         p2 (Point3D): The point at the end of the line segment.
+        line (Line): The infinite line associated with the line segment.
+        normal (Vector3D): The unit normal of the line segment, pointing
+                           outside of a box going clockwise.
+        minX, minY, maxX, maxY (float): The bounds of the line segment.
     """
     def __init__(self, p1, p2):
         """ Creates a line segment.
@@ -286,11 +1388,27 @@ class LineSegment(object):
         self.p1 = p1
         self.p2 = p2
 
-    def intersection(self, ray):
+    def compile(self):
+        """ Precomputes the line, normal and bounds of self.
+        """
+        dx = self.p2.x - self.p1.x
+        dy = self.p2.y - self.p1.y
+
+        self.line = Line(self.p1, Vector3D(dx, dy, 0))
+        self.normal = Vector3D(dy, -dx, 0)
+        self.normal.normalize()
+        self.minX = min(self.p1.x, self.p2.x)
+        self.maxX = max(self.p1.x, self.p2.x)
+        self.minY = min(self.p1.y, self.p2.y)
+        self.maxY = max(self.p1.y, self.p2.y)
+
+    def intersection(self, ray, rayLine=None):
         """ Returns the intersection between self and line ray "ray", if exists.
 
         Args:  
             ray (Ray): The ray that may intersect with self.
+            rayLine (Line, None): The infinite line associated with "ray", if 
+                                  already built.
      
         Returns:
             Point3D, None: The point of the intersection, if that point is unique. 
@@ -299,10 +1417,10 @@ class LineSegment(object):
         """
         # Step 1 : find the intersection point of the infinite lines associated
         # with segment line "self" and line ray "ray" 
-        line1 = Line(self.p1, Vector3D(self.p2.x - self.p1.x, self.p2.y - self.p1.y, 0))
-        line2 = Line(ray.origin, ray.direction)
+        if (rayLine == None):
+            rayLine = Line(ray.origin, ray.direction)
 
-        point = line1.intersection(line2)
+        point = self.line.intersection(rayLine)
 
         if (isinstance(point, Point3D) == False or point == ray.origin):
             return None
@@ -310,20 +1428,10 @@ class LineSegment(object):
         # step 2 : Verify that the point is both inside the line segment "self" and
         # the line ray "ray"
 
-        # For both axis, find min and max for line segment
-        if (self.p1.x < self.p2.x):
-            minSegX = self.p1.x
-            maxSegX = self.p2.x
-        else:
-            minSegX = self.p2.x
-            maxSegX = self.p1.x
-
-        if (self.p1.y < self.p2.y):
-            minSegY = self.p1.y
-            maxSegY = self.p2.y
-        else:
-            minSegY = self.p2.y
-            maxSegY = self.p1.y
+        minSegX = self.minX
+        maxSegX = self.maxX
+        minSegY = self.minY
+        maxSegY = self.maxY
         
         # For both axis, find min and max for line ray
         if (ray.direction.x > 0):
@@ -363,13 +1471,18 @@ class Ray(object):
         origin (Point3D): The origin of the ray.
         direction (Vector3D): The direction vector of the ray.
         intensity (int): The number of time the ray can rebounce.
+        normal (Vector3D, None): The unit normal of the surface the ray was
+                                 reflected on, if any.
+        weight (float): The fraction of the emitted light carried by the ray.
     """
-    def __init__(self, origin, direction, intensity):
+    def __init__(self, origin, direction, intensity, normal=None, weight=1.0):
         """ Creates a line ray
         """
         self.origin = origin
         self.direction = direction
         self.intensity = intensity   
+        self.normal = normal
+        self.weight = weight
 
     def __repr__(self):
         """ Returns a string representation of self.
@@ -377,6 +1490,34 @@ class Ray(object):
         return "A ray of intensity {}, oriented at {}, {}, centered in ({},{})" \
                     .format(self.intensity, self.direction.x, self.direction.y, \
                             self.origin.x, self.origin.y) 
+
+    def getKey(self):
+        """ Returns the data identifying self in a scene's cache key, 
+        without its intensity.
+        """
+        return [float(self.origin.x), float(self.origin.y), \
+                float(self.direction.x), float(self.direction.y)]
+
+    def toJson(self):
+        """ Returns the json data representing self.
+        """
+        n = self.normal
+        normal = [n.x, n.y] if n != None else None
+
+        return [self.origin.x, self.origin.y, self.direction.x, \
+                self.direction.y, self.intensity, normal, self.weight]
+
+    @staticmethod
+    def fromJson(data):
+        """ Returns the ray represented by json data returned by toJson.
+        """
+        ox, oy, dx, dy, intensity, normal, weight = data
+
+        if (normal != None):
+            normal = Vector3D(normal[0], normal[1], 0)
+
+        return Ray(Point3D(ox, oy, 0), Vector3D(dx, dy, 0), intensity, \
+                   normal, weight)
        
 class Line(object):
     """ Class containing the informations of an infinite line.
@@ -384,12 +1525,14 @@ class Line(object):
     Attributes:
         point (Point3D): a point along the line.
         direction (Vector3D): The direction of the line.
+        point2 (Point3D): The point following "point" along the line.
     """
     def __init__(self, point, direction):
         """ Creates an instance of line.
         """
         self.point = point
         self.direction = direction
+        self.point2 = Point3D(point.x + direction.x, point.y + direction.y, 0)
 
     def intersection(self, line):
         """ Returns the intersection between self and another line.
@@ -401,9 +1544,7 @@ class Line(object):
             Point3D, Line, None: The result of the intersection, which may be empty,
                                  a single point or the entire line. 
         """
-        nullVector = Vector3D.zero()
-
-        if(self.direction == nullVector or line.direction == nullVector):
+        if(self.direction == NULL_VECTOR or line.direction == NULL_VECTOR):
             # No intersection
             return None
 
@@ -412,7 +1553,7 @@ class Line(object):
 
         # choosing another point p2 to represent "line" if p1 == p2
         if (p1 == p2):
-            p2 = Point3D(p2.x + line.direction.x, p2.y + line.direction.y, p2.z + line.direction.z)
+            p2 = line.point2
 
         if (line.contains(p1)):
             if (self.contains(p2)):
@@ -459,25 +1600,186 @@ class Line(object):
         Returns:
             bool: True if self contains "point", false otherwise.
         """
-        p1 = self.point
-        p2 = Point3D(p1.x + self.direction.x, p1.y + self.direction.y, 0)
-         
-        p1p0 = point - p1
-        p1p2 = point - p2
+        p1p0 = point - self.point
+        p1p2 = point - self.point2
+
+        return (p1p0.cross_product(p1p2) == NULL_VECTOR)
+
+def reflectOn(lightRay, point, normal):
+    """ Returns the light ray reflected at a point of a surface.
+
+    The normal given to the reflected light ray is the one facing the incident
+    light ray. "normal" itself is left unchanged.
+
+    Args:
+        lightRay (Ray): The incident light ray.
+        point (Point3D): The point of rebounce.
+        normal (Vector3D): A unit normal of the surface at "point".
+
+    Returns:
+        Ray: The reflected light ray.
+    """
+    dot = lightRay.direction.dot_product(normal)
 
-        return (p1p0.cross_product(p1p2) == Vector3D.zero())
+    if (dot > 0):
+        normal = -normal
+        dot = -dot
+
+    direction = lightRay.direction - (2 * dot) * normal
+
+    return Ray(point, direction, lightRay.intensity - 1, normal, lightRay.weight)
             
     
-def loadScene():
+def roundRays(rays):
+    """ Rounds the origins and directions of light rays to 32-bit floats, as
+    if they were stored in 32-bit buffers. The coordinates of all the light 
+    rays go through a single array.
+
+    Args:
+        rays (list of Ray): The light rays, which are modified.
+    """
+    coordinates = array('f', [c for r in rays for c in \
+                              (r.origin.x, r.origin.y, r.direction.x, r.direction.y)])
+
+    for k, r in enumerate(rays):
+        x, y, dx, dy = coordinates[4*k:4*k+4]
+        r.origin = Point3D(x, y, 0)
+        r.direction = Vector3D(dx, dy, 0)
+
+def shiftRecords(records, shift):
+    """ Returns the records of rebounces as traced with an intensity raised 
+    by "shift", which must be negative for a lower intensity if the trace 
+    did not reach the maximum number of light rays.
+
+    Only the intensity of the variable light rays changes. The rebounces 
+    they no longer reach, the incident light ray's intensity becoming 
+    negative, are left out.
+
+    Args:
+        records (list of list): The records of the rebounces.
+        shift (float): The increase of the intensity.
+
+    Returns:
+        list of list: The records of the shifted rebounces.
+    """
+    if (shift == 0):
+        return records
+
+    return [r[:8] + [r[8] + shift] if r[7] else r \
+            for r in records if not r[7] or r[8] + 1 + shift >= 0]
+
+def renderRequest(args):
+    """ Renders a request of a render daemon, in a process of its pool.
+
+    Args:
+        args (tuple): The command ("render" or "trace"), the name of the 
+                      scene file, the light ray's parameters or None, the 
+                      name of the output file and the cache of the traced 
+                      rebounces, if any.
+
+    Returns:
+        (list of str, bool, tuple): The messages of the light rays falling
+                                    into cycles, whether the scene was found
+                                    in the worker's memory, and the process
+                                    id, number of scenes and memory size of
+                                    the worker's scene cache.
+    """
+    command, filename, ray, output, cache = args
+    nbHits = workerScenes.nbHits
+    scene = workerScenes.getScene(filename)
+    hit = workerScenes.nbHits > nbHits
+
+    if (ray != None):
+        scene = scene.withLightRay(parseLightRay(ray))
+
+    if (command == "trace"):
+        with open(output, "w") as stream:
+            scene.writeTrace(stream)
+        messages = []
+    else:
+        messages = scene.drawScene(output, cache)
+
+    return (messages, hit, (os.getpid(), len(workerScenes.scenes), workerScenes.size))
+
+def initDaemonWorker(memorySize):
+    """ Makes a worker process of a render daemon ignore the interruptions 
+    (Ctrl-C), which are left to the daemon, and gives it a scene cache.
+
+    Args:
+        memorySize (int): The maximum memory taken by the worker's scenes,
+                          in bytes.
+    """
+    global workerScenes
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    workerScenes = SceneCache(memorySize)
+
+def checkDaemonSocket(path):
+    """ Removes the socket file left by a daemon which did not stop cleanly.
+    Exits if the file is not a socket, or if a daemon is listening on it.
+
+    Args:
+        path (str): The path of the socket.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except OSError:
+        return
+
+    if (not stat.S_ISSOCK(mode)):
+        print(ERR_DAEMON_SOCKET.format(path))
+        sys.exit(0)
+
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        client.connect(path)
+        client.close()
+        print(ERR_DAEMON_RUNNING.format(path))
+        sys.exit(0)
+    except socket.error:
+        client.close()
+
+    os.remove(path)
+
+def coverageRow(args):
+    """ Calls Scene.coverageRow with the packed arguments "args", so that it
+    can be mapped by a process pool.
+    """
+    return args[0].coverageRow(*args[1:])
+
+def getScenePath(filename):
+    """ Returns the path of a scene file, given relative to this program.
+    """
+    cwd = os.path.dirname(os.path.realpath(__file__))
+
+    return cwd + "/" + filename
+
+def parseLightRay(text):
+    """ Returns the light ray of parameters "OX,OY,DX,DY,I". Raises a 
+    ValueError if they are not 5 numbers.
+    """
+    params = [float(s) for s in text.split(",")]
+
+    if (len(params) != 5):
+        raise ValueError(ERR_LIGHT_RAY_PARAMS)
+
+    origin = Point3D(params[0], params[1], 0)
+    direction = Vector3D(params[2], params[3], 0)
+
+    return Ray(origin, direction, params[4])
+
+def loadScene(rayArg=3):
     """ Returns the scene using data (json file path, light ray parameters) 
     specified in argv.
+
+    Args:
+        rayArg (int): The index in argv of the light ray parameters.
     
     Returns:
         Scene: The loaded scene. 
     """
     # Opening Json file
-    cwd = os.path.dirname(os.path.realpath(__file__))
-    sceneFile = cwd + "/" + sys.argv[1]
+    sceneFile = getScenePath(sys.argv[1])
 
     try:
         jsonData = json.loads(open(sceneFile).read())
@@ -488,17 +1790,13 @@ def loadScene():
     lightRay = None
 
     # creating Ray object if the parameters were specified
-    if (len(sys.argv) > 3):
-        params = [float(s) for s in sys.argv[3].split(",")]
-        if (len(params) != 5):
+    if (len(sys.argv) > rayArg):
+        try:
+            lightRay = parseLightRay(sys.argv[rayArg])
+        except ValueError:
             print(ERR_LIGHT_RAY_PARAMS)
             sys.exit(0)
 
-        origin = Point3D(params[0], params[1], 0)
-        direction = Vector3D(params[2], params[3], 0)
-        intensity = params[4]
-        lightRay = Ray(origin, direction, intensity)
-
     # creating scene object
     try:
        scene = Scene(jsonData, lightRay)
@@ -508,17 +1806,138 @@ def loadScene():
 
     return scene
                       
-""" Main
-"""
-nbArgs = len(sys.argv)
+def parseOptions(validOptions):
+    """ Removes the options (arguments starting with "--") from argv and
+    returns them.
 
-if (nbArgs < 2):
-    print(ERR_NB_PARAMS)
-    sys.exit(0)
+    An option may be given a value with the form "--name=value".
 
-scene = loadScene()
-print scene
+    Args:
+        validOptions (list of string): The names of the accepted options.
 
-if (nbArgs > 2):
-    scene.drawScene()
-        
+    Returns:
+        dict: The value of each specified option, indexed by name. Options
+              specified without a value are associated with None.
+    """
+    options = {}
+
+    for arg in sys.argv[1:]:
+        if (arg.startswith("--")):
+            name, _, value = arg[2:].partition("=")
+
+            if (name not in validOptions):
+                print(ERR_INVALID_OPTION.format(arg))
+                sys.exit(0)
+            options[name] = value if value != "" else None
+
+    sys.argv = [arg for arg in sys.argv if not arg.startswith("--")]
+
+    return options
+
+if __name__ == "__main__":
+    options = parseOptions(["trace", "coverage", "samples", "step", "seed", "workers", \
+                            "cache", "cache-size", "daemon", "memory", \
+                            "float-report"])
+    nbArgs = len(sys.argv)
+    cache = None
+
+    if ("cache" in options or "cache-size" in options):
+        directory = options.get("cache") or CACHE_DIRECTORY
+
+        try:
+            maxSize = int(float(options.get("cache-size") or CACHE_SIZE) * 1024 * 1024)
+
+            if (not os.path.isdir(directory)):
+                os.makedirs(directory)
+        except (ValueError, OSError):
+            maxSize = -1
+
+        if (maxSize < 0):
+            print(ERR_CACHE_OPTIONS)
+            sys.exit(0)
+        cache = TraceCache(directory, maxSize)
+
+    if ("daemon" in options):
+        try:
+            nbWorkers = int(options.get("workers") or cpu_count())
+            memorySize = int(float(options.get("memory") or MEMORY_SIZE) * 1024 * 1024)
+        except ValueError:
+            nbWorkers = 0
+
+        if (not options["daemon"] or nbArgs != 1 or nbWorkers < 1 or memorySize < 0):
+            print(ERR_DAEMON_OPTIONS)
+            sys.exit(0)
+
+        checkDaemonSocket(options["daemon"])
+        pool = Pool(nbWorkers, initDaemonWorker, (memorySize // nbWorkers,))
+        server = RenderDaemon(options["daemon"], pool, cache)
+        print(MSG_DAEMON.format(options["daemon"], nbWorkers))
+        sys.stdout.flush()
+
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+        server.server_close()
+        pool.terminate()
+        os.remove(options["daemon"])
+        sys.exit(0)
+
+    if (nbArgs < 2):
+        print(ERR_NB_PARAMS)
+        sys.exit(0)
+
+    if ("float-report" in options):
+        scene = loadScene(rayArg=2)
+        print scene
+        scene.reportFloatPrecision(sys.stdout)
+        sys.exit(0)
+
+    if ("trace" in options):
+        if (nbArgs != 4):
+            print(ERR_TRACE_PARAMS)
+            sys.exit(0)
+
+        scene = loadScene()
+
+        if (sys.argv[2] == "-"):
+            scene.writeTrace(sys.stdout)
+        else:
+            with open(sys.argv[2], "w") as stream:
+                scene.writeTrace(stream)
+        sys.exit(0)
+
+    if ("coverage" in options):
+        if (nbArgs != 3):
+            print(ERR_COVERAGE_PARAMS)
+            sys.exit(0)
+
+        try:
+            l = [float(s) for s in options["coverage"].split(",")]
+            light = LineSegment(Point3D(l[0], l[1], 0), Point3D(l[2], l[3], 0))
+            nbSamples = int(options.get("samples") or NB_COVERAGE_SAMPLES)
+            step = int(options.get("step") or 1)
+            seed = int(options.get("seed") or 0)
+            nbWorkers = int(options.get("workers") or 1)
+        except:
+            print(ERR_COVERAGE_OPTIONS)
+            sys.exit(0)
+
+        if (len(l) != 4 or nbSamples < 1 or step < 1 or nbWorkers < 1):
+            print(ERR_COVERAGE_OPTIONS)
+            sys.exit(0)
+
+        scene = loadScene()
+        print scene
+        coverage = scene.drawCoverage(sys.argv[2], light, nbSamples, step, \
+                                      seed, nbWorkers)
+        print(MSG_COVERAGE.format(100 * coverage))
+        sys.exit(0)
+
+    scene = loadScene()
+    print scene
+
+    if (nbArgs > 2):
+        for message in scene.drawScene(sys.argv[2], cache):
+            print(message)
\ No newline at end of file
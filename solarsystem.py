@@ -0,0 +1,517 @@
+"""
+UQAM - Winter 2018 - INF5071 - Group 20 - solarsystem.py
+
+This module contains the tools used to load a solar system from a json file
+and to compute its motion, without Blender. The planets follow elliptical
+orbits around the star, with the star at one of their foci, and the moons 
+follow elliptical orbits around their planet. All orbits lie in the xy plane
+and start at their periapsis (the point closest to their focus), on the x 
+axis.
+
+The positions of every body are computed for a whole range of frames at
+once, so that the Blender script only has to copy them to the objects. The
+animation lasts 10 seconds, from frame FRAME_START to frame FRAME_END at
+FRAME_RATE frames per second.
+
+When every period is a whole number of frames, the animation loops after
+the least common multiple of the periods, so that the frames of the
+following loops only repeat the first ones (see getFrameSources).
+
+The motion of the bodies may instead be simulated under gravity by nbody.py,
+which writes their positions to an array file referenced as "positions" in
+the json file. The solar system may then also have belts of small bodies.
+
+The animation is rendered with one of the PROFILES, trading quality for
+speed : "draft" and "review" to iterate on a solar system, "final" for the
+lossless video.
+
+author : Alexis Chretien (CHRA25049209)
+"""
+import json
+import os
+import sys
+from math import sin, cos, sqrt, pi
+
+FRAME_START = 1
+FRAME_END = 240
+FRAME_RATE = 24
+WORKER_PREFIX = "@worker "
+PROFILE_OPTION = "--profile="
+RESOLUTION = 1080
+KEPLER_TOLERANCE = 1e-12
+KEPLER_MAX_ITERATIONS = 50
+
+ERR_INV_FILE = "Error : file \"{}\" does not exist."
+ERR_INV_JSON_FILE = "Error : invalid JSON file."
+ERR_GCD = "Error : called gcd with param a or b == 0."
+ERR_PROFILE = "Error : unknown profile \"{}\", which must be one of :"
+MSG_LOOP = "The animation loops every {} frames : {} of the {} frames are " \
+         + "rendered, {:.1%} less."
+MSG_PROFILE = "Profile \"{}\" : {} frames of {}x{} pixels, spheres of {} faces, " \
+            + "about {:.1%} of the cost of a final render."
+
+class SolarSystem(object):
+    """ Class containing the informations on a solar system.
+
+    Attributes:
+        star (Star): The solar system's star.
+        planets (list of Planets): The solar system's planets.
+        belts (list of Belt): The solar system's belts of small bodies.
+        positions (string, None): The path of the array file holding the
+                                  simulated positions of the bodies, None
+                                  if they follow their orbits.
+    """
+    def __init__(self, star, planets, belts=None, positions=None):
+        """ Creates an instance of solar system.
+        """
+        self.star = star
+        self.planets = planets
+        self.belts = belts if belts != None else []
+        self.positions = positions
+ 
+class Star(object):
+    """ Class containing the informations on a star.
+
+    Attributes:
+        radius (float): The star's radius.
+        color (int, int, int): The star's RGB colors.
+        mass (float): The star's mass, for the simulation.
+        location (float, float, float): The star's xyz location.
+    """    
+    def __init__(self, radius, color, mass=0.0):
+        """ Creates an instance of star. 
+        """
+        self.radius = radius
+        self.color = color
+        self.mass = mass
+        self.location = (0.0, 0.0, 0.0)
+
+class Planet(object):
+    """ Class containing the information on a planet, or on a moon.
+
+    Attributes:
+        radius (float): The planet's radius
+        color (int, int, int): The planet's RGB colors.
+        distance (float): The semi-major axis of the planet's orbit around
+                          the star (around its planet, for a moon).
+        period (float): The number of frames required for the planet to
+                        complete an orbit around the star, not necessarily 
+                        a whole number.
+        eccentricity (float): The eccentricity of the orbit, in [0, 1).
+        moons (list of Planet): The planet's moons.
+        mass (float): The planet's mass, for the simulation.
+        velocity (float, float, None): The planet's initial xy velocity
+                                       relative to the body it orbits, for
+                                       the simulation. None for the velocity
+                                       of its elliptical orbit.
+        location (float, float, float): The planet's xyz location.
+    """ 
+    def __init__(self, radius, color, distance, period, eccentricity=0.0, \
+                 moons=None, mass=0.0, velocity=None):
+        """ Creates an instance of planet.
+        """
+        self.radius = radius
+        self.color = color
+        self.distance = distance
+        self.period = period
+        self.eccentricity = eccentricity
+        self.moons = moons if moons != None else []
+        self.mass = mass
+        self.velocity = velocity
+        self.location = (distance * (1 - eccentricity), 0, 0)
+
+class Belt(object):
+    """ Class containing the information on a belt of small bodies without
+    mass, placed at random on circular orbits around the star.
+
+    Attributes:
+        count (int): The number of bodies.
+        inner (float): The inner radius of the belt.
+        outer (float): The outer radius of the belt.
+        radius (float): The radius of the bodies.
+        color (int, int, int): The bodies' RGB colors.
+        seed (int): The seed of the random placement of the bodies.
+    """
+    def __init__(self, count, inner, outer, radius, color, seed=0):
+        """ Creates an instance of belt.
+        """
+        self.count = count
+        self.inner = inner
+        self.outer = outer
+        self.radius = radius
+        self.color = color
+        self.seed = seed
+
+class RenderProfile(object):
+    """ Class containing the settings of a rendering of the animation.
+
+    Attributes:
+        name (string): The profile's name.
+        percentage (int): The percentage of RESOLUTION rendered.
+        step (int): The number of frames between two rendered frames, a
+                    divisor of FRAME_RATE so that the animation keeps its
+                    duration.
+        quality (string): The quality of the OGG video encoded by Blender,
+                          a value of its "constant_rate_factor".
+        gopSize (int): The number of frames between two key frames of the
+                       video, 0 for key frames only.
+        videoQuality (int): The quality of the video encoded by ffmpeg from
+                            the frames, from 0 to 10.
+        nbLon (int): The number of longitudes of the spheres.
+        nbLat (int): The number of latitudes of the spheres.
+        antialiasing (bool): Whether the frames are antialiased.
+    """
+    def __init__(self, name, percentage, step, quality, gopSize, videoQuality, \
+                 nbLon, nbLat, antialiasing):
+        """ Creates an instance of render profile.
+        """
+        self.name = name
+        self.percentage = percentage
+        self.step = step
+        self.quality = quality
+        self.gopSize = gopSize
+        self.videoQuality = videoQuality
+        self.nbLon = nbLon
+        self.nbLat = nbLat
+        self.antialiasing = antialiasing
+
+    def getResolution(self):
+        """ Returns the width and height of the rendered frames, in pixels.
+
+        >>> PROFILES["draft"].getResolution()
+        270
+        """
+        return RESOLUTION * self.percentage // 100
+
+    def getFrames(self):
+        """ Returns the rendered frames.
+
+        >>> len(PROFILES["draft"].getFrames()), len(PROFILES["final"].getFrames())
+        (60, 240)
+        """
+        return list(range(FRAME_START, FRAME_END + 1, self.step))
+
+    def getNbFaces(self):
+        """ Returns the number of triangles of a sphere.
+        """
+        return 2 * self.nbLon * self.nbLat
+
+    def getCost(self):
+        """ Returns the expected cost of a rendering with this profile,
+        relative to the cost of a final one, the time spent rendering being
+        roughly proportional to the number of pixels rendered.
+
+        >>> [PROFILES[name].getCost() for name in ["draft", "review", "final"]]
+        [0.015625, 0.125, 1.0]
+        """
+        final = PROFILES["final"]
+
+        return float(self.getResolution()**2 * len(self.getFrames())) \
+             / (final.getResolution()**2 * len(final.getFrames()))
+
+    def __str__(self):
+        """ Returns the report on the profile's expected cost.
+        """
+        size = self.getResolution()
+
+        return MSG_PROFILE.format(self.name, len(self.getFrames()), size, size, \
+                                  self.getNbFaces(), self.getCost())
+
+PROFILES = {
+    "draft": RenderProfile("draft", 25, 4, 'MEDIUM', FRAME_RATE, 5, 12, 6, False),
+    "review": RenderProfile("review", 50, 2, 'HIGH', FRAME_RATE, 8, 24, 12, True),
+    "final": RenderProfile("final", 100, 1, 'LOSSLESS', 0, 10, 32, 16, True)
+}
+DEFAULT_PROFILE = "final"
+
+def getProfile(name):
+    """ Returns the render profile having a name, exiting with the list of
+    the profiles if there is none.
+
+    Args:
+        name (string, None): The name of the profile, DEFAULT_PROFILE if None.
+    """
+    if (name == None):
+        name = DEFAULT_PROFILE
+
+    if (name not in PROFILES):
+        print(ERR_PROFILE.format(name))
+
+        for n in ["draft", "review", "final"]:
+            print(PROFILES[n])
+        sys.exit(0)
+
+    return PROFILES[name]
+
+def loadSolarSystem(file):
+    """ Returns the solar system specified in a json file, exiting if the
+    file is not valid.
+    
+    Args:
+        file (string): The path of the json file, relative to the directory
+                       of this module.
+    """
+    cwd = os.path.dirname(os.path.realpath(__file__))
+    solarSystemFile = os.path.join(cwd, file)
+
+    # Fetching json data from file
+    try:
+        jsonData = json.loads(open(solarSystemFile).read())
+    except:
+        print(ERR_INV_FILE.format(file))
+        sys.exit(0)
+
+    # Parsing json file data
+    try:
+        starData = jsonData.get('star')
+        planetsData = jsonData.get('planets')       
+        radius = starData.get('radius')
+        color = starData.get('color')
+        star = Star( radius, color, starData.get('mass', 0.0) )
+        planets = []
+        belts = []
+
+        for p in planetsData:
+            radius = p.get('radius')
+            color = p.get('color')
+            distance = p.get('distance-from-star')         
+            period = p.get('period')
+            eccentricity = p.get('eccentricity', 0.0)
+            moons = []
+
+            for m in p.get('moons', []):
+                moons.append( Planet(m.get('radius'), m.get('color'), \
+                                     m.get('distance-from-planet'), \
+                                     m.get('period'), m.get('eccentricity', 0.0), \
+                                     None, m.get('mass', 0.0), m.get('velocity')) )
+            planets.append( Planet(radius, color, distance, period, \
+                                   eccentricity, moons, p.get('mass', 0.0), \
+                                   p.get('velocity')) )
+
+        for b in jsonData.get('belts', []):
+            belts.append( Belt(int(b.get('count')), b.get('inner'), \
+                               b.get('outer'), b.get('radius'), b.get('color'), \
+                               b.get('seed', 0)) )
+
+        # The periods may be fractional, the animation then not looping
+        for b in getBodies(planets):
+            if (b.period <= 0 or not 0 <= b.eccentricity < 1 or b.mass < 0):
+                raise ValueError
+
+        for b in belts:
+            if (b.count < 0 or not 0 < b.inner <= b.outer):
+                raise ValueError
+
+        # The belts are only simulated
+        positions = jsonData.get('positions')
+
+        if (positions != None):
+            positions = os.path.join(cwd, positions)
+        elif (len(belts) > 0):
+            raise ValueError
+    except:
+        print(ERR_INV_JSON_FILE)     
+        sys.exit(0)
+    
+    return SolarSystem( star, planets, belts, positions )
+
+def solveKepler(meanAnomaly, eccentricity):
+    """ Solves Kepler's equation, M = E - e*sin(E), for the eccentric anomaly
+    E, using Newton's method.
+
+    Args:
+        meanAnomaly (float): The mean anomaly M, in radians.
+        eccentricity (float): The eccentricity e of the orbit, in [0, 1).
+
+    Returns:
+        float: The eccentric anomaly E, in radians.
+
+    >>> solveKepler(1.0, 0.0)
+    1.0
+    >>> E = solveKepler(1.0, 0.5)
+    >>> abs(E - 0.5 * sin(E) - 1.0) < 1e-12
+    True
+    """
+    E = meanAnomaly if eccentricity < 0.8 else pi
+
+    for i in range(0, KEPLER_MAX_ITERATIONS):
+        delta = (E - eccentricity * sin(E) - meanAnomaly) \
+              / (1.0 - eccentricity * cos(E))
+        E -= delta
+
+        if (abs(delta) < KEPLER_TOLERANCE):
+            break
+
+    return E
+
+def getOrbitPositions(distance, period, eccentricity, frames):
+    """ Computes the positions of a body on its orbit, relative to the body
+    it orbits, for a range of frames.
+
+    The body starts at its periapsis at frame 0 and completes its orbit in
+    "period" frames, sweeping equal areas in equal times.
+
+    Args:
+        distance (float): The semi-major axis of the orbit.
+        period (float): The number of frames required to complete the orbit.
+        eccentricity (float): The eccentricity of the orbit, in [0, 1).
+        frames (list of int): The frames.
+
+    Returns:
+        list of (float, float): The xy positions of the body at each frame.
+
+    >>> [(round(x, 6), round(y, 6)) for x, y in getOrbitPositions(2, 4, 0, [0, 1])]
+    [(2.0, 0.0), (0.0, 2.0)]
+    >>> [round(x, 6) for x, y in getOrbitPositions(2, 4, 0.5, [0, 2])]
+    [1.0, -3.0]
+    """
+    minorAxis = distance * sqrt(1.0 - eccentricity**2)
+    positions = []
+
+    for f in frames:
+        E = solveKepler(2*pi * (f % period) / period, eccentricity)
+        positions.append( (distance * (cos(E) - eccentricity), minorAxis * sin(E)) )
+
+    return positions
+
+def getBodyPositions(planets, frames):
+    """ Computes the positions of the planets and of their moons for a range
+    of frames.
+
+    The bodies are ordered as in getBodies.
+
+    Args:
+        planets (list of Planet): The planets, having the attributes
+                                  "distance", "period", "eccentricity" and
+                                  "moons", a list of planets.
+        frames (list of int): The frames.
+
+    Returns:
+        list of list of float: The xyz coordinates of every body, one after
+                               the other, at each frame.
+
+    >>> class Body(object):
+    ...     def __init__(self, distance, period, moons=[]):
+    ...         self.distance = distance
+    ...         self.period = period
+    ...         self.eccentricity = 0.0
+    ...         self.moons = moons
+    >>> rows = getBodyPositions([Body(2, 4, [Body(1, 2)])], [0, 1])
+    >>> [[round(c, 6) for c in row] for row in rows]
+    [[2.0, 0.0, 0.0, 3.0, 0.0, 0.0], [0.0, 2.0, 0.0, -1.0, 2.0, 0.0]]
+    """
+    rows = [[] for f in frames]
+
+    for p in planets:
+        orbit = getOrbitPositions(p.distance, p.period, p.eccentricity, frames)
+
+        for row, (x, y) in zip(rows, orbit):
+            row.extend( (x, y, 0.0) )
+
+        for m in p.moons:
+            moonOrbit = getOrbitPositions(m.distance, m.period, m.eccentricity, \
+                                          frames)
+
+            for row, (x, y), (mx, my) in zip(rows, orbit, moonOrbit):
+                row.extend( (x + mx, y + my, 0.0) )
+
+    return rows
+
+def getBodies(planets):
+    """ Returns the planets and their moons, each planet being followed by
+    its moons.
+
+    Args:
+        planets (list of Planet): The planets.
+    """
+    bodies = []
+
+    for p in planets:
+        bodies.append(p)
+        bodies.extend(p.moons)
+
+    return bodies
+
+def getMaxDistance(planets):
+    """ Returns the greatest distance between the star and a planet or a moon
+    during their orbits.
+
+    Args:
+        planets (list of Planet): The planets.
+    """
+    return max([p.distance * (1 + p.eccentricity) + \
+                max([m.distance * (1 + m.eccentricity) for m in p.moons] + [0]) \
+                for p in planets] + [0])
+
+def gcd(a, b):
+    """ Returns the greatest common divisor of two integers, exiting if one
+    of them is 0.
+
+    >>> gcd(12, 18), gcd(7, 5)
+    (6, 1)
+    """
+    if (a == 0 or b == 0):
+        print(ERR_GCD)
+        sys.exit(0)
+
+    while (b != 0):
+        a, b = b, a % b
+
+    return abs(a)
+
+def getLoopLength(planets):
+    """ Returns the number of frames after which every planet and moon is
+    back at its initial position, the least common multiple of their
+    periods. Returns None if a period is not a whole number of frames.
+
+    Args:
+        planets (list of Planet): The planets.
+
+    >>> class Body(object):
+    ...     def __init__(self, period, moons=[]):
+    ...         self.period = period
+    ...         self.moons = moons
+    >>> getLoopLength([Body(12, [Body(8)]), Body(30)])
+    120
+    >>> getLoopLength([Body(12), Body(2.5)]) == None
+    True
+    """
+    length = 1
+
+    for b in getBodies(planets):
+        if (b.period != int(b.period)):
+            return None
+        length = length * int(b.period) // gcd(length, int(b.period))
+
+    return length
+
+def getFrameSources(frames, loopLength):
+    """ Returns, for each frame, the first frame showing the same positions
+    of the bodies, the animation looping every loopLength frames. The 
+    frames to render are then the distinct sources, which come first.
+
+    Args:
+        frames (list of int): The frames of the animation, in increasing
+                              order.
+        loopLength (int, None): The number of frames of a loop, None if the
+                                animation does not loop.
+
+    Returns:
+        list of int: The source of each frame.
+
+    >>> getFrameSources([1, 2, 3, 4, 5, 6, 7], 3)
+    [1, 2, 3, 1, 2, 3, 1]
+    >>> getFrameSources([1, 5, 9, 13, 17], 6)
+    [1, 5, 9, 1, 5]
+    >>> getFrameSources([1, 2, 3], None)
+    [1, 2, 3]
+    """
+    if (loopLength == None):
+        return list(frames)
+
+    sources = {}
+
+    for f in frames:
+        sources.setdefault(f % loopLength, f)
+
+    return [sources[f % loopLength] for f in frames]
@@ -2,10 +2,12 @@
 UQAM - Winter 2018 - INF5017 - Group 20 - q3.py
 
 This module allows the user to display on standard output the content of a
-wavefront (.obj) file associated with a sphere or torus. Content may be 
-redirected to a file using a pipe.
+wavefront (.obj) file associated with a sphere, a torus or another 
+parametric surface of the registry. Content may be redirected to a file using
+a pipe.
 
-    $ python q3.py [<OPTION> sphere [R] [U] [V] | tore [RMAJ] [RMIN] [U] [V]]
+    $ python q3.py [--check] [--weld[=TOLERANCE]] 
+                   [<OPTION> sphere [R] [U] [V] | tore [RMAJ] [RMIN] [U] [V]]
 
     R      The radius of a sphere.
     RMAJ   The major radius of a torus.
@@ -13,19 +15,132 @@ redirected to a file using a pipe.
     U      The number of longitudes.
     V      The number of latitudes.
 
+The option "--check" displays on the standard error a report on the welding of
+the vertices closer than TOLERANCE (0.001 by default) and on the topology of 
+the mesh. The option "--weld" displays the welded mesh instead of the original.
+
+The option "--lod" generates a chain of levels of detail, halving U and V down
+to FLOOR (4 by default). The levels are either written to the files 
+PREFIX-lodN.obj or displayed as a single wavefront file, one object per level.
+
+    $ python q3.py --lod[=FLOOR] [--output=PREFIX] [--check] 
+                   [<OPTION> sphere [R] [U] [V] | tore [RMAJ] [RMIN] [U] [V]]
+
+The option "--workers" generates the object with WORKERS processes, each one
+writing a range of rings straight into shared memory.
+
+    $ python q3.py --workers=WORKERS [--check] [--weld[=TOLERANCE]]
+                   [<OPTION> sphere [R] [U] [V] | tore [RMAJ] [RMIN] [U] [V]]
+
+The option "--compact" writes the rectangular faces as single faces and
+rounds the coordinates to PRECISION significant digits (6 by default). The
+option "--no-normals" leaves the normals out, and "--gzip" compresses the 
+wavefront output with gzip (not the image of "--preview").
+
+    $ python q3.py [--compact[=PRECISION]] [--no-normals] [--gzip] [<OPTION>] ...
+
+The option "--preview" renders a shaded image of the object to IMG_FILE, 
+instead of displaying it, using preview.py.
+
+    $ python q3.py --preview=IMG_FILE [<OPTION>] ...
+
+The option "--float" stores the coordinates of the vertices and normals as
+BITS-bit floats (64 by default). With 32, the buffers take half the memory 
+and the coordinates are written with 9 significant digits, unless 
+"--compact" is given. The option "--float-report" displays instead how far 
+the 32-bit vertices and normals are from the 64-bit ones, how many vertices 
+each one welds and the size of the buffers. Neither applies to "--lod".
+
+    $ python q3.py [--float=BITS] [--workers=WORKERS] [<OPTION>] ...
+    $ python q3.py --float-report [<OPTION>] ...
+
+The other surfaces of the registry take real parameters, U and V excepted.
+
+    $ python q3.py [<OPTION>] ellipsoid [A] [B] [C] [U] [V]
+    $ python q3.py [<OPTION>] superquadric [R] [E1] [E2] [U] [V]
+    $ python q3.py [<OPTION>] cylinder [R] [H] [U] [V]
+    $ python q3.py [<OPTION>] mobius [R] [W] [U] [V]
+
+The option "--max-error" leaves out U and V of a sphere or a torus and 
+chooses the smallest ones keeping the distance between the faces and the 
+surface under ERROR, from the radii. With "--screen-error", ERROR is the
+distance spanning PIXELS pixels at DISTANCE from a camera of horizontal 
+field of view FOV (39.6 degrees by default) on a screen WIDTH pixels wide 
+(1920 by default). The chosen U and V are displayed on the standard error.
+
+    $ python q3.py --max-error=ERROR [<OPTION>] sphere [R] | tore [RMAJ] [RMIN]
+    $ python q3.py --screen-error=PIXELS --distance=DISTANCE [--fov=FOV] 
+                   [--width=WIDTH] [<OPTION>] sphere [R] | tore [RMAJ] [RMIN]
+
+The icosphere subdivides the 20 triangles of an icosahedron of radius R N
+times, each edge being split once. With "--lod", each level removes one
+subdivision. The option "--chordal-report" displays instead the maximal
+distance between its triangles and the sphere, and the UV sphere with the 
+fewest vertices reaching the same error.
+
+    $ python q3.py [<OPTION>] icosphere [R] [N]
+    $ python q3.py --chordal-report icosphere [R] [N]
+
 author : Alexis Chretien (CHRA25049209) 
 date : February 28th, 2018
 """
 import sys
-from math import sin, cos, pi
+from ctypes import sizeof
+from math import sin, cos, acos, tan, pi, copysign, sqrt, ceil, radians
+from multiprocessing import Pool
+from multiprocessing.sharedctypes import RawArray
 from pointvec import Point3D, Vector3D
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+from mesh import WELD_TOLERANCE, OBJ_PRECISION, parseOptions, weldVertices, \
+                 printReport, writeObj, openObj, gzipStream, getChordalError
 
 ERR_NB_PARAMS = "Error : invalid number of parameters."
 ERR_INVALID_OBJECT = "Error : \"{}\" is not a valid object. " \
-                   + "The available options are \"sphere\" and \"tore\"."
-ERR_NB_PARAMS_OBJECT = "Error : the specification of a {} requires {} integers."
-ERR_PARAM_TYPE = "Error : the object's parameters need to be integers " \
-               + "strictly greater than 0." 
+                   + "The available options are {}."
+ERR_NB_PARAMS_OBJECT = "Error : the specification of a {} requires {} parameters."
+ERR_PARAM_TYPE = "Error : the object's parameters need to be numbers " \
+               + "strictly greater than 0, U and V being integers." 
+ERR_LOD_FLOOR = "Error : the floor of the levels of detail must be an " \
+              + "integer strictly greater than 0."
+MSG_LOD = "Level {} : {}, {} vertices, {} faces."
+LOD_FLOOR = 4
+ERR_NB_WORKERS = "Error : the number of workers must be an integer strictly " \
+               + "greater than 0."
+CHUNKS_PER_WORKER = 4
+FINITE_DIFFERENCE_STEP = 1e-5
+ERR_INVALID_FILENAME = "Error : invalid filename"
+ERR_PRECISION = "Error : the precision must be an integer strictly greater " \
+              + "than 0."
+ERR_INVALID_TOLERANCE = "Error : the tolerance must be a number strictly " \
+                      + "greater than 0."
+ERR_FLOAT = "Error : the size of the floats must be 32 or 64 bits."
+MSG_FLOAT_DEVIATION = "Max vertex deviation : {:.3g} ({:.3g} of the object's " \
+                    + "size), max normal deviation : {:.3g}."
+MSG_FLOAT_WELD = "Welded vertices : {} in float64, {} in float32."
+MSG_FLOAT_MEMORY = "Buffers : {} bytes in float64, {} bytes in float32."
+ERR_CHORDAL = "Error : the chordal error report requires an icosphere."
+MSG_CHORDAL_ICOSPHERE = "Icosphere : {} subdivisions, {} vertices, {} faces, " \
+                      + "max chordal error {:.4g}."
+MSG_CHORDAL_UV = "UV sphere of the same error : {} longitudes, {} latitudes, " \
+               + "{} vertices, {} faces ({:+.0f}% vertices)."
+ERR_MAX_ERROR = "Error : the maximal error must be a number strictly greater " \
+              + "than 0."
+ERR_SCREEN_ERROR = "Error : the screen error and the distance must be numbers " \
+                 + "strictly greater than 0."
+ERR_FOV = "Error : the field of view must be a number of degrees strictly " \
+        + "between 0 and 180."
+ERR_WIDTH = "Error : the width must be an integer strictly greater than 0."
+ERR_AUTO_SAMPLES = "Error : the numbers of samples of a {} cannot be chosen " \
+                 + "from an error."
+MSG_AUTO = "Tessellation : {} for a maximal chordal error of {:.4g}."
+FLOAT_TYPECODES = {32: 'f', 64: 'd'}
+# Blender's default camera : a 50 mm lens on a 36 mm wide sensor, 1920 pixels
+SCREEN_FOV = 39.6
+SCREEN_WIDTH = 1920
+FLOAT32_PRECISION = 9
 
 class Vertice(object):
     """ Class containing the informations on a vertice.
@@ -63,8 +178,113 @@ class Face(object):
 
         return s
 
+class TrigTable(object):
+    """ Class containing the sines and cosines of the angles i*domain/(2*n),
+    for i from 0 to 2*n.
+
+    These angles include the sample angles (k+1/2)*domain/m of any number of
+    samples m dividing n, which is how the levels of detail of an object 
+    share a single table.
+
+    Each angle is computed from its index rather than by adding up a step,
+    which rounds differently : the coordinates may differ in their last 
+    digit from the ones found by accumulating the step.
+
+    Attributes:
+        domain (float): The end of the angles' domain, in radians.
+        n (int): The number of samples of the finest level.
+        sines (list of float): The sines of the angles.
+        cosines (list of float): The cosines of the angles.
+    """
+    def __init__(self, domain, n):
+        """ Creates an instance of trigonometric table.
+        """
+        self.domain = domain
+        self.n = n
+        self.sines = [sin(i * domain / (2*n)) for i in range(0, 2*n + 1)]
+        self.cosines = [cos(i * domain / (2*n)) for i in range(0, 2*n + 1)]
+
+    def samples(self, m):
+        """ Returns the sines and cosines of the m sample angles
+        (k+1/2)*domain/m, for k from 0 to m-1.
+
+        Args:
+            m (int): The number of samples. Must divide self.n.
+        """
+        r = self.n // m
+
+        return (self.sines[r::2*r], self.cosines[r::2*r])
+
+class TrigTables(object):
+    """ Class containing the trigonometric tables shared by several objects.
+
+    Attributes:
+        tables (list of TrigTable): The tables built so far.
+    """
+    def __init__(self):
+        """ Creates an empty set of trigonometric tables.
+        """
+        self.tables = []
+
+    def samples(self, domain, m):
+        """ Returns the sines and cosines of the m sample angles 
+        (k+1/2)*domain/m, for k from 0 to m-1.
+
+        Reuses a table of a finer level if possible, builds a new one 
+        otherwise.
+
+        Args:
+            domain (float): The end of the angles' domain, in radians.
+            m (int): The number of samples.
+        """
+        for t in self.tables:
+            if (t.domain == domain and t.n % m == 0):
+                return t.samples(m)
+
+        self.tables.append( TrigTable(domain, m) )
+
+        return self.tables[-1].samples(m)
+
+SURFACES = {}
+GOLDEN_RATIO = (1 + sqrt(5)) / 2
+ICOSAHEDRON_VERTICES = [(-1, GOLDEN_RATIO, 0), (1, GOLDEN_RATIO, 0), \
+                        (-1, -GOLDEN_RATIO, 0), (1, -GOLDEN_RATIO, 0), \
+                        (0, -1, GOLDEN_RATIO), (0, 1, GOLDEN_RATIO), \
+                        (0, -1, -GOLDEN_RATIO), (0, 1, -GOLDEN_RATIO), \
+                        (GOLDEN_RATIO, 0, -1), (GOLDEN_RATIO, 0, 1), \
+                        (-GOLDEN_RATIO, 0, -1), (-GOLDEN_RATIO, 0, 1)]
+ICOSAHEDRON_FACES = [(0, 11, 5), (0, 5, 1), (0, 1, 7), (0, 7, 10), (0, 10, 11), \
+                     (1, 5, 9), (5, 11, 4), (11, 10, 2), (10, 7, 6), (7, 1, 8), \
+                     (3, 9, 4), (3, 4, 2), (3, 2, 6), (3, 6, 8), (3, 8, 9), \
+                     (4, 9, 5), (2, 4, 11), (6, 2, 10), (8, 6, 7), (9, 8, 1)]
+
+def getUnitVector(x, y, z):
+    """ Returns the unit vector pointing like (x, y, z).
+    """
+    length = sqrt(x*x + y*y + z*z)
+
+    return (x / length, y / length, z / length)
+
+def registerSurface(surface):
+    """ Adds a class of object to the registry of surfaces, under its name.
+    Can be used as a class decorator.
+
+    The class must define the class attributes "name", "paramNames" and 
+    "paramType", and the class method "create". The numbers of samples 
+    following the parameters are U and V, unless it defines "sampleNames".
+
+    Args:
+        surface (class): The class to register.
+    """
+    SURFACES[surface.name] = surface
+    return surface
+
 class Obj(object):
     """ Parent class to "Sphere" and "Tore"
+
+    Class attributes:
+        sampleNames (list of string): The names of the numbers of samples,
+                                      given after the parameters in argv.
     
     Attributes:
         radius (float): The object's radius.
@@ -73,8 +293,11 @@ class Obj(object):
         nbLat (int): The number of latitudes.
         vertices (list of vertices): The object's vertices.
         faces (list of faces): The object's faces.
+        trig (TrigTables): The trigonometric tables used to find the vertices.
     """
-    def __init__(self, radius, nbLon, nbLat):
+    sampleNames = ["U", "V"]
+
+    def __init__(self, radius, nbLon, nbLat, trig=None):
         """ Creates an instance of Obj.
         """
         self.radius = radius
@@ -83,6 +306,39 @@ class Obj(object):
         self.nbLat = nbLat
         self.vertices = []
         self.faces = []
+        self.trig = trig if trig != None else TrigTables()
+
+    @classmethod
+    def getCoarserParams(cls, params, floor):
+        """ Returns the parameters of the level of detail following the one
+        of parameters "params", halving the number of longitudes and 
+        latitudes without going under "floor".
+        """
+        p = list(params)
+        p[-2] = min(p[-2], max(floor, p[-2] // 2))
+        p[-1] = min(p[-1], max(floor, p[-1] // 2))
+
+        return p
+
+    @classmethod
+    def describeSamples(cls, params):
+        """ Returns a description of the numbers of samples among the 
+        parameters "params".
+        """
+        return "{} longitudes, {} latitudes".format(params[-2], params[-1])
+
+    @classmethod
+    def getSamplesForError(cls, params, maxError):
+        """ Returns the smallest numbers of samples keeping the maximal 
+        chordal error of the object under "maxError", None if they cannot be
+        chosen that way.
+
+        Args:
+            params (list of int): The object's parameters, without the numbers
+                                  of samples.
+            maxError (float): The maximal chordal error.
+        """
+        return None
     
     def calculateCyclicVertices(self, u_domain, v_domain):
         """ Calculates the object's cyclic vertices and fills self.vertices
@@ -100,22 +356,16 @@ class Obj(object):
             v_domain (float): The v domain's end, in radians (should be 2*pi 
                               in both cases).
         """
-        du = u_domain/self.nbLat
-        dv = v_domain/self.nbLon
-        u = du/2
+        sinU, cosU = self.trig.samples(u_domain, self.nbLat)
+        sinV, cosV = self.trig.samples(v_domain, self.nbLon)
         noVertice = 1
          
-        while (u < u_domain):
-            v = dv/2
-
-            while (v < v_domain):
-                point = self.getPoint(u, v)
- 
-                normal = point - self.center
+        for i in range(0, self.nbLat):
+            for j in range(0, self.nbLon):
+                point = self.getPointTrig(sinU[i], cosU[i], sinV[j], cosV[j])
+                normal = self.getNormalTrig(sinU[i], cosU[i], sinV[j], cosV[j])
                 self.vertices.append( Vertice( point, normal, noVertice ) )
                 noVertice += 1
-                v += dv
-            u += du
     
     def calculateCyclicFaces(self):
         """ Calculates the objects faces formed by two rows of cyclic vertices
@@ -131,27 +381,157 @@ class Obj(object):
             self.calculateCyclicVertices must have been called prior. 
         """
         for index in range(0, self.nbQuadFaces):
-            
-            i = [index, index + 1, 0, index + self.nbLon]
-            faceVertices = []
-
-            if (i[1] % self.nbLon != 0):
-                i[2] = i[1] + self.nbLon
-            # If we have completed a cycle around the radius. Wrapping up. 
-            else:
-                i[2] = i[1]
-                i[1] -= self.nbLon
-            
-            for j in range(0, 4):
-                # Condition can only ever pass for a tore. Links up the 
-                # first and last vertice cycles togheter.
-                if (i[j]  >= self.nbVertices):
-                    i[j] -= self.nbVertices
-                 
+            i = self.getQuadCorners(index)
             face1 = Face( [self.vertices[i[0]], self.vertices[i[1]], self.vertices[i[2]] ] )
             face2 = Face( [self.vertices[i[2]], self.vertices[i[3]], self.vertices[i[0]] ] )
             self.faces.extend( [face1, face2] )
 
+    def getQuadCorners(self, index):
+        """ Returns the indices, starting at 0, of the four vertices of a 
+        rectangular face.
+
+        Args:
+            index (int): The index of the rectangular face.
+        """
+        i = [index, index + 1, 0, index + self.nbLon]
+
+        if (i[1] % self.nbLon != 0):
+            i[2] = i[1] + self.nbLon
+        # If we have completed a cycle around the radius. Wrapping up. 
+        else:
+            i[2] = i[1]
+            i[1] -= self.nbLon
+        
+        for j in range(0, 4):
+            # Condition can only ever pass for a tore. Links up the 
+            # first and last vertice cycles togheter.
+            if (i[j]  >= self.nbVertices):
+                i[j] -= self.nbVertices
+
+        return i
+
+    def fillRings(self, positions, normals, indices, first, last):
+        """ Writes the vertices of a range of rings, and the rectangular faces
+        joining each of these rings to the next one, to flat buffers.
+
+        Ring k holds the vertices k*nbLon to (k+1)*nbLon - 1, and the two
+        triangles of rectangular face q are the triangles 2*q and 2*q + 1, so
+        that each range of rings is written at offsets known in advance. The
+        buffers end up holding the same values as the ones of getBuffers.
+
+        Args:
+            positions (list of float): The coordinates of the vertices.
+            normals (list of float): The coordinates of the vertices' normals.
+            indices (list of int): The vertex indices of the triangles.
+            first (int): The index of the first ring.
+            last (int): The index following the one of the last ring.
+        """
+        nbRingFaces = self.nbQuadFaces // self.nbLon
+
+        for i in range(first, last):
+            points, pointNormals = self.getRing(i)
+
+            for j in range(0, self.nbLon):
+                point = points[j]
+                normal = pointNormals[j]
+                k = 3 * (i*self.nbLon + j)
+                positions[k:k+3] = [point.x, point.y, point.z]
+                normals[k:k+3] = [normal.x, normal.y, normal.z]
+
+            if (i < nbRingFaces):
+                for index in range(i*self.nbLon, (i+1)*self.nbLon):
+                    c = self.getQuadCorners(index)
+                    indices[6*index:6*index+6] = [c[0], c[1], c[2], c[2], c[3], c[0]]
+
+    def getRing(self, i):
+        """ Returns the points of a ring and their normals.
+
+        Args:
+            i (int): The index of the ring.
+
+        Returns:
+            (list of Point3D, list of Vector3D): The points and their normals.
+        """
+        sinU, cosU = self.trig.samples(self.uDomain, self.nbLat)
+        sinV, cosV = self.trig.samples(self.vDomain, self.nbLon)
+        points = [self.getPointTrig(sinU[i], cosU[i], sinV[j], cosV[j]) \
+                  for j in range(0, self.nbLon)]
+        normals = [self.getNormalTrig(sinU[i], cosU[i], sinV[j], cosV[j]) \
+                   for j in range(0, self.nbLon)]
+
+        return (points, normals)
+
+    def fillPoles(self, positions, normals, indices):
+        """ Writes the pole vertices and the faces associated with them to
+        flat buffers, at the same offsets as in getBuffers. Does nothing if 
+        self has no triangular faces.
+        """
+        if (self.nbTriFaces == 0):
+            return
+
+        n = self.nbLon
+        pole1 = self.nbVertices - 2
+        pole2 = self.nbVertices - 1
+        begin2 = self.nbVertices - n - 2
+        offset = 6 * self.nbQuadFaces
+
+        for k, (p, normal) in zip([pole1, pole2], self.getPoles()):
+            positions[3*k:3*k+3] = [p.x, p.y, p.z]
+            normals[3*k:3*k+3] = [normal.x, normal.y, normal.z]
+
+        for i in range(0, n):
+            j = (i + 1) % n
+            indices[offset+6*i:offset+6*i+6] = [pole1, j, i, \
+                                                pole2, begin2 + i, begin2 + j]
+
+    def fillBuffers(self):
+        """ Returns the vertices and faces of self as flat buffers, written by
+        fillRings and fillPoles.
+        """
+        positions = [0.0] * (3 * self.nbVertices)
+        normals = [0.0] * (3 * self.nbVertices)
+        indices = [0] * (6 * self.nbQuadFaces + 3 * self.nbTriFaces)
+
+        self.fillRings(positions, normals, indices, 0, self.nbLat)
+        self.fillPoles(positions, normals, indices)
+
+        return (positions, normals, indices)
+
+    @classmethod
+    def create(cls, params, trig=None, generate=True):
+        """ Creates an instance of the class from its parameters, as given in
+        argv.
+
+        Args:
+            params (list of number): The parameters, the numbers of longitudes
+                                     and latitudes being the last two.
+            trig (TrigTables, None): The trigonometric tables to share with the 
+                                     object, if any.
+            generate (bool): Whether to generate the object's vertices and faces.
+        """
+        return cls(*(list(params) + [trig, generate]))
+
+    def getBuffers(self):
+        """ Returns the vertices and faces of self as flat buffers.
+
+        Returns:
+            (list of float, list of float, list of int): The coordinates of the
+                vertices, the coordinates of their normals and the vertex 
+                indices of the triangles, starting at 0.
+        """
+        positions = []
+        normals = []
+        indices = []
+
+        for v in self.vertices:
+            positions.extend( (v.point.x, v.point.y, v.point.z) )
+            normals.extend( (v.normal.x, v.normal.y, v.normal.z) )
+
+        for f in self.faces:
+            indices.extend( [v.number - 1 for v in f.vertices] )
+
+        return (positions, normals, indices)
+
     def __repr__(self):
         """ Return a string representation of self.
         """
@@ -168,25 +548,48 @@ class Obj(object):
         return s.rstrip("\n")
 
 
+@registerSurface
 class Sphere(Obj):
     """ Child class of Obj, representing a sphere
 
+    Class attributes:
+        name (string): The name of the sphere in the registry.
+        paramNames (list of string): The names of the sphere's parameters.
+        paramType (type): The type of the sphere's parameters.
+
     Attributes:
         nbVertices: The sphere's number of vertices
         nbQuadFaces: The sphere's number of rectangular faces.
         nbTriFaces: The sphere's number of triangular faces. 
     """
-    def __init__(self, radius, nbLon, nbLat):
-        """ Creates an instance of sphere
+    name = "sphere"
+    paramNames = ["R"]
+    paramType = int
+
+    def __init__(self, radius, nbLon, nbLat, trig=None, generate=True):
+        """ Creates an instance of sphere. If "generate" is False, its vertices
+        and faces are left to be written to buffers.
         """
-        Obj.__init__(self, radius, nbLon, nbLat)
+        Obj.__init__(self, radius, nbLon, nbLat, trig)
         self.nbVertices = nbLon * nbLat + 2
         self.nbQuadFaces = nbLon * (nbLat - 1)
         self.nbTriFaces = 2 * nbLon
+        self.uDomain = pi
+        self.vDomain = 2*pi
 
-        self.calculateCyclicVertices(pi, 2*pi)
-        self.calculateCyclicFaces()
-        self.calculatePoles()
+        if (generate):
+            self.calculateCyclicVertices(pi, 2*pi)
+            self.calculateCyclicFaces()
+            self.calculatePoles()
+
+    def getPoles(self):
+        """ Returns the two poles and their normals.
+
+        Returns:
+            list of (Point3D, Vector3D): The poles and their normals.
+        """
+        return [(self.getPoint(0, 0), self.getNormal(0, 0)), \
+                (self.getPoint(pi, 2*pi), self.getNormal(pi, 2*pi))]
 
     def calculatePoles(self):
         """ Finds the vertices and faces related to the two poles. 
@@ -197,11 +600,10 @@ class Sphere(Obj):
             self.calculateCyclicVertices and self.calculateCyclicFaces
             must have been called prior, in that order.
         """
-        p1 = self.getPoint(0, 0)
-        p2 = self.getPoint(pi, 2*pi)
+        (p1, n1), (p2, n2) = self.getPoles()
     
-        pole1 = Vertice(p1, p1 - self.center, self.nbVertices - 1)
-        pole2 = Vertice(p2, p2 - self.center, self.nbVertices)
+        pole1 = Vertice(p1, n1, self.nbVertices - 1)
+        pole2 = Vertice(p2, n2, self.nbVertices)
         
         begin1 = 0
         begin2 = self.nbVertices - self.nbLon - 2
@@ -215,9 +617,10 @@ class Sphere(Obj):
         vertCycle2 = self.vertices[ begin2 : end2 ] 
         vertCycle2.append( self.vertices[ begin2 ] )
          
-        # Creating the tri faces assosicated with each pole
+        # Creating the tri faces assosicated with each pole, oriented like
+        # the rectangular faces they share an edge with
         for i in range(0, self.nbLon):
-            self.faces.append( Face([pole1, vertCycle1[i], vertCycle1[i+1]]) )
+            self.faces.append( Face([pole1, vertCycle1[i+1], vertCycle1[i]]) )
             self.faces.append( Face([pole2, vertCycle2[i], vertCycle2[i+1]]) )
         
         # Saving up the pole vertices   
@@ -230,27 +633,76 @@ class Sphere(Obj):
             u (float): The u coordinate, in radians.
             v (float): The v coordinate, in radians.
         """
-        return Point3D(self.radius * sin(u) * cos(v), \
-                       self.radius * sin(u) * sin(v), \
-                       self.radius * cos(u));
+        return self.getPointTrig(sin(u), cos(u), sin(v), cos(v))
 
+    def getPointTrig(self, sinU, cosU, sinV, cosV):
+        """ Finds a point on self's surface using the sines and cosines of 
+        its u, v coordinates. u goes from the south pole to the north pole, 
+        so that the faces are oriented outward.
+        """
+        return Point3D(self.radius * sinU * cosV, \
+                       self.radius * sinU * sinV, \
+                       -self.radius * cosU);
+
+    def getNormal(self, u, v):
+        """ Finds the unit normal of self's surface using u, v coordinates.
+        """
+        return self.getNormalTrig(sin(u), cos(u), sin(v), cos(v))
+
+    def getNormalTrig(self, sinU, cosU, sinV, cosV):
+        """ Finds the unit normal of self's surface using the sines and 
+        cosines of its u, v coordinates, pointing away from the center.
+        """
+        return Vector3D(sinU * cosV, sinU * sinV, -cosU)
+
+    @classmethod
+    def getSamplesForError(cls, params, maxError):
+        """ Returns the numbers of longitudes and latitudes keeping the 
+        maximal chordal error of a sphere under "maxError".
+
+        The deepest points are the centers of the faces around the equator, 
+        at radius * (1 - cos(a) * cos(b)) from the sphere, a being half the 
+        angle between two longitudes and b half the angle between two 
+        latitudes. Taking a = b minimizes the number of vertices.
+        """
+        radius = params[0]
+        angle = acos(sqrt(1 - min(float(maxError) / radius, 1.0)))
+
+        return (max(3, int(ceil(pi / angle))), int(ceil(pi / (2 * angle))))
+
+@registerSurface
 class Tore(Obj):
+    """ Child class of Obj, representing a torus.
+
+    Class attributes:
+        name (string): The name of the torus in the registry.
+        paramNames (list of string): The names of the torus' parameters.
+        paramType (type): The type of the torus' parameters.
+    """
+    name = "tore"
+    paramNames = ["RMAJ", "RMIN"]
+    paramType = int
            
-    def __init__(self, radius, minorRadius, nbLon, nbLat):
-        """ Creates an instance of a torus.
+    def __init__(self, radius, minorRadius, nbLon, nbLat, trig=None, generate=True):
+        """ Creates an instance of a torus. If "generate" is False, its 
+        vertices and faces are left to be written to buffers.
 
         Attributes:
             minorRadius (float): The torus' minor radius
             nbVertices (int): The number of vertices.
             nbQuadFaces (int): The number of rectangular faces.
         """
-        Obj.__init__(self, radius, nbLon, nbLat)
+        Obj.__init__(self, radius, nbLon, nbLat, trig)
         self.minorRadius = minorRadius 
         self.nbVertices = nbLon * nbLat
         self.nbQuadFaces = nbLon * nbLat
+        self.nbTriFaces = 0
+        self.uDomain = 2*pi
+        self.vDomain = 2*pi
 
-        self.calculateCyclicVertices(2*pi, 2*pi)
-        self.calculateCyclicFaces()
+        if (generate):
+            self.calculateCyclicVertices(2*pi, 2*pi)
+            self.calculateCyclicFaces()
         
     def getPoint(self, u, v):
         """ Finds a point on self's surface using u, v coordinates.
@@ -259,14 +711,438 @@ class Tore(Obj):
             u (float): The u coordinate, in radians.
             v (float): The v coordinate, in randians.
         """
-        return Point3D((self.radius + self.minorRadius*cos(u))*cos(v),\
-                       (self.radius + self.minorRadius*cos(u))*sin(v),\
-                        self.minorRadius*sin(u))
+        return self.getPointTrig(sin(u), cos(u), sin(v), cos(v))
 
-def getObject():
+    def getPointTrig(self, sinU, cosU, sinV, cosV):
+        """ Finds a point on self's surface using the sines and cosines of 
+        its u, v coordinates.
+        """
+        return Point3D((self.radius + self.minorRadius*cosU)*cosV,\
+                       (self.radius + self.minorRadius*cosU)*sinV,\
+                        self.minorRadius*sinU)
+
+    def getNormalTrig(self, sinU, cosU, sinV, cosV):
+        """ Finds the unit normal of self's surface using the sines and 
+        cosines of its u, v coordinates, pointing away from the center of the
+        tube, (RMAJ*cos(v), RMAJ*sin(v), 0).
+        """
+        return Vector3D(cosU * cosV, cosU * sinV, sinU)
+
+    @classmethod
+    def getSamplesForError(cls, params, maxError):
+        """ Returns the numbers of longitudes and latitudes keeping the 
+        maximal chordal error of a torus under "maxError".
+
+        The deepest points are the centers of the faces around the outer 
+        equator, less than (RMAJ + RMIN) * (1 - cos(a)) + RMIN * (1 - cos(b))
+        from the torus, a being half the angle between two longitudes and b 
+        half the angle between two latitudes. Each term gets half the error,
+        which minimizes the number of vertices.
+        """
+        radius, minorRadius = params
+        angleLon = acos(max(1 - maxError / (2.0 * (radius + minorRadius)), -1.0))
+        angleLat = acos(max(1 - maxError / (2.0 * minorRadius), -1.0))
+
+        return (max(3, int(ceil(pi / angleLon))), max(3, int(ceil(pi / angleLat))))
+
+@registerSurface
+class Icosphere(Obj):
+    """ Child class of Obj, representing a sphere made by subdividing the 
+    faces of an icosahedron N times.
+
+    Each subdivision splits every triangle in four, the midpoints of its 
+    edges being pushed back onto the sphere. The midpoints are cached by 
+    edge, so that the two triangles sharing an edge share its midpoint : 
+    each edge is split once. Unlike the ones of a UV sphere, the triangles
+    are spread evenly, without poles. Level N has 10*4^N + 2 vertices and
+    20*4^N triangles.
+
+    An icosphere is generated as a single ring, so that it goes through the 
+    same buffers as the other objects.
+
+    Class attributes:
+        name (string): The name of the icosphere in the registry.
+        paramNames (list of string): The names of the icosphere's parameters.
+        paramType (type): The type of the icosphere's parameters.
+        sampleNames (list of string): The name of the number of subdivisions.
+
+    Attributes:
+        level (int): The number of subdivisions.
+        buffers (tuple, None): The buffers of the generated icosphere, if any.
+    """
+    name = "icosphere"
+    paramNames = ["R"]
+    paramType = int
+    sampleNames = ["N"]
+
+    def __init__(self, radius, level, trig=None, generate=True):
+        """ Creates an instance of icosphere. If "generate" is False, its 
+        vertices and faces are left to be written to buffers.
+        """
+        Obj.__init__(self, radius, 0, 1, trig)
+        self.level = level
+        self.nbVertices = 10 * 4**level + 2
+        self.nbQuadFaces = 0
+        self.nbTriFaces = 20 * 4**level
+        self.buffers = None
+
+        if (generate):
+            self.buffers = self.fillBuffers()
+
+    @classmethod
+    def getCoarserParams(cls, params, floor):
+        """ Returns the parameters of the level of detail following the one
+        of parameters "params", with one subdivision less, down to one. 
+        "floor" is ignored.
+        """
+        return list(params[:-1]) + [max(params[-1] - 1, 1)]
+
+    @classmethod
+    def describeSamples(cls, params):
+        """ Returns a description of the number of subdivisions among the 
+        parameters "params".
+        """
+        return "{} subdivisions".format(params[-1])
+
+    def subdivide(self):
+        """ Returns the vertices and the triangles of self, on the unit 
+        sphere.
+
+        Returns:
+            (list of (float, float, float), list of (int, int, int)): The 
+                coordinates of the vertices and the vertex indices of the 
+                triangles, oriented outward.
+        """
+        points = [getUnitVector(*p) for p in ICOSAHEDRON_VERTICES]
+        triangles = ICOSAHEDRON_FACES
+
+        for n in range(0, self.level):
+            midpoints = {}
+            subdivided = []
+
+            for a, b, c in triangles:
+                ab = self.getMidpoint(points, midpoints, a, b)
+                bc = self.getMidpoint(points, midpoints, b, c)
+                ca = self.getMidpoint(points, midpoints, c, a)
+                subdivided.extend([(a, ab, ca), (b, bc, ab), (c, ca, bc), \
+                                   (ab, bc, ca)])
+            triangles = subdivided
+
+        return (points, triangles)
+
+    def getMidpoint(self, points, midpoints, a, b):
+        """ Returns the index of the vertex splitting an edge, pushed onto the 
+        unit sphere. The vertex is added to "points" the first time the edge
+        is split.
+
+        Args:
+            points (list of (float, float, float)): The vertices.
+            midpoints (dict): The index of the vertex splitting each edge
+                              already split, indexed by its vertex indices.
+            a, b (int): The indices of the vertices of the edge.
+        """
+        edge = (min(a, b), max(a, b))
+
+        if (edge not in midpoints):
+            pa = points[a]
+            pb = points[b]
+            points.append(getUnitVector(pa[0] + pb[0], pa[1] + pb[1], pa[2] + pb[2]))
+            midpoints[edge] = len(points) - 1
+
+        return midpoints[edge]
+
+    def fillRings(self, positions, normals, indices, first, last):
+        """ Writes the vertices and faces of self to flat buffers, if the
+        range of rings includes its single ring.
+        """
+        if (first > 0 or last < 1):
+            return
+
+        points, triangles = self.subdivide()
+
+        for k, (x, y, z) in enumerate(points):
+            positions[3*k:3*k+3] = [self.radius * x, self.radius * y, self.radius * z]
+            normals[3*k:3*k+3] = [x, y, z]
+
+        for k, triangle in enumerate(triangles):
+            indices[3*k:3*k+3] = list(triangle)
+
+    def fillPoles(self, positions, normals, indices):
+        """ Does nothing, an icosphere having no pole.
+        """
+        pass
+
+    def getBuffers(self):
+        """ Returns the vertices and faces of self as flat buffers.
+        """
+        if (self.buffers != None):
+            return self.buffers
+
+        return self.fillBuffers()
+
+    def __repr__(self):
+        """ Return a string representation of self.
+        """
+        stream = StringIO()
+        writeObj(stream, *self.getBuffers())
+
+        return stream.getvalue().rstrip("\n")
+
+class Surface(Obj):
+    """ Parent class to the parametric surfaces of the registry, other than
+    "Sphere" and "Tore".
+
+    Each child class gives the points of a whole ring at once, through 
+    "position", and their normals, through "normal", which defaults to 
+    finite differences. The sines and cosines of the v samples come from
+    the trigonometric tables, like the ones of "Sphere" and "Tore". The 
+    rings go along u and v is cyclic, except for the surface's topology :
+
+    - "poles" : u goes from one pole to the other, like a sphere. 
+    - "tube" : u goes from one open end to the other, like a cylinder.
+    - "torus" : u is cyclic, like a torus.
+    - "mobius" : like "tube", but the first and last vertices of a ring are
+                 joined with a half twist.
+
+    The faces are oriented so that (dP/dv x dP/du) points to their front.
+
+    Class attributes:
+        name (string): The name of the surface in the registry.
+        paramNames (list of string): The names of the surface's parameters.
+        paramType (type): The type of the surface's parameters.
+        topology (string): The surface's topology.
+        vDomain (float): The end of the v domain, which starts at 0.
+
+    Attributes:
+        params (list of float): The surface's parameters.
+        buffers (tuple, None): The buffers of the generated surface, if any.
+    """
+    paramType = float
+    topology = "poles"
+    vDomain = 2*pi
+
+    def __init__(self, params, nbLon, nbLat, trig=None, generate=True):
+        """ Creates an instance of surface. If "generate" is False, its 
+        vertices and faces are left to be written to buffers.
+        """
+        Obj.__init__(self, params[0], nbLon, nbLat, trig)
+        self.params = params
+        self.nbVertices = nbLon * nbLat
+        self.nbQuadFaces = nbLon * (nbLat - 1)
+        self.nbTriFaces = 0
+        self.buffers = None
+
+        if (self.topology == "poles"):
+            self.nbVertices += 2
+            self.nbTriFaces = 2 * nbLon
+        elif (self.topology == "torus"):
+            self.nbQuadFaces += nbLon
+
+        if (generate):
+            self.buffers = self.fillBuffers()
+
+    @classmethod
+    def create(cls, params, trig=None, generate=True):
+        """ Creates an instance of the class from its parameters, as given in
+        argv.
+        """
+        return cls(params[:-2], params[-2], params[-1], trig, generate)
+
+    def getURange(self):
+        """ Returns the start and end of the u domain. Defaults to (0, pi).
+        """
+        return (0.0, pi)
+
+    def getU(self, i):
+        """ Returns the u coordinate of a ring.
+
+        Args:
+            i (int): The index of the ring.
+        """
+        uMin, uMax = self.getURange()
+
+        if (self.topology == "tube" or self.topology == "mobius"):
+            return uMin + i * (uMax - uMin) / max(self.nbLat - 1, 1)
+        else:
+            return uMin + (i + 0.5) * (uMax - uMin) / self.nbLat
+
+    def positionAt(self, u, vs):
+        """ Finds points on self's surface sharing a u coordinate, computing
+        the sines and cosines of v coordinates which are not samples.
+
+        Args:
+            u (float): The u coordinate of the points.
+            vs (list of float): The v coordinates of the points.
+
+        Returns:
+            list of (float, float, float): The coordinates of the points.
+        """
+        return self.position(u, vs, [sin(v) for v in vs], [cos(v) for v in vs])
+
+    def normal(self, u, vs, sinV, cosV):
+        """ Finds the unit normals of points sharing a u coordinate, using 
+        finite differences.
+
+        Args:
+            u (float): The u coordinate of the points.
+            vs (list of float): The v coordinates of the points.
+            sinV, cosV (list of float): The sines and cosines of vs.
+
+        Returns:
+            list of (float, float, float): The coordinates of the normals.
+        """
+        h = FINITE_DIFFERENCE_STEP
+        u1 = self.position(u + h, vs, sinV, cosV)
+        u0 = self.position(u - h, vs, sinV, cosV)
+        v1 = self.positionAt(u, [v + h for v in vs])
+        v0 = self.positionAt(u, [v - h for v in vs])
+        normals = []
+
+        for a1, a0, b1, b0 in zip(u1, u0, v1, v0):
+            du = Vector3D(a1[0] - a0[0], a1[1] - a0[1], a1[2] - a0[2])
+            dv = Vector3D(b1[0] - b0[0], b1[1] - b0[1], b1[2] - b0[2])
+            n = dv.cross_product(du)
+            n.normalize()
+            normals.append( (n.x, n.y, n.z) )
+
+        return normals
+
+    def getRing(self, i):
+        """ Returns the points of a ring and their normals.
+        """
+        u = self.getU(i)
+        vs = [(2*j + 1) * self.vDomain / (2 * self.nbLon) for j in range(0, self.nbLon)]
+        sinV, cosV = self.trig.samples(self.vDomain, self.nbLon)
+
+        return ([Point3D(*p) for p in self.position(u, vs, sinV, cosV)], \
+                [Vector3D(*n) for n in self.normal(u, vs, sinV, cosV)])
+
+    def getPoles(self):
+        """ Returns the two poles and their normals, pointing away from the
+        center.
+        """
+        poles = []
+
+        for u in self.getURange():
+            p = Point3D(*self.position(u, [0.0], [0.0], [1.0])[0])
+            normal = p - self.center
+            normal.normalize()
+            poles.append( (p, normal) )
+
+        return poles
+
+    def getQuadCorners(self, index):
+        """ Returns the indices, starting at 0, of the four vertices of a 
+        rectangular face, joining the ends of the rings with a half twist
+        for the "mobius" topology.
+        """
+        i = Obj.getQuadCorners(self, index)
+
+        if (self.topology == "mobius" and (index + 1) % self.nbLon == 0):
+            ring = index // self.nbLon
+            i[1] = (self.nbLat - 1 - ring) * self.nbLon
+            i[2] = (self.nbLat - 2 - ring) * self.nbLon
+
+        return i
+
+    def getBuffers(self):
+        """ Returns the vertices and faces of self as flat buffers.
+        """
+        if (self.buffers != None):
+            return self.buffers
+
+        return self.fillBuffers()
+
+    def __repr__(self):
+        """ Return a string representation of self.
+        """
+        stream = StringIO()
+        writeObj(stream, *self.getBuffers())
+
+        return stream.getvalue().rstrip("\n")
+
+@registerSurface
+class Ellipsoid(Surface):
+    """ Ellipsoid of semi-axes A, B and C along x, y and z.
+    """
+    name = "ellipsoid"
+    paramNames = ["A", "B", "C"]
+
+    def position(self, u, vs, sinV, cosV):
+        a, b, c = self.params
+        return [(a * sin(u) * cosv, b * sin(u) * sinv, -c * cos(u)) \
+                for sinv, cosv in zip(sinV, cosV)]
+
+    def normal(self, u, vs, sinV, cosV):
+        a, b, c = self.params
+        normals = []
+
+        for x, y, z in self.position(u, vs, sinV, cosV):
+            n = Vector3D(x / a**2, y / b**2, z / c**2)
+            n.normalize()
+            normals.append( (n.x, n.y, n.z) )
+
+        return normals
+
+@registerSurface
+class Superquadric(Surface):
+    """ Superellipsoid of radius R, with exponents E1 along u and E2 along v.
+    The exponents go from a box (close to 0) to a sphere (1) and beyond.
+    """
+    name = "superquadric"
+    paramNames = ["R", "E1", "E2"]
+
+    def position(self, u, vs, sinV, cosV):
+        r, e1, e2 = self.params
+        f = lambda w, e: copysign(abs(w) ** e, w)
+        return [(r * f(sin(u), e1) * f(cosv, e2), \
+                 r * f(sin(u), e1) * f(sinv, e2), \
+                 -r * f(cos(u), e1)) for sinv, cosv in zip(sinV, cosV)]
+
+@registerSurface
+class Cylinder(Surface):
+    """ Open cylinder of radius R and height H, centered on the origin.
+    """
+    name = "cylinder"
+    paramNames = ["R", "H"]
+    topology = "tube"
+
+    def getURange(self):
+        h = self.params[1]
+        return (-h / 2.0, h / 2.0)
+
+    def position(self, u, vs, sinV, cosV):
+        r = self.params[0]
+        return [(r * cosv, r * sinv, u) for sinv, cosv in zip(sinV, cosV)]
+
+    def normal(self, u, vs, sinV, cosV):
+        return [(cosv, sinv, 0.0) for sinv, cosv in zip(sinV, cosV)]
+
+@registerSurface
+class Mobius(Surface):
+    """ Moebius band of radius R and width W. Being non-orientable, its faces
+    can't all be oriented consistently.
+    """
+    name = "mobius"
+    paramNames = ["R", "W"]
+    topology = "mobius"
+
+    def getURange(self):
+        w = self.params[1]
+        return (-w / 2.0, w / 2.0)
+
+    def position(self, u, vs, sinV, cosV):
+        r = self.params[0]
+        return [((r + u * cos(v / 2)) * cosv, \
+                 (r + u * cos(v / 2)) * sinv, \
+                 u * sin(v / 2)) for v, sinv, cosv in zip(vs, sinV, cosV)]
+
+def getParams(withSamples=True):
     """ Validates the argv parameters. 
 
-    Returns a tore or sphere object if the arguments are valid.
+    Returns the type of object and its parameters if the arguments are valid.
+    Unless "withSamples" is True, the numbers of samples are left out of the
+    arguments.
     """
     nbArgs = len(sys.argv)
    
@@ -277,34 +1153,527 @@ def getObject():
   
     type = sys.argv[1]
 
-    if (type != "sphere" and type != "tore"):
-        print(ERR_INVALID_OBJECT.format(type))
+    if (type not in SURFACES):
+        names = ", ".join("\"{}\"".format(n) for n in sorted(SURFACES))
+        print(ERR_INVALID_OBJECT.format(type, names))
+        sys.exit(0)
+
+    surface = SURFACES[type]
+    nbShape = len(surface.paramNames)
+    nbParams = nbShape + (len(surface.sampleNames) if withSamples else 0)
+
+    if (nbArgs != nbParams + 2):
+        print(ERR_NB_PARAMS_OBJECT.format(type, nbParams))
+        sys.exit(0)
+
+    try:
+        params = [surface.paramType(s) for s in sys.argv[2:2 + nbShape]] \
+               + [int(s) for s in sys.argv[2 + nbShape:]]
+    except ValueError:
+        params = []
+
+    if (len(params) != nbParams or min(params) <= 0):
+        print(ERR_PARAM_TYPE)
+        sys.exit(0)
+
+    return (type, params)
+
+def getWorldError(pixels, distance, fov=SCREEN_FOV, width=SCREEN_WIDTH):
+    """ Returns the distance spanning a number of pixels on the screen, at 
+    some distance of a perspective camera.
+
+    Args:
+        pixels (float): The number of pixels.
+        distance (float): The distance to the camera.
+        fov (float): The horizontal field of view of the camera, in degrees.
+        width (int): The width of the screen, in pixels.
+    """
+    return pixels * 2 * distance * tan(radians(fov) / 2) / width
+
+def getErrorParams(options):
+    """ Validates the argv parameters and the options.
+
+    With the option "max-error", or "screen-error" and "distance", the 
+    numbers of samples are left out of the arguments and chosen from the 
+    maximal chordal error, then displayed on the standard error.
+
+    Returns the type of object and its parameters if the arguments are valid.
+    """
+    if ("max-error" not in options and "screen-error" not in options):
+        return getParams()
+
+    if ("max-error" in options):
+        try:
+            maxError = float(options.get("max-error") or 0)
+        except ValueError:
+            maxError = 0
+
+        if (maxError <= 0):
+            print(ERR_MAX_ERROR)
+            sys.exit(0)
+    else:
+        try:
+            pixels = float(options.get("screen-error") or 0)
+            distance = float(options.get("distance") or 0)
+        except ValueError:
+            pixels = 0
+
+        if (pixels <= 0 or distance <= 0):
+            print(ERR_SCREEN_ERROR)
+            sys.exit(0)
+
+        try:
+            fov = float(options.get("fov") or SCREEN_FOV)
+        except ValueError:
+            fov = 0
+
+        if (not 0 < fov < 180):
+            print(ERR_FOV)
+            sys.exit(0)
+
+        try:
+            width = int(options.get("width") or SCREEN_WIDTH)
+        except ValueError:
+            width = 0
+
+        if (width <= 0):
+            print(ERR_WIDTH)
+            sys.exit(0)
+
+        maxError = getWorldError(pixels, distance, fov, width)
+
+    type, params = getParams(False)
+    samples = SURFACES[type].getSamplesForError(params, maxError)
+
+    if (samples == None):
+        print(ERR_AUTO_SAMPLES.format(type))
+        sys.exit(0)
+
+    params = params + list(samples)
+    sys.stderr.write(MSG_AUTO.format(SURFACES[type].describeSamples(params), \
+                                     maxError) + "\n")
+
+    return (type, params)
+
+def createObject(type, params, trig=None, generate=True):
+    """ Returns an object of the registry of surfaces.
+
+    Args:
+        type (string): The type of object, one of the registry's names.
+        params (list of int): The object's parameters, as given in argv.
+        trig (TrigTables, None): The trigonometric tables to share with the 
+                                 object, if any.
+        generate (bool): Whether to generate the object's vertices and faces.
+    """
+    return SURFACES[type].create(params, trig, generate)
+
+def getObject():
+    """ Validates the argv parameters. 
+
+    Returns a tore or sphere object if the arguments are valid.
+    """
+    return createObject(*getParams())
+
+def initWorker(object, positions, normals, indices):
+    """ Gives a worker process of generateBuffers the object to generate and
+    the shared buffers to write to.
+    """
+    global workerArgs
+    workerArgs = (object, positions, normals, indices)
+
+def fillRings(rings):
+    """ Writes a range of rings of the worker's object to the shared buffers.
+
+    Args:
+        rings (int, int): The indices of the first ring and of the ring 
+                          following the last one.
+    """
+    object, positions, normals, indices = workerArgs
+    object.fillRings(positions, normals, indices, rings[0], rings[1])
+
+def generateBuffers(object, nbWorkers, typecode='d'):
+    """ Generates the vertices and faces of an object in parallel.
+
+    The rings of the object are split in contiguous ranges, distributed 
+    among "nbWorkers" processes. Each process writes its vertices and faces
+    straight into buffers in shared memory, at offsets known in advance, so
+    that no merging is required. With a single worker, the buffers are 
+    written by the current process.
+
+    Args:
+        object (Obj): The object to generate, created with generate=False.
+        nbWorkers (int): The number of processes.
+        typecode (str): The type of the coordinates, 'd' for 64-bit floats
+                        or 'f' for 32-bit floats.
+
+    Returns:
+        (RawArray, RawArray, RawArray): The coordinates of the vertices, the
+            coordinates of their normals and the vertex indices of the 
+            triangles, starting at 0.
+    """
+    positions = RawArray(typecode, 3 * object.nbVertices)
+    normals = RawArray(typecode, 3 * object.nbVertices)
+    indices = RawArray('l', 6 * object.nbQuadFaces + 3 * object.nbTriFaces)
+
+    if (nbWorkers > 1):
+        nbChunks = min(object.nbLat, CHUNKS_PER_WORKER * nbWorkers)
+        bounds = [object.nbLat * k // nbChunks for k in range(0, nbChunks + 1)]
+        chunks = list(zip(bounds[:-1], bounds[1:]))
+
+        pool = Pool(nbWorkers, initWorker, (object, positions, normals, indices))
+        pool.map(fillRings, chunks, 1)
+        pool.close()
+        pool.join()
+    else:
+        object.fillRings(positions, normals, indices, 0, object.nbLat)
+    object.fillPoles(positions, normals, indices)
+
+    return (positions, normals, indices)
+
+def getMaxDeviation(buffer1, buffer2):
+    """ Returns the largest distance between the matching vectors of two 
+    flat buffers of coordinates.
+    """
+    return max([sqrt((buffer1[i] - buffer2[i])**2 + \
+                     (buffer1[i+1] - buffer2[i+1])**2 + \
+                     (buffer1[i+2] - buffer2[i+2])**2) \
+                for i in range(0, len(buffer1), 3)] + [0.0])
+
+def reportFloatPrecision(type, params, out):
+    """ Generates an object with 64-bit and with 32-bit floats and writes a
+    report comparing the two : the largest deviation of the vertices, in 
+    absolute and relative to the object's size, the largest deviation of 
+    the normals, the number of vertices welded by each one and the size of 
+    their buffers.
+
+    Args:
+        type (string): The type of object.
+        params (list of number): The object's parameters, as given in argv.
+        out (file): The opened stream to write the report to.
+    """
+    positions, normals, indices = zip(*[generateBuffers(createObject(type, \
+                                        params, generate=False), 1, \
+                                        FLOAT_TYPECODES[bits]) for bits in [64, 32]])
+    deviation = getMaxDeviation(positions[0], positions[1])
+    size = max([abs(c) for c in positions[0]] + [0.0]) or 1.0
+    welded = [len(weldVertices(p, i, WELD_TOLERANCE)[0]) // 3 \
+              for p, i in zip(positions, indices)]
+    memory = [sizeof(p) + sizeof(n) + sizeof(i) \
+              for p, n, i in zip(positions, normals, indices)]
+
+    out.write(MSG_FLOAT_DEVIATION.format(deviation, deviation / size, \
+              getMaxDeviation(normals[0], normals[1])) + "\n")
+    out.write(MSG_FLOAT_WELD.format(*welded) + "\n")
+    out.write(MSG_FLOAT_MEMORY.format(*memory) + "\n")
+
+def getUVChordalError(radius, nbLon, nbLat):
+    """ Returns the maximal chordal error of a UV sphere. 
+
+    All the columns of faces of the sphere being the same, up to a rotation,
+    only the first one is built.
+
+    Args:
+        radius (float): The radius of the sphere.
+        nbLon (int): The number of longitudes.
+        nbLat (int): The number of latitudes.
+    """
+    sphere = Sphere(radius, nbLon, nbLat, generate=False)
+    positions = []
+    indices = []
+
+    for i in range(0, nbLat):
+        for j in [0, 1]:
+            p = sphere.getPoint((i + 0.5) * pi / nbLat, (j + 0.5) * 2*pi / nbLon)
+            positions.extend( (p.x, p.y, p.z) )
+
+    for p, normal in sphere.getPoles():
+        positions.extend( (p.x, p.y, p.z) )
+
+    for i in range(0, 2 * (nbLat - 1), 2):
+        indices.extend( [i, i + 1, i + 3, i + 3, i + 2, i] )
+    indices.extend( [2 * nbLat, 1, 0, 2 * nbLat + 1, 2 * nbLat - 2, 2 * nbLat - 1] )
+
+    return getChordalError(positions, indices, radius)
+
+def findUVSphere(radius, maxError):
+    """ Returns the UV sphere with the fewest vertices whose maximal chordal
+    error is at most "maxError".
+
+    The edges around the equator make the error at least 
+    radius * (1 - cos(pi / U)), and the edges along the meridians at least
+    radius * (1 - cos(pi / (2*V))), which bounds U and V from below. For 
+    each number of latitudes, the smallest number of longitudes is then 
+    found by bisection, the error decreasing with the number of longitudes,
+    until the number of latitudes alone requires more vertices than the best
+    sphere found.
+
+    Args:
+        radius (float): The radius of the sphere.
+        maxError (float): The maximal chordal error.
+
+    Returns:
+        (int, int): The numbers of longitudes and latitudes.
+    """
+    minLon = 3
+    nbLat = 1
+
+    while (radius * (1 - cos(pi / minLon)) > maxError):
+        minLon += 1
+
+    while (radius * (1 - cos(pi / (2 * nbLat))) > maxError):
+        nbLat += 1
+
+    best = None
+
+    while (best == None or nbLat * minLon < best[0] * best[1]):
+        maxLon = max(8 * nbLat, 4 * minLon)
+
+        if (best != None):
+            maxLon = min(maxLon, (best[0] * best[1] - 1) // nbLat)
+
+        if (maxLon >= minLon and getUVChordalError(radius, maxLon, nbLat) <= maxError):
+            low, high = minLon, maxLon
+
+            while (low < high):
+                middle = (low + high) // 2
+
+                if (getUVChordalError(radius, middle, nbLat) <= maxError):
+                    high = middle
+                else:
+                    low = middle + 1
+            best = (low, nbLat)
+        nbLat += 1
+
+    return best
+
+def reportChordalError(type, params, out):
+    """ Writes a report comparing an icosphere to the UV sphere with the 
+    fewest vertices having the same maximal chordal error.
+
+    Args:
+        type (string): The type of object, which must be "icosphere".
+        params (list of int): The object's parameters, as given in argv.
+        out (file): The opened stream to write the report to.
+    """
+    if (type != Icosphere.name):
+        print(ERR_CHORDAL)
         sys.exit(0)
 
-    elif (type == "sphere" and nbArgs != 5):
-        print(ERR_NB_PARAMS_OBJECT.format(type, 3))
-        sys.exit(0)       
+    radius, level = params
+    positions, normals, indices = createObject(type, params).getBuffers()
+    error = getChordalError(positions, indices, radius)
+    nbLon, nbLat = findUVSphere(radius, error)
+    nbVertices = len(positions) // 3
+    nbUVVertices = nbLon * nbLat + 2
+
+    out.write(MSG_CHORDAL_ICOSPHERE.format(level, nbVertices, len(indices) // 3, \
+                                           error) + "\n")
+    out.write(MSG_CHORDAL_UV.format(nbLon, nbLat, nbUVVertices, 2 * nbLon * nbLat, \
+              100.0 * (nbUVVertices - nbVertices) / nbVertices) + "\n")
+
+def getLevelsOfDetail(type, params, floor):
+    """ Returns the parameters of each level of detail of an object.
 
-    elif (type == "tore" and nbArgs != 6):
-        print(ERR_NB_PARAMS_OBJECT.format(type, 4))
+    The number of longitudes and latitudes is halved from one level to the 
+    next, without going under "floor", until the level stops changing. The
+    icosphere loses one subdivision per level instead.
+
+    Args:
+        type (string): The type of object.
+        params (list of int): The object's parameters, the number of 
+                              longitudes and latitudes being the last two.
+        floor (int): The minimal number of longitudes and latitudes.
+
+    Returns:
+        list of list of int: The parameters of each level, from the finest.
+    """
+    levels = [params]
+
+    while (True):
+        p = SURFACES[type].getCoarserParams(levels[-1], floor)
+
+        if (p == levels[-1]):
+            return levels
+        levels.append(p)
+
+def writeLevelsOfDetail(type, params, floor, prefix, check, out, extension, \
+                        keepNormals, objFormat):
+    """ Generates every level of detail of an object and writes them either
+    to their own files or, as a single wavefront file made of one object per
+    level, to the standard output. A line giving the numbers of vertices and
+    faces of each level is displayed on the standard error.
+
+    All levels share the same trigonometric tables.
+
+    Args:
+        type (string): The type of object, "sphere" or "tore".
+        params (list of int): The object's parameters, as given in argv.
+        floor (int): The minimal number of longitudes and latitudes.
+        prefix (string, None): The prefix of the files, "-lodN" and the 
+                               extension being added for level N. None for 
+                               the output stream.
+        check (bool): Whether to also display the report of mesh.printReport 
+                      for each level.
+        out (file): The opened output stream.
+        extension (string): The extension of the files.
+        keepNormals (bool): Whether to write the normals.
+        objFormat (dict): The keyword arguments of writeObj setting the format
+                          of the output, as returned by getObjFormat.
+    """
+    trig = TrigTables()
+    offset = 0
+
+    for noLevel, p in enumerate(getLevelsOfDetail(type, params, floor)):
+        positions, normals, indices = createObject(type, p, trig).getBuffers()
+        sys.stderr.write(MSG_LOD.format(noLevel, SURFACES[type].describeSamples(p), \
+                         len(positions) // 3, len(indices) // 3) + "\n")
+        if (check):
+            printReport(positions, indices, WELD_TOLERANCE, sys.stderr)
+
+        if (not keepNormals):
+            normals = None
+
+        if (prefix != None):
+            filename = "{}-lod{}{}".format(prefix, noLevel, extension)
+            with openObj(filename, "w") as stream:
+                writeObj(stream, positions, normals, indices, **objFormat)
+        else:
+            writeObj(out, positions, normals, indices, "lod{}".format(noLevel), \
+                     offset, **objFormat)
+            offset += len(positions) // 3
+
+def getObjFormat(options):
+    """ Returns the format of the wavefront output set by the options 
+    "--compact[=PRECISION]", as keyword arguments of writeObj.
+
+    Args:
+        options (dict): The options returned by parseOptions.
+    """
+    if ("compact" not in options):
+        return {"quads": False, "precision": None}
+
+    try:
+        precision = int(options.get("compact") or OBJ_PRECISION)
+    except ValueError:
+        precision = 0
+
+    if (precision <= 0):
+        print(ERR_PRECISION)
         sys.exit(0)
 
+    return {"quads": True, "precision": precision}
+
+if __name__ == "__main__":
+    options = parseOptions(["check", "weld", "lod", "output", "workers", \
+                            "compact", "no-normals", "gzip", "preview", \
+                            "float", "float-report", "chordal-report", \
+                            "max-error", "screen-error", "distance", "fov", \
+                            "width"])
+    objFormat = getObjFormat(options)
+    keepNormals = "no-normals" not in options
+
+    # The preview is written to its own file, leaving nothing to compress
+    if ("gzip" in options and "preview" not in options and \
+            ("lod" not in options or "output" not in options)):
+        out = gzipStream(sys.stdout)
     else:
-        params = [int(s) for s in sys.argv if s.isdigit() and int(s) > 0]
+        out = sys.stdout
+
+    if ("lod" in options):
+        try:
+            floor = int(options.get("lod") or LOD_FLOOR)
+        except ValueError:
+            floor = 0
 
-        if (nbArgs - len(params) != 2):
-            print(ERR_PARAM_TYPE)
+        if (floor <= 0):
+            print(ERR_LOD_FLOOR)
             sys.exit(0)
 
-    # instanciating the object
-    if (type == "sphere"):
-        object = Sphere(params[0], params[1], params[2])
+        type, params = getErrorParams(options)
+        writeLevelsOfDetail(type, params, floor, options.get("output"), \
+                            "check" in options, out, \
+                            ".obj.gz" if "gzip" in options else ".obj", \
+                            keepNormals, objFormat)
+
+        if (out != sys.stdout):
+            out.close()
+        sys.exit(0)
+
+    type, params = getErrorParams(options)
+
+    if ("float-report" in options):
+        reportFloatPrecision(type, params, sys.stdout)
+        sys.exit(0)
+
+    if ("chordal-report" in options):
+        reportChordalError(type, params, sys.stdout)
+        sys.exit(0)
+
+    try:
+        floatSize = int(options.get("float") or 64)
+    except ValueError:
+        floatSize = 0
+
+    if (floatSize not in FLOAT_TYPECODES):
+        print(ERR_FLOAT)
+        sys.exit(0)
+
+    if (floatSize == 32 and "compact" not in options):
+        objFormat["precision"] = FLOAT32_PRECISION
+
+    if ("workers" in options or floatSize != 64):
+        try:
+            nbWorkers = int(options.get("workers") or 0) if "workers" in options else 1
+        except ValueError:
+            nbWorkers = 0
+
+        if (nbWorkers <= 0):
+            print(ERR_NB_WORKERS)
+            sys.exit(0)
+
+        buffers = generateBuffers(createObject(type, params, generate=False), \
+                                  nbWorkers, FLOAT_TYPECODES[floatSize])
+    elif (len(options) > 0):
+        buffers = createObject(type, params).getBuffers()
     else:
-        object = Tore(params[0], params[1], params[2], params[3])
+        print(createObject(type, params))
+        sys.exit(0)
 
-    return object
+    positions, normals, indices = buffers
 
-"""Main
-"""
-object = getObject()
-print object
+    if ("check" in options or "weld" in options):
+        try:
+            tolerance = float(options.get("weld") or WELD_TOLERANCE)
+        except ValueError:
+            tolerance = 0
+
+        if (tolerance <= 0):
+            print(ERR_INVALID_TOLERANCE)
+            sys.exit(0)
+
+        if ("check" in options):
+            welded = printReport(positions, indices, tolerance, sys.stderr)
+        else:
+            welded = weldVertices(positions, indices, tolerance)
+
+    if ("weld" in options):
+        weldedNormals = [0.0] * len(welded[0])
+
+        for i, n in reversed(list(enumerate(welded[2]))):
+            weldedNormals[3*n : 3*n+3] = normals[3*i : 3*i+3]
+        positions, normals, indices = welded[0], weldedNormals, welded[1]
+
+    if ("preview" in options):
+        if (options.get("preview") == None):
+            print(ERR_INVALID_FILENAME)
+            sys.exit(0)
+
+        # Imported here, spheroide.py not depending on Pillow otherwise
+        from preview import renderMesh
+        renderMesh(positions, normals, indices).save(options.get("preview"))
+    else:
+        writeObj(out, positions, normals if keepNormals else None, indices, \
+                 **objFormat)
+
+    if (out != sys.stdout):
+        out.close()
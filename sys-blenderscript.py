@@ -4,74 +4,42 @@ UQAM - Winter 2018 - INF5017 - Group 20 - q4-blenderscript.py
 Program called by q4.py to generate an OGG format video of
 a rendered blender animation of a solar system.
 
-    $ blender --background --python q4-blenderscript.py -- [INPUT_FILE] [OUTPUT_FILE]
+    $ blender --background --python q4-blenderscript.py -- [--profile=PROFILE]
+                                  [INPUT_FILE] [OUTPUT_FILE] [FIRST LAST]
 
     INPUT_FILE      The json file containing the information on the
                     solar system to render
     OUTPUT_FILE     The filename for the rendered animation
+    FIRST LAST      The range of frames to render as PNG images, instead of
+                    the whole animation. OUTPUT_FILE is then the prefix of
+                    the images, which are named OUTPUT_FILE0001.png, ...
+    PROFILE         The name of the render profile of solarsystem.py
+                    ("final" by default).
+
+With the single parameter "--worker", the script keeps Blender running and
+renders the jobs read from the standard input, as described in serveJobs.
+
+    $ blender --background --python q4-blenderscript.py -- --worker
 """
 import json
 import sys
 import os
 import bpy
-from math import pi
-
-ERR_NB_PARAMS = "Error : 2 arguments required, {} provided."
-ERR_INV_FILE = "Error : file \"{}\" does not exist."
-ERR_INV_JSON_FILE = "Error : invalid JSON file."
-ERR_GCD = "Error : called gcd with param a or b == 0."
- 
-class SolarSystem(object):
-    """ Class containing the informations on a solar system.
-
-    Attributes:
-        star (Star): The solar system's star.
-        planets (list of Planets): The solar system's planets.
-    """
-    def __init__(self, star, planets):
-        """ Creates an instance of solar system.
-        """
-        self.star = star
-        self.planets = planets   
- 
-class Star(object):
-    """ Class containing the informations on a star.
-
-    Attributes:
-        radius (float): The star's radius.
-        color (int, int, int): The star's RGB colors.
-        location (float, float, float): The star's xyz location.
-    """    
-    def __init__(self, radius, color):
-        """ Creates an instance of star. 
-        """
-        self.radius = radius
-        self.color = color
-        self.location = (0.0, 0.0, 0.0)
-
-class Planet(object):
-    """ Class containing the information on a planet.
-
-    Attributes:
-        radius (float): The planet's radius
-        color (int, int, int): The planet's RGB colors.
-        distance (float): The planet's distance to the star.
-        period (int): The number of frames required for the planet to
-                      complete an orbit around the star.
-        location (float, float, float): The planet's xyz location.
-    """ 
-    def __init__(self, radius, color, distance, period):
-        """ Creates an instance of planet.
-        """
-        self.radius = radius
-        self.color = color
-        self.distance = distance
-        self.period = period
-        self.location = (distance, 0, 0)
-   
-def loadSolarSystem(params):
-    """ Parses the argv parameters and returns the solar system
-    specified in file params[0] if the parameters are valid.
+
+sys.path.append(os.path.dirname(os.path.realpath(__file__)))
+from spheroide import Sphere
+from nbody import loadPositions
+from solarsystem import FRAME_START, FRAME_END, FRAME_RATE, WORKER_PREFIX, \
+                        PROFILE_OPTION, RESOLUTION, loadSolarSystem, \
+                        getBodyPositions, getMaxDistance, getProfile
+
+ERR_NB_PARAMS = "Error : 2 or 4 arguments required, {} provided."
+ERR_FRAME_RANGE = "Error : invalid range of frames, which must be within {} and {}."
+
+WORKER_OPTION = "--worker"
+
+def checkParams(params):
+    """ Verifies the argv parameters, exiting if they are not valid.
     
     Args:
         params (list of string): The argv parameters.
@@ -79,126 +47,326 @@ def loadSolarSystem(params):
     nbParams = len(params)
 
     # Verifying param count
-    if (nbParams != 2):
+    if (nbParams != 2 and nbParams != 4):
         print(ERR_NB_PARAMS.format(nbParams))
         sys.exit(0)
-    
-    file = params[0]
-    cwd = os.path.dirname(os.path.realpath(__file__))
-    solarSystemFile = cwd + "/" + file
-
-    # Fetching json data from file
-    try:
-        jsonData = json.loads(open(solarSystemFile).read())
-    except:
-        print(ERR_INV_FILE.format(file))
-        sys.exit(0)
 
-    # Parsing json file data
-    try:
-        starData = jsonData.get('star')
-        planetsData = jsonData.get('planets')       
-        radius = starData.get('radius')
-        color = starData.get('color')
-        star = Star( radius, color )
-        planets = []
-
-        for p in planetsData:
-            radius = p.get('radius')
-            color = p.get('color')
-            distance = p.get('distance-from-star')         
-            period = p.get('period')
-            planets.append( Planet(radius, color, distance, period) )
-    except:
-        print(ERR_INV_JSON_FILE)     
-        sys.exit(0)
-    
-    return SolarSystem( star, planets )
+    # Verifying the range of frames
+    if (nbParams == 4):
+        try:
+            first, last = int(params[2]), int(params[3])
+        except ValueError:
+            first, last = 0, -1
+
+        if (not FRAME_START <= first <= last <= FRAME_END):
+            print(ERR_FRAME_RANGE.format(FRAME_START, FRAME_END))
+            sys.exit(0)
+
+def popProfile(params):
+    """ Removes the profile option from the argv parameters and returns the
+    name of the profile, None if the option is not given.
+
+    Args:
+        params (list of string): The argv parameters.
+    """
+    name = None
+
+    for p in [p for p in params if p.startswith(PROFILE_OPTION)]:
+        name = p[len(PROFILE_OPTION):]
+        params.remove(p)
+
+    return name
+
+def createSphereMesh(name, nbLon, nbLat):
+    """ Creates a smooth mesh datablock holding a unit sphere generated by
+    spheroide.Sphere, filling its vertices, loops and polygons in bulk 
+    rather than through operators.
+
+    Args:
+        name (string): The name of the mesh.
+        nbLon (int): The number of longitudes.
+        nbLat (int): The number of latitudes.
+    """
+    positions, normals, indices = Sphere(1, nbLon, nbLat, generate=False) \
+                                  .fillBuffers()
+    nbFaces = len(indices) // 3
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(positions) // 3)
+    mesh.vertices.foreach_set("co", positions)
+    mesh.loops.add(len(indices))
+    mesh.loops.foreach_set("vertex_index", indices)
+    mesh.polygons.add(nbFaces)
+    mesh.polygons.foreach_set("loop_start", list(range(0, len(indices), 3)))
+    mesh.polygons.foreach_set("loop_total", [3] * nbFaces)
+    mesh.polygons.foreach_set("use_smooth", [True] * nbFaces)
+    mesh.update(calc_edges=True)
+
+    # A slot for the materials, which are linked to the objects
+    mesh.materials.append(bpy.data.materials.new(name + 'Material'))
+
+    return mesh
+
+def addSphereInstance(name, mesh, material, radius, location):
+    """ Adds to the scene an object sharing a sphere mesh with the other
+    instances (a linked duplicate), scaled to a radius and having its own
+    material.
+
+    Args:
+        name (string): The name of the object.
+        mesh (Mesh): The mesh returned by createSphereMesh.
+        material (Material): The material of the object.
+        radius (float): The radius of the sphere.
+        location (float, float, float): The xyz location of the object.
+    """
+    instance = bpy.data.objects.new(name, mesh)
+    instance.scale = (radius, radius, radius)
+    instance.location = location
+    bpy.context.scene.objects.link(instance)
+    instance.material_slots[0].link = 'OBJECT'
+    instance.material_slots[0].material = material
+
+    return instance
+
+def addBeltCloud(name, belt):
+    """ Adds to the scene an object holding the bodies of a belt as the
+    vertices of a mesh without faces, rendered as halos.
+
+    Args:
+        name (string): The name of the object.
+        belt (Belt): The belt.
+    """
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(belt.count)
+    material = bpy.data.materials.new(name + 'Material')
+    material.type = 'HALO'
+    material.diffuse_color = belt.color
+    material.halo.size = belt.radius
+    mesh.materials.append(material)
+    bpy.context.scene.objects.link(bpy.data.objects.new(name, mesh))
+
+    return mesh
+
+def moveBodies(scene):
+    """ Frame change handler moving every planet and moon to its location
+    for the current frame, as precomputed in bodyPositions, and the bodies
+    of the belts, read from the positions file.
+
+    Args:
+        scene (Scene): The scene whose frame changed.
+    """
+    last = len(bodyPositions) - 1
+    frame = min(max(scene.frame_current - FRAME_START, 0), last)
+    row = bodyPositions[frame]
+
+    for i, body in enumerate(bodyObjects):
+        body.location = row[3*i : 3*i+3]
+
+    for mesh, first, count in beltMeshes:
+        mesh.vertices.foreach_set("co", positions.readFrame(frame, first, count))
+        mesh.update()
     
+def resetScene():
+    """ Removes every object, mesh, material, lamp and camera, as well as 
+    the handler moving the bodies, so that a solar system can be set up in
+    an empty scene.
+    """
+    for collection in [bpy.data.objects, bpy.data.meshes, bpy.data.materials, \
+                       bpy.data.lamps, bpy.data.cameras]:
+        for datablock in list(collection):
+            collection.remove(datablock, do_unlink=True)
+
+    if (moveBodies in bpy.app.handlers.frame_change_pre):
+        bpy.app.handlers.frame_change_pre.remove(moveBodies)
+
+def setupScene(solarSystem, profile):
+    """ Creates the camera, the lights and the bodies of a solar system in
+    an empty scene, and the handler moving the bodies.
+
+    Args:
+        solarSystem (SolarSystem): The solar system.
+        profile (RenderProfile): The render profile, giving the number of
+                                 faces of the spheres.
+    """
+    global bodyObjects, bodyPositions, beltMeshes, positions
+
+    # Creating a black background
+    bpy.context.scene.world.horizon_color = (0, 0, 0)
+
+    # Creating camera
+    d_max = max([getMaxDistance(solarSystem.planets)] + \
+                [b.outer for b in solarSystem.belts])
+    bpy.ops.object.camera_add(view_align=False, location=(0, 0, 3*d_max ), rotation=(0, 0, 0))
+    bpy.context.active_object.name = 'Camera'
+
+    # creating hemi light source
+    bpy.ops.object.lamp_add(type='HEMI', location=(0, 0, 1.5*d_max), rotation=(0,0,0))
+    bpy.context.active_object.name = 'Hemi'
+    bpy.data.lamps['Hemi'].color = solarSystem.star.color
+    bpy.data.lamps['Hemi'].energy = 0.1
+
+    # creating point light source
+    bpy.ops.object.lamp_add(type='POINT', location=(0, 0, 0))
+    bpy.context.active_object.name= 'Point'
+        
+    # Creating the sphere mesh shared by the star and the planets
+    sphereMesh = createSphereMesh('Sphere', profile.nbLon, profile.nbLat)
+
+    # Creating texture, instance for star.
+    starMaterial = bpy.data.materials.new('starMaterial')
+    starMaterial.emit = 100
+    starMaterial.diffuse_color = solarSystem.star.color
+    addSphereInstance('Star', sphereMesh, starMaterial, solarSystem.star.radius, \
+                      solarSystem.star.location)
+            
+    bodyObjects = []
+
+    for i, p in enumerate(solarSystem.planets):
+
+        # Creating textures and instances for planets and their moons
+        planetMaterial = bpy.data.materials.new('planetMaterial{}'.format(i))
+        planetMaterial.diffuse_color = p.color
+        bodyObjects.append( addSphereInstance('Planet{}'.format(i), sphereMesh, \
+                                              planetMaterial, p.radius, p.location) )
+
+        for j, m in enumerate(p.moons):
+            moonMaterial = bpy.data.materials.new('moonMaterial{}-{}'.format(i, j))
+            moonMaterial.diffuse_color = m.color
+            bodyObjects.append( addSphereInstance('Moon{}-{}'.format(i, j), \
+                                                  sphereMesh, moonMaterial, \
+                                                  m.radius, m.location) )
+
+    # Precomputing the orbits of all the bodies for every frame, or reading
+    # their simulated positions, and moving the bodies with a single handler
+    # rather than animating each of them
+    beltMeshes = []
+
+    if (solarSystem.positions != None):
+        positions = loadPositions(solarSystem)
+        bodyPositions = [positions.readFrame(f, 0, len(bodyObjects)) \
+                         for f in range(0, positions.nbFrames)]
+        first = len(bodyObjects)
+
+        for i, b in enumerate(solarSystem.belts):
+            beltMeshes.append( (addBeltCloud('Belt{}'.format(i), b), first, \
+                                b.count) )
+            first += b.count
+    else:
+        bodyPositions = getBodyPositions(solarSystem.planets, \
+                                         list(range(FRAME_START, FRAME_END + 1)))
+    bpy.app.handlers.frame_change_pre.append(moveBodies)
+    moveBodies(bpy.context.scene)
+
+def renderAnimation(output, profile, first=None, last=None):
+    """ Renders the animation of the scene to an OGG video or, if a range of
+    frames is given, renders these frames as lossless PNG images.
+
+    Args:
+        output (string): The filename of the video, or the prefix of the 
+                         images.
+        profile (RenderProfile): The render profile.
+        first (int, None): The first frame to render as an image.
+        last (int, None): The last frame to render as an image.
+    """
+    # Setting up start en end noFrame for a 10 seconds animation 
+    # at 24 frames per seconds
+    bpy.context.scene.frame_start = FRAME_START
+    bpy.context.scene.frame_end = FRAME_END
+
+    # Skipping frames, at a lower frame rate to keep the duration
+    bpy.context.scene.frame_step = profile.step
+    bpy.context.scene.render.fps = FRAME_RATE // profile.step
+
+    # Rendering and saving animation, or a range of lossless frames
+    bpy.context.scene.render.filepath = output
+
+    if (first != None):
+        bpy.context.scene.frame_start = first
+        bpy.context.scene.frame_end = last
+        bpy.context.scene.render.use_file_extension = True
+        bpy.context.scene.render.image_settings.file_format = 'PNG'
+        bpy.context.scene.render.image_settings.color_mode = 'RGB'
+    else:
+        bpy.context.scene.render.use_file_extension = False
+        bpy.context.scene.render.image_settings.file_format = 'FFMPEG'
+        bpy.context.scene.render.ffmpeg.format = 'OGG'
+        bpy.context.scene.render.ffmpeg.gopsize = profile.gopSize
+        bpy.context.scene.render.ffmpeg.constant_rate_factor = profile.quality
+
+    bpy.context.scene.render.resolution_x = RESOLUTION
+    bpy.context.scene.render.resolution_y = RESOLUTION
+    bpy.context.scene.render.resolution_percentage = profile.percentage
+    bpy.context.scene.render.use_antialiasing = profile.antialiasing
+    bpy.context.scene.camera = bpy.data.objects['Camera']
+    bpy.ops.render.render(animation=True)
+
+def sendMessage(message):
+    """ Writes a message of the worker protocol to the standard output, as a
+    line of json following WORKER_PREFIX, Blender writing its own messages
+    to the standard output too.
+
+    Args:
+        message (dict): The message.
+    """
+    sys.stdout.write(WORKER_PREFIX + json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+def sendProgress(scene):
+    """ Render handler sending the number of the frame just written for the
+    current job.
+
+    Args:
+        scene (Scene): The rendered scene.
+    """
+    sendMessage({"id": currentJob, "status": "progress", \
+                 "frame": scene.frame_current})
+
+def serveJobs():
+    """ Renders the jobs read from the standard input until it is closed, 
+    resetting the scene between jobs.
+
+    Each job is a line of json holding its "id", its "input" and "output"
+    files and, optionally, its "profile" and the "first" and "last" frames
+    to render as images.
+    A "ready" message is sent once, then a "progress" message for each frame
+    written and a "done" or "failed" message for each job.
+    """
+    global currentJob
+
+    bpy.app.handlers.render_write.append(sendProgress)
+    sendMessage({"status": "ready"})
+
+    for line in iter(sys.stdin.readline, ""):
+        try:
+            job = json.loads(line)
+            currentJob = job.get("id")
+            params = [job.get("input"), job.get("output")]
+        except (ValueError, AttributeError):
+            continue
+
+        if ("first" in job):
+            params.extend( [str(job.get("first")), str(job.get("last"))] )
+
+        # Errors exit, so that they end the job rather than the worker
+        try:
+            checkParams(params)
+            profile = getProfile(job.get("profile"))
+            resetScene()
+            setupScene(loadSolarSystem(params[0]), profile)
+            renderAnimation(params[1], profile, *[int(p) for p in params[2:]])
+            sendMessage({"id": currentJob, "status": "done", "output": params[1]})
+        except (SystemExit, Exception):
+            sendMessage({"id": currentJob, "status": "failed"})
+
 """ Main
 """
 params = sys.argv[sys.argv.index("--")+1:]
-solarSystem = loadSolarSystem(params)
-
-# Default scene clean-up
-bpy.ops.object.select_all(action='DESELECT')
-bpy.data.objects['Camera'].select = True
-bpy.data.objects['Cube'].select = True
-bpy.data.objects['Lamp'].select = True
-bpy.ops.object.delete()
-        
-# Creating a black background
-bpy.context.scene.world.horizon_color = (0, 0, 0)
-
-# Creating camera
-d_max = max( [p.distance for p in solarSystem.planets] )
-bpy.ops.object.camera_add(view_align=False, location=(0, 0, 3*d_max ), rotation=(0, 0, 0))
-bpy.context.active_object.name = 'Camera'
-
-# creating hemi light source
-bpy.ops.object.lamp_add(type='HEMI', location=(0, 0, 1.5*d_max), rotation=(0,0,0))
-bpy.context.active_object.name = 'Hemi'
-bpy.data.lamps['Hemi'].color = solarSystem.star.color
-bpy.data.lamps['Hemi'].energy = 0.1
-
-# creating point light source
-bpy.ops.object.lamp_add(type='POINT', location=(0, 0, 0))
-bpy.context.active_object.name= 'Point'
-    
-# Creating mesh, texture for star.
-starMaterial = bpy.data.materials.new('starMaterial')
-starMaterial.emit = 100
-starMaterial.diffuse_color = solarSystem.star.color
-bpy.ops.mesh.primitive_uv_sphere_add(size=solarSystem.star.radius, location=(0,0,0))
-bpy.ops.object.shade_smooth()
-bpy.context.active_object.name = 'Star'
-bpy.context.active_object.data.materials.append(starMaterial)
-        
-for i, p in enumerate(solarSystem.planets):
-
-    # Creating meshes and textures for planets
-    planetMaterial = bpy.data.materials.new('planetMaterial{}'.format(i))
-    planetMaterial.diffuse_color = p.color
-    bpy.ops.mesh.primitive_uv_sphere_add(size=p.radius,location=p.location)
-    bpy.ops.object.shade_smooth()
-    bpy.context.active_object.name = 'Planet{}'.format(i)
-    bpy.context.active_object.data.materials.append(planetMaterial)
-
-    # Creating rotating arrows. Defining parenthood relationships
-    bpy.ops.object.empty_add(type='SINGLE_ARROW')
-    bpy.context.active_object.name = 'Arrow{}'.format(i)
-
-    planet = bpy.data.objects['Planet{}'.format(i)]
-    arrow = bpy.data.objects['Arrow{}'.format(i)]
-    planet.parent = arrow        
-    bpy.context.scene.objects.active = bpy.data.objects['Arrow{}'.format(i)]
-
-    # Creating keyframes.
-    bpy.context.scene.frame_set(0)
-    bpy.context.active_object.rotation_euler = (0.0, 0.0, 0.0)
-    bpy.context.active_object.keyframe_insert(data_path="rotation_euler")
-
-    bpy.context.scene.frame_set(p.period)
-    bpy.context.active_object.rotation_euler = (0.0, 0.0, 2*pi)
-    bpy.context.active_object.keyframe_insert(data_path="rotation_euler")
-    bpy.context.active_object.animation_data.action.fcurves[2] \
-        .keyframe_points[0].interpolation = 'LINEAR'
-    bpy.context.active_object.animation_data.action.fcurves[2] \
-        .modifiers.new(type="CYCLES")
-        
-# Setting up start en end noFrame for a 10 seconds animation 
-# at 24 frames per seconds
-bpy.context.scene.frame_start = 1
-bpy.context.scene.frame_end = 240
-
-# Rendering and saving animation
-bpy.context.scene.render.filepath = params[1]
-bpy.context.scene.render.use_file_extension = False
-bpy.context.scene.render.image_settings.file_format = 'FFMPEG'
-bpy.context.scene.render.ffmpeg.format = 'OGG'
-bpy.context.scene.render.ffmpeg.gopsize = 0
-bpy.context.scene.render.ffmpeg.constant_rate_factor = 'LOSSLESS'
-bpy.context.scene.render.resolution_x = 1080
-bpy.context.scene.render.resolution_y = 1080
-bpy.context.scene.camera = bpy.data.objects['Camera']
-bpy.ops.render.render(animation=True)
+
+if (params == [WORKER_OPTION]):
+    serveJobs()
+else:
+    profile = getProfile(popProfile(params))
+    checkParams(params)
+    resetScene()
+    setupScene(loadSolarSystem(params[0]), profile)
+    renderAnimation(params[1], profile, *[int(p) for p in params[2:]])
@@ -0,0 +1,222 @@
+"""
+UQAM - Winter 2018 - INF5071 - Group 20 - sys-preview.py
+
+Program rendering a preview of the animation of a solar system specified in
+a json file, without Blender. Each frame shows the solar system seen from
+above, like the camera of the blender script : the orbits of the planets,
+the star and the planets and moons, as discs lit by the star. The motion of
+a simulated solar system is read from its positions file, the bodies of its
+belts being drawn as points, without the orbits.
+
+    $ python sys-preview.py [--size=SIZE] [--step=STEP] [INPUT_FILE] [OUTPUT_FILE]
+
+    INPUT_FILE      The json file containing the information on the solar
+                    system to preview.
+    OUTPUT_FILE     The animated GIF file to produce or, if its name does not
+                    end with ".gif", the prefix of the PNG images to produce,
+                    which are named OUTPUT_FILE0001.png, ...
+    SIZE            The width and height of the frames, in pixels (256 by
+                    default).
+    STEP            The number of frames between two rendered frames (1 by
+                    default).
+
+author : Alexis Chretien (CHRA25049209)
+"""
+import sys
+from math import sqrt
+from PIL import Image
+from mesh import parseOptions
+from nbody import loadPositions
+from solarsystem import FRAME_START, FRAME_END, FRAME_RATE, loadSolarSystem, \
+                        getBodies, getBodyPositions, getOrbitPositions, \
+                        getMaxDistance
+
+ERR_NB_PARAMS = "Error : 2 arguments required, {} provided."
+ERR_PREVIEW_SIZE = "Error : the size must be an integer strictly greater than 0."
+ERR_STEP = "Error : the step must be an integer strictly greater than 0."
+
+PREVIEW_SIZE = 256
+AMBIENT = 0.15
+VIEW_MARGIN = 1.1
+NB_ORBIT_POINTS = 720
+ORBIT_COLOR = (60, 60, 60)
+BACKGROUND_COLOR = (0, 0, 0)
+
+class FrameBuffer(object):
+    """ Class holding the pixels of a square frame, centered on the star.
+
+    Attributes:
+        size (int): The width and height of the frame, in pixels.
+        scale (float): The number of pixels per unit of distance.
+        pixels (list of (int, int, int)): The RGB colors of the pixels, row
+                                          by row.
+    """
+    def __init__(self, size, halfWidth):
+        """ Creates an instance of frame buffer, showing the square of the
+        xy plane going from -halfWidth to halfWidth along both axes.
+        """
+        self.size = size
+        self.scale = size / (2.0 * halfWidth)
+        self.pixels = [BACKGROUND_COLOR] * (size * size)
+
+    def copy(self):
+        """ Returns a copy of self.
+        """
+        other = FrameBuffer.__new__(FrameBuffer)
+        other.size = self.size
+        other.scale = self.scale
+        other.pixels = list(self.pixels)
+
+        return other
+
+    def toPixel(self, x, y):
+        """ Returns the coordinates in the frame, in pixels, of a point of
+        the xy plane, y going down.
+        """
+        return (self.size / 2.0 + x * self.scale, self.size / 2.0 - y * self.scale)
+
+    def drawPoint(self, x, y, color):
+        """ Colors the pixel containing a point of the xy plane.
+
+        Args:
+            x, y (float): The coordinates of the point.
+            color (int, int, int): The RGB color of the pixel.
+        """
+        px, py = self.toPixel(x, y)
+
+        if (0 <= px < self.size and 0 <= py < self.size):
+            self.pixels[int(py) * self.size + int(px)] = color
+
+    def drawDisc(self, x, y, radius, color, light=None):
+        """ Draws a disc, at least one pixel wide, shaded like a sphere lit
+        by a horizontal light.
+
+        Args:
+            x, y (float): The coordinates of the center of the disc.
+            radius (float): The radius of the disc.
+            color (float, float, float): The RGB color of the disc, from 0 to 1.
+            light (float, float, None): The unit xy direction towards the
+                                        light, None for a uniformly lit disc.
+        """
+        px, py = self.toPixel(x, y)
+        r = max(radius * self.scale, 1.0)
+        left = max(int(px - r), 0)
+        right = min(int(px + r), self.size - 1)
+        top = max(int(py - r), 0)
+        bottom = min(int(py + r), self.size - 1)
+
+        for j in range(top, bottom + 1):
+            dy = (py - j - 0.5) / r
+
+            for i in range(left, right + 1):
+                dx = (i + 0.5 - px) / r
+
+                if (dx*dx + dy*dy > 1):
+                    continue
+
+                if (light != None):
+                    diffuse = max(dx * light[0] + dy * light[1], 0.0)
+                    shade = AMBIENT + (1.0 - AMBIENT) * diffuse
+                else:
+                    shade = 1.0
+
+                self.pixels[j * self.size + i] = \
+                    tuple(min(int(255 * c * shade), 255) for c in color)
+
+    def getImage(self):
+        """ Returns the frame as an image.
+        """
+        image = Image.new("RGB", (self.size, self.size))
+        image.putdata(self.pixels)
+
+        return image
+
+def renderPreview(solarSystem, size, frames):
+    """ Renders frames of the animation of a solar system, seen from above.
+
+    Args:
+        solarSystem (SolarSystem): The solar system.
+        size (int): The width and height of the frames, in pixels.
+        frames (list of int): The frames to render.
+
+    Returns:
+        list of Image: The rendered frames.
+    """
+    planets = solarSystem.planets
+    bodies = getBodies(planets)
+    halfWidth = VIEW_MARGIN * (max([getMaxDistance(planets)] + [b.outer for b \
+                in solarSystem.belts]) + max([b.radius for b in bodies] + \
+                [solarSystem.star.radius])) or 1.0
+    background = FrameBuffer(size, halfWidth)
+
+    # Drawing the orbits of the planets once, on the background
+    if (solarSystem.positions == None):
+        rows = getBodyPositions(planets, frames)
+
+        for p in planets:
+            for x, y in getOrbitPositions(p.distance, NB_ORBIT_POINTS, \
+                                          p.eccentricity, range(0, NB_ORBIT_POINTS)):
+                background.drawPoint(x, y, ORBIT_COLOR)
+    else:
+        positions = loadPositions(solarSystem)
+        rows = (positions.readFrame(f - FRAME_START) for f in frames)
+
+    background.drawDisc(0.0, 0.0, solarSystem.star.radius, solarSystem.star.color)
+    images = []
+
+    for row in rows:
+        frame = background.copy()
+        first = len(bodies)
+
+        for b in solarSystem.belts:
+            color = tuple(min(int(255 * c), 255) for c in b.color)
+
+            for i in range(first, first + b.count):
+                frame.drawPoint(row[3*i], row[3*i+1], color)
+            first += b.count
+
+        for i, b in enumerate(bodies):
+            x, y = row[3*i], row[3*i+1]
+            distance = sqrt(x*x + y*y)
+            light = (-x / distance, -y / distance) if distance > 0 else None
+            frame.drawDisc(x, y, b.radius, b.color, light)
+
+        images.append(frame.getImage())
+
+    return images
+
+""" Main
+"""
+options = parseOptions(["size", "step"])
+
+if (len(sys.argv) != 3):
+    print(ERR_NB_PARAMS.format(len(sys.argv) - 1))
+    sys.exit(0)
+
+try:
+    size = int(options.get("size") or PREVIEW_SIZE)
+except ValueError:
+    size = 0
+
+if (size <= 0):
+    print(ERR_PREVIEW_SIZE)
+    sys.exit(0)
+
+try:
+    step = int(options.get("step") or 1)
+except ValueError:
+    step = 0
+
+if (step <= 0):
+    print(ERR_STEP)
+    sys.exit(0)
+
+frames = list(range(FRAME_START, FRAME_END + 1, step))
+images = renderPreview(loadSolarSystem(sys.argv[1]), size, frames)
+
+if (sys.argv[2].lower().endswith(".gif")):
+    images[0].save(sys.argv[2], save_all=True, append_images=images[1:], \
+                   duration=int(1000.0 * step / FRAME_RATE), loop=0)
+else:
+    for f, image in zip(frames, images):
+        image.save("{}{:04d}.png".format(sys.argv[2], f))
@@ -0,0 +1,70 @@
+"""
+UQAM - Winter 2018 - INF5071 - Group 20 - sys-stubworker.py
+
+Program standing in for the blender script in worker mode, to test sys.py
+without Blender. It follows the same protocol : it reads jobs from the
+standard input, one line of json per job, and writes its messages to the
+standard output, mixed with other lines like Blender's.
+
+Rather than rendering, it verifies the solar system of each job, sends a
+"progress" message for each frame and writes a text file naming the job to
+its output file (to OUTPUT_FILE0001.png, ... for a range of frames).
+
+    $ python sys-stubworker.py
+
+author : Alexis Chretien (CHRA25049209)
+"""
+import json
+import sys
+from solarsystem import FRAME_START, FRAME_END, WORKER_PREFIX, loadSolarSystem, \
+                        getProfile
+
+def sendMessage(message):
+    """ Writes a message of the worker protocol to the standard output.
+
+    Args:
+        message (dict): The message.
+    """
+    sys.stdout.write(WORKER_PREFIX + json.dumps(message) + "\n")
+    sys.stdout.flush()
+
+def renderJob(job):
+    """ Pretends to render a job, writing text files instead of its frames or
+    video.
+
+    Args:
+        job (dict): The job.
+    """
+    loadSolarSystem(job["input"])
+    profile = getProfile(job.get("profile"))
+    first = int(job.get("first", FRAME_START))
+    last = int(job.get("last", FRAME_END))
+
+    for f in [f for f in profile.getFrames() if first <= f <= last]:
+        sys.stdout.write("Fra:{} (stub)\n".format(f))
+
+        if ("first" in job):
+            with open("{}{:04d}.png".format(job["output"], f), "w") as stream:
+                stream.write("stub frame {} of {}\n".format(f, job["input"]))
+        sendMessage({"id": job.get("id"), "status": "progress", "frame": f})
+
+    if ("first" not in job):
+        with open(job["output"], "w") as stream:
+            stream.write("stub animation of {}\n".format(job["input"]))
+
+""" Main
+"""
+sendMessage({"status": "ready"})
+
+for line in iter(sys.stdin.readline, ""):
+    try:
+        job = json.loads(line)
+        id = job.get("id")
+    except (ValueError, AttributeError):
+        continue
+
+    try:
+        renderJob(job)
+        sendMessage({"id": id, "status": "done", "output": job["output"]})
+    except (SystemExit, Exception):
+        sendMessage({"id": id, "status": "failed"})
@@ -3,7 +3,7 @@ UQAM - Winter 2018 - INF5017 - Group 20 - q4.py
 
 Program used to launch the blender script "q4-blenderscript.py",
 which is used to generate an animation of the solar system
-specified in a json file. The produced video file format is OGG. 
+specified in a json file. The produced video file format is OGG.
 
     $ python q4.py [INPUT_FILE] [OUTPUT_FILE]
 
@@ -11,17 +11,502 @@ specified in a json file. The produced video file format is OGG.
                     to render.
     OUTPUT_FILE     The filename for the rendered animation.
 
+The option "--workers" renders the frames with WORKERS concurrent Blender
+processes, each one writing ranges of frames as PNG images to FRAMES_DIR
+(OUTPUT_FILE.frames by default). The frames already rendered are skipped, so
+that an interrupted rendering is resumed, and the frames missing once every
+range is done are rendered again, up to RETRIES times (2 by default). The
+video is then encoded once, with ffmpeg.
+
+    $ python q4.py --workers=WORKERS [--frames=FRAMES_DIR] [--retries=RETRIES]
+                   [INPUT_FILE] [OUTPUT_FILE]
+
+The option "--pool" renders several animations with a pool of POOL
+long-lived Blender processes, which start once and reset their scene between
+animations. The progress of each animation is displayed as its frames are
+written. With the option "--stub", the processes run "sys-stubworker.py"
+instead of Blender, to test the pool.
+
+    $ python q4.py --pool=POOL [--stub] [INPUT_FILE] [OUTPUT_FILE]
+                   [INPUT_FILE OUTPUT_FILE ...]
+
+Every mode accepts the option "--profile", selecting one of the render
+profiles of solarsystem.py : "draft" and "review" render fewer and smaller
+frames, with simpler spheres and a lossy video, to iterate quickly on a
+solar system, while "final" (the default) renders the lossless video. The
+expected cost of the profile is displayed before rendering. With the option
+"--workers", the frames of a "draft" or "review" rendering are written to
+OUTPUT_FILE.PROFILE.frames by default.
+
+Since the animation loops after the least common multiple of the periods of
+the planets and moons, the option "--workers" only renders the frames of the
+first loop, then links the following frames to them before encoding.
+
 author : Alexis Chretien (CHRA25049209)
 date : March 1st, 2018
 """
+import json
+import os
+import shutil
 import subprocess
 import sys
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+from threading import Thread, Lock
+try:
+    from Queue import Queue, Empty
+except ImportError:
+    from queue import Queue, Empty
+from mesh import parseOptions
+from solarsystem import FRAME_START, FRAME_RATE, WORKER_PREFIX, \
+                        PROFILE_OPTION, MSG_LOOP, DEFAULT_PROFILE, \
+                        getProfile, loadSolarSystem, getLoopLength, \
+                        getFrameSources
+
+ERR_NB_PARAMS = "Error : 2 arguments required, {} provided."
+ERR_NB_WORKERS = "Error : the number of workers must be an integer strictly " \
+               + "greater than 0."
+ERR_RETRIES = "Error : the number of retries must be an integer greater than " \
+            + "or equal to 0."
+ERR_FRAMES_MISSING = "Error : {} frames could not be rendered. See the logs in " \
+                   + "\"{}\"."
+ERR_FFMPEG = "Error : ffmpeg could not encode the frames."
+ERR_NB_PARAMS_POOL = "Error : an even number of arguments is required, {} " \
+                   + "provided."
+ERR_POOL = "Error : the size of the pool must be an integer strictly greater " \
+         + "than 0."
+ERR_JOBS_FAILED = "Error : {} animations could not be rendered."
+MSG_RANGE = "Frames {} to {} : {}."
+MSG_JOB_PROGRESS = "Animation {} : frame {} written."
+MSG_JOB_DONE = "Animation {} : done, written to \"{}\"."
+MSG_JOB_FAILED = "Animation {} : failed."
+
+BLENDER_SCRIPT = "sys-blenderscript.py"
+STUB_WORKER = "sys-stubworker.py"
+WORKER_OPTION = "--worker"
+FRAME_PREFIX = "frame-"
+FRAME_NAME = FRAME_PREFIX + "{:04d}.png"
+PNG_END = b"IEND\xaeB`\x82"
+RANGES_PER_WORKER = 4
+MAX_RETRIES = 2
+
+def getBlenderCommand(params, nbThreads=None):
+    """ Returns the command running the blender script in background.
+
+    Args:
+        params (list of string): The parameters of the blender script.
+        nbThreads (int, None): The number of threads Blender may render with,
+                               all the processors' by default.
+    """
+    command = ["blender", "--background"]
+
+    if (nbThreads != None):
+        command.extend( ["--threads", str(nbThreads)] )
+
+    command.extend( ["--python", BLENDER_SCRIPT, "--"] )
+    command.extend( params )
+
+    return command
+
+def isFrameComplete(filename):
+    """ Returns True if a frame was completely written, its PNG file ending
+    with the IEND chunk.
+
+    Args:
+        filename (string): The name of the frame's file.
+    """
+    try:
+        with open(filename, "rb") as stream:
+            stream.seek(0, os.SEEK_END)
+
+            if (stream.tell() < len(PNG_END)):
+                return False
+            stream.seek(-len(PNG_END), os.SEEK_END)
+
+            return stream.read() == PNG_END
+    except IOError:
+        return False
+
+def getMissingFrames(framesDir, frames):
+    """ Returns the frames of the animation not completely rendered yet.
+
+    Args:
+        framesDir (string): The directory of the frames.
+        frames (list of int): The frames to render.
+    """
+    return [f for f in frames \
+            if not isFrameComplete(os.path.join(framesDir, FRAME_NAME.format(f)))]
+
+def splitRanges(frames, nbRanges, step=1):
+    """ Splits frames into ranges of consecutive frames of similar lengths.
+
+    Args:
+        frames (list of int): The frames, in increasing order.
+        nbRanges (int): The number of ranges to aim for. More ranges are
+                        returned if the frames are not consecutive.
+        step (int): The number of frames between two consecutive frames.
+
+    Returns:
+        list of (int, int): The first and last frames of each range.
+    """
+    size = max(1, -(-len(frames) // nbRanges))
+    ranges = []
+
+    for f in frames:
+        if (len(ranges) > 0 and ranges[-1][1] == f - step and \
+                (f - ranges[-1][0]) // step < size):
+            ranges[-1][1] = f
+        else:
+            ranges.append( [f, f] )
+
+    return [tuple(r) for r in ranges]
+
+def renderRange(args):
+    """ Renders a range of frames with a Blender process, logging its output
+    to FRAMES_DIR/range-FIRST-LAST.log.
+
+    Args:
+        args (string, string, int, int, int, string): The json file of the
+            solar system, the directory of the frames, the first and last
+            frames of the range, the number of threads of the process and the
+            name of the render profile.
+
+    Returns:
+        (int, int, bool): The first and last frames of the range and whether
+                          the process succeeded.
+    """
+    inputFile, framesDir, first, last, nbThreads, profileName = args
+    prefix = os.path.join(os.path.abspath(framesDir), FRAME_PREFIX)
+    logName = os.path.join(framesDir, "range-{}-{}.log".format(first, last))
+    command = getBlenderCommand([PROFILE_OPTION + profileName, inputFile, \
+                                 prefix, str(first), str(last)], nbThreads)
+
+    with open(logName, "w") as log:
+        try:
+            code = subprocess.call(command, stdout=log, stderr=subprocess.STDOUT)
+        except OSError:
+            code = -1
+
+    return (first, last, code == 0)
+
+def renderFrames(inputFile, framesDir, nbWorkers, nbRetries, profile, frames):
+    """ Renders the missing frames with concurrent Blender processes, each
+    one rendering a range of frames, then renders again the frames still
+    missing.
+
+    Args:
+        inputFile (string): The json file of the solar system.
+        framesDir (string): The directory of the frames.
+        nbWorkers (int): The number of concurrent processes.
+        nbRetries (int): The number of times the missing frames are rendered
+                         again.
+        profile (RenderProfile): The render profile.
+        frames (list of int): The frames to render, in increasing order.
+
+    Returns:
+        list of int: The frames still missing.
+    """
+    if (not os.path.isdir(framesDir)):
+        os.makedirs(framesDir)
+
+    nbThreads = max(1, cpu_count() // nbWorkers)
+    pool = ThreadPool(nbWorkers)
+
+    for i in range(0, nbRetries + 1):
+        missing = getMissingFrames(framesDir, frames)
+
+        if (len(missing) == 0):
+            break
+
+        tasks = [(inputFile, framesDir, first, last, nbThreads, profile.name) \
+                 for first, last in splitRanges(missing, nbWorkers * \
+                                                RANGES_PER_WORKER, profile.step)]
+
+        for first, last, success in pool.imap_unordered(renderRange, tasks):
+            print(MSG_RANGE.format(first, last, "done" if success else "failed"))
+
+    pool.close()
+    pool.join()
+
+    return getMissingFrames(framesDir, frames)
+
+def repeatFrames(framesDir, frames, sources):
+    """ Creates the frames repeating a previous frame, as hard links to its
+    file or, if the file system does not support them, as copies.
+
+    Args:
+        framesDir (string): The directory of the frames.
+        frames (list of int): The frames of the animation.
+        sources (list of int): The frame repeated by each frame.
+    """
+    for f, source in zip(frames, sources):
+        filename = os.path.join(framesDir, FRAME_NAME.format(f))
+
+        if (f == source or isFrameComplete(filename)):
+            continue
+
+        if (os.path.exists(filename)):
+            os.remove(filename)
+        sourceName = os.path.join(framesDir, FRAME_NAME.format(source))
+
+        try:
+            os.link(sourceName, filename)
+        except (AttributeError, OSError):
+            shutil.copyfile(sourceName, filename)
+
+def encodeFrames(framesDir, outputFile, profile):
+    """ Encodes the frames of the animation into an OGG video, with ffmpeg.
+
+    Args:
+        framesDir (string): The directory of the frames.
+        outputFile (string): The filename of the video.
+        profile (RenderProfile): The render profile.
+
+    Returns:
+        bool: Whether the encoding succeeded.
+    """
+    command = ["ffmpeg", "-y", "-loglevel", "error", \
+               "-framerate", str(FRAME_RATE // profile.step)]
+
+    # The frames are not numbered consecutively when some are skipped
+    if (profile.step == 1):
+        command.extend( ["-start_number", str(FRAME_START), "-i", \
+                         os.path.join(framesDir, FRAME_PREFIX + "%04d.png")] )
+    else:
+        command.extend( ["-pattern_type", "glob", "-i", \
+                         os.path.join(framesDir, FRAME_PREFIX + "*.png")] )
+
+    command.extend( ["-c:v", "libtheora", "-q:v", str(profile.videoQuality), \
+                     outputFile] )
+
+    try:
+        return subprocess.call(command) == 0
+    except OSError:
+        return False
+
+class Worker(object):
+    """ Class driving a long-lived rendering process, which renders the jobs
+    written to its standard input and answers with messages, as described in
+    the blender script's serveJobs.
+
+    Attributes:
+        command (list of string): The command starting the process.
+        process (Popen): The running process.
+    """
+    def __init__(self, command):
+        """ Creates an instance of worker and starts its process.
+        """
+        self.command = command
+        self.start()
+
+    def start(self):
+        """ Starts the process and waits until it is ready.
+        """
+        self.process = subprocess.Popen(self.command, stdin=subprocess.PIPE, \
+                                        stdout=subprocess.PIPE, \
+                                        universal_newlines=True)
+        self.readMessage()
+
+    def readMessage(self):
+        """ Returns the next message of the process, skipping the other lines
+        of its output. Returns None if the process exited.
+        """
+        for line in iter(self.process.stdout.readline, ""):
+            if (line.startswith(WORKER_PREFIX)):
+                return json.loads(line[len(WORKER_PREFIX):])
+
+        return None
+
+    def render(self, job):
+        """ Sends a job to the process and yields its messages, up to the
+        "done" or "failed" one. The process is restarted if it exits during
+        the job, which then fails.
+
+        Args:
+            job (dict): The job, having an "id", an "input" and an "output".
+        """
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except (IOError, OSError):
+            pass
+
+        while (True):
+            message = self.readMessage()
+
+            if (message == None):
+                self.process.wait()
+                self.start()
+                yield {"id": job["id"], "status": "failed"}
+                return
+
+            yield message
+
+            if (message.get("status") in ("done", "failed")):
+                return
+
+    def stop(self):
+        """ Closes the standard input of the process and waits for it to exit.
+        """
+        self.process.stdin.close()
+        self.process.wait()
+
+def serveQueue(command, jobs, lock, failed):
+    """ Renders the jobs of a queue with a worker, until the queue is empty,
+    displaying their progress.
+
+    Args:
+        command (list of string): The command starting the worker's process.
+        jobs (Queue): The jobs.
+        lock (Lock): The lock shared by the threads displaying messages.
+        failed (list of int): The ids of the failed jobs, to add to.
+    """
+    worker = Worker(command)
+
+    while (True):
+        try:
+            job = jobs.get_nowait()
+        except Empty:
+            break
+
+        for message in worker.render(job):
+            with lock:
+                if (message.get("status") == "progress"):
+                    print(MSG_JOB_PROGRESS.format(job["id"], message.get("frame")))
+                elif (message.get("status") == "done"):
+                    print(MSG_JOB_DONE.format(job["id"], message.get("output")))
+                else:
+                    print(MSG_JOB_FAILED.format(job["id"]))
+                    failed.append(job["id"])
+
+    worker.stop()
+
+def renderJobs(command, jobs, poolSize):
+    """ Renders jobs with a pool of workers, each one taking the next job in
+    the queue once done with the previous one.
+
+    Args:
+        command (list of string): The command starting a worker's process.
+        jobs (list of dict): The jobs.
+        poolSize (int): The number of workers.
+
+    Returns:
+        list of int: The ids of the failed jobs.
+    """
+    queue = Queue()
+    lock = Lock()
+    failed = []
+
+    for job in jobs:
+        queue.put(job)
+
+    threads = [Thread(target=serveQueue, args=(command, queue, lock, failed)) \
+               for i in range(0, min(poolSize, len(jobs)))]
+
+    for t in threads:
+        t.start()
+
+    for t in threads:
+        t.join()
+
+    return failed
+
+""" Main
+"""
+options = parseOptions(["workers", "frames", "retries", "pool", "stub", \
+                        "profile"])
+profile = getProfile(options.get("profile"))
+
+if ("pool" in options):
+    nbArgs = len(sys.argv) - 1
+
+    if (nbArgs == 0 or nbArgs % 2 != 0):
+        print(ERR_NB_PARAMS_POOL.format(nbArgs))
+        sys.exit(0)
+
+    try:
+        poolSize = int(options.get("pool") or 0)
+    except ValueError:
+        poolSize = 0
+
+    if (poolSize <= 0):
+        print(ERR_POOL)
+        sys.exit(0)
+
+    if ("stub" in options):
+        command = [sys.executable, STUB_WORKER]
+    else:
+        command = getBlenderCommand([WORKER_OPTION])
+
+    print(profile)
+    jobs = [{"id": i // 2, "input": sys.argv[i], "output": sys.argv[i+1], \
+             "profile": profile.name} for i in range(1, len(sys.argv), 2)]
+    failed = renderJobs(command, jobs, poolSize)
+
+    if (len(failed) > 0):
+        print(ERR_JOBS_FAILED.format(len(failed)))
+    sys.exit(0)
+
+if ("workers" not in options):
+    print(profile)
+    subprocess.call( getBlenderCommand([PROFILE_OPTION + profile.name] + \
+                                       sys.argv[1:]) )
+    sys.exit(0)
+
+if (len(sys.argv) != 3):
+    print(ERR_NB_PARAMS.format(len(sys.argv) - 1))
+    sys.exit(0)
+
+try:
+    nbWorkers = int(options.get("workers") or 0)
+except ValueError:
+    nbWorkers = 0
+
+if (nbWorkers <= 0):
+    print(ERR_NB_WORKERS)
+    sys.exit(0)
+
+try:
+    nbRetries = int(options.get("retries") or MAX_RETRIES)
+except ValueError:
+    nbRetries = -1
+
+if (nbRetries < 0):
+    print(ERR_RETRIES)
+    sys.exit(0)
+
+if (profile.name == DEFAULT_PROFILE):
+    framesDir = options.get("frames") or sys.argv[2] + ".frames"
+else:
+    framesDir = options.get("frames") or \
+                "{}.{}.frames".format(sys.argv[2], profile.name)
+
+print(profile)
+frames = profile.getFrames()
+solarSystem = loadSolarSystem(sys.argv[1])
+
+# A simulated solar system does not loop
+if (solarSystem.positions == None):
+    loopLength = getLoopLength(solarSystem.planets)
+else:
+    loopLength = None
+
+sources = getFrameSources(frames, loopLength)
+uniqueFrames = sorted(set(sources))
+
+if (len(uniqueFrames) < len(frames)):
+    print(MSG_LOOP.format(loopLength, len(uniqueFrames), len(frames), \
+                          1.0 - float(len(uniqueFrames)) / len(frames)))
+
+missing = renderFrames(sys.argv[1], framesDir, nbWorkers, nbRetries, profile, \
+                       uniqueFrames)
 
-command = ["blender"]
-params = ["--background", "--python", "sys-blenderscript.py", "--"]
+if (len(missing) > 0):
+    print(ERR_FRAMES_MISSING.format(len(missing), framesDir))
+    sys.exit(0)
 
-if (len(sys.argv) > 1):
-    params.extend( sys.argv[1:] )
+repeatFrames(framesDir, frames, sources)
 
-command.extend( params )
-subprocess.call( command )
+if (not encodeFrames(framesDir, sys.argv[2], profile)):
+    print(ERR_FFMPEG)
+    sys.exit(0)